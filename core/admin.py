@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import Device, SensorReading
+from .models import DayRollup, Device, HourRollup, MinuteRollup, SensorReading
 
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'device_uuid', 'status', 'battery_level', 'created_at')
+    list_display = ('name', 'device_uuid', 'status', 'battery_level', 'last_seen', 'created_at')
     list_filter = ('status',)
     search_fields = ('name', 'device_uuid')
 
@@ -11,4 +11,25 @@ class DeviceAdmin(admin.ModelAdmin):
 class SensorReadingAdmin(admin.ModelAdmin):
     list_display = ('device', 'timestamp', 'air_temperature', 'soil_moisture', 'soil_ph')
     list_filter = ('device',)
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    list_select_related = ('device',)
+    # Browse history by date through the rollup admins; counting or grouping
+    # the raw table does not scale
+    show_full_result_count = False
+
+class ReadingRollupAdmin(admin.ModelAdmin):
+    list_display = ('device', 'bucket', 'count', 'air_temperature_mean', 'soil_moisture_mean', 'rainfall_sum')
+    list_filter = ('device',)
+    list_select_related = ('device',)
+    date_hierarchy = 'bucket'
+
+    @admin.display(description='Air temperature (mean)')
+    def air_temperature_mean(self, obj):
+        return obj.mean('air_temperature')
+
+    @admin.display(description='Soil moisture (mean)')
+    def soil_moisture_mean(self, obj):
+        return obj.mean('soil_moisture')
+
+admin.site.register(MinuteRollup, ReadingRollupAdmin)
+admin.site.register(HourRollup, ReadingRollupAdmin)
+admin.site.register(DayRollup, ReadingRollupAdmin)
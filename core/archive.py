@@ -0,0 +1,258 @@
+"""
+Archival of old sensor readings to compressed columnar files.
+
+Readings older than the retention period are moved out of the database
+into one compressed NumPy archive (``.npz``) per device per month, stored
+under ``SENSOR_ARCHIVE_DIR/<device pk>/<YYYY-MM>.npz``. Each file holds
+one array per column:
+
+* ``id`` and ``timestamp`` (int64, microseconds since the Unix epoch, UTC)
+* one float64 array per numeric sensor field, with NaN for missing values
+* ``wind_direction`` as fixed-width text, empty for missing values
+
+Rows are only deleted from the database after their archive file has been
+written, and they are deleted in small primary-key chunks so the table is
+never locked for long. The reader functions below let history and export
+code treat archived months and live rows as one stream.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SensorReading
+
+NUMERIC_FIELDS = (
+    'air_temperature',
+    'air_humidity',
+    'soil_moisture',
+    'soil_ph',
+    'wind_speed',
+    'nitrogen',
+    'phosphorus',
+    'potassium',
+    'rainfall',
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_WIND_DTYPE = '<U50'
+
+
+def archive_dir():
+    """Root directory of the reading archive"""
+    return Path(getattr(settings, 'SENSOR_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def archive_path(device_id, year, month):
+    """Path of the archive file for one device and month"""
+    return archive_dir() / str(device_id) / f'{year:04d}-{month:02d}.npz'
+
+
+def month_start(moment):
+    """Start of the local calendar month containing ``moment``"""
+    return timezone.localtime(moment).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    """Start of the local calendar month following ``start``"""
+    return month_start(start.replace(day=28) + timedelta(days=4))
+
+
+def _to_micros(moment):
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(micros):
+    return _EPOCH + timedelta(microseconds=int(micros))
+
+
+def _columns_from_rows(rows):
+    """Build archive columns from ``values_list`` rows (id, timestamp, fields..., wind)"""
+    count = len(rows)
+    columns = {
+        'id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        'timestamp': np.fromiter((_to_micros(row[1]) for row in rows), dtype=np.int64, count=count),
+    }
+    for offset, field in enumerate(NUMERIC_FIELDS, start=2):
+        columns[field] = np.fromiter(
+            (np.nan if row[offset] is None else row[offset] for row in rows),
+            dtype=np.float64, count=count,
+        )
+    columns['wind_direction'] = np.array([row[-1] or '' for row in rows], dtype=_WIND_DTYPE)
+    return columns
+
+
+def load_columns(path):
+    """Load all columns of an archive file"""
+    with np.load(path, allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+def _write_columns(path, columns):
+    """Write archive columns atomically, replacing any existing file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _merge_columns(existing, new):
+    """Combine two column sets, dropping duplicate ids and sorting by time"""
+    merged = {name: np.concatenate([existing[name], new[name]]) for name in new}
+    _, unique = np.unique(merged['id'], return_index=True)
+    order = unique[np.argsort(merged['timestamp'][unique], kind='stable')]
+    return {name: column[order] for name, column in merged.items()}
+
+
+def archive_month(device_id, start, end, chunk_size=5000):
+    """
+    Move one device's readings in ``[start, end)`` into its monthly archive.
+
+    ``start`` and ``end`` must fall within the same local month. Rows are
+    read in keyset-paginated chunks straight into column arrays, so memory
+    holds the compact columns rather than the Python rows. Returns the
+    number of readings archived.
+    """
+    readings = (
+        SensorReading.objects.filter(device_id=device_id, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp', 'id')
+        .values_list('id', 'timestamp', *NUMERIC_FIELDS, 'wind_direction')
+    )
+    chunks = []
+    chunk = list(readings[:chunk_size])
+    while chunk:
+        chunks.append(_columns_from_rows(chunk))
+        if len(chunk) < chunk_size:
+            break
+        last_id, last_timestamp = chunk[-1][0], chunk[-1][1]
+        chunk = list(readings.filter(
+            Q(timestamp__gt=last_timestamp) | Q(timestamp=last_timestamp, id__gt=last_id)
+        )[:chunk_size])
+    if not chunks:
+        return 0
+
+    local_start = timezone.localtime(start)
+    path = archive_path(device_id, local_start.year, local_start.month)
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    ids = columns['id']
+    if path.exists():
+        columns = _merge_columns(load_columns(path), columns)
+    _write_columns(path, columns)
+
+    # The file is durable; now remove the rows in short primary-key chunks
+    for i in range(0, len(ids), chunk_size):
+        SensorReading.objects.filter(pk__in=ids[i:i + chunk_size].tolist()).delete()
+    return len(ids)
+
+
+def archive_readings(cutoff, device_ids=None, chunk_size=5000):
+    """
+    Archive every reading older than ``cutoff``, month by month.
+
+    Yields ``(device_id, month_start, archived_count)`` for each month
+    processed, so callers can report progress.
+    """
+    readings = SensorReading.objects.filter(timestamp__lt=cutoff)
+    if device_ids is not None:
+        readings = readings.filter(device_id__in=device_ids)
+
+    for device_id in readings.order_by().values_list('device_id', flat=True).distinct():
+        oldest = readings.filter(device_id=device_id).order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            continue
+        start = month_start(oldest)
+        while start < cutoff:
+            end = min(next_month(start), cutoff)
+            yield device_id, start, archive_month(device_id, start, end, chunk_size=chunk_size)
+            start = next_month(start)
+
+
+def archived_months(device_id):
+    """Sorted (year, month) pairs that have an archive file for the device"""
+    months = []
+    for path in (archive_dir() / str(device_id)).glob('*.npz'):
+        try:
+            year, month = path.stem.split('-')
+            months.append((int(year), int(month)))
+        except ValueError:
+            continue
+    return sorted(months)
+
+
+def _rows_from_columns(columns, mask=None):
+    indexes = range(len(columns['id'])) if mask is None else np.flatnonzero(mask)
+    for i in indexes:
+        row = {
+            'id': int(columns['id'][i]),
+            'timestamp': _from_micros(columns['timestamp'][i]),
+        }
+        for field in NUMERIC_FIELDS:
+            value = columns[field][i]
+            row[field] = None if np.isnan(value) else float(value)
+        row['wind_direction'] = str(columns['wind_direction'][i]) or None
+        yield row
+
+
+def iter_archived_readings(device_id, start=None, end=None, reverse=False):
+    """Yield archived readings of a device in ``[start, end)`` as dicts, oldest first"""
+    months = archived_months(device_id)
+    if reverse:
+        months.reverse()
+
+    for year, month in months:
+        first = timezone.make_aware(datetime(year, month, 1))
+        if (end is not None and first >= end) or (start is not None and next_month(first) <= start):
+            continue
+
+        columns = load_columns(archive_path(device_id, year, month))
+        mask = np.ones(len(columns['id']), dtype=bool)
+        if start is not None:
+            mask &= columns['timestamp'] >= _to_micros(start)
+        if end is not None:
+            mask &= columns['timestamp'] < _to_micros(end)
+        rows = _rows_from_columns(columns, mask)
+        yield from (reversed(list(rows)) if reverse else rows)
+
+
+def iter_readings(device_id, start=None, end=None, chunk_size=2000):
+    """
+    Yield a device's readings in ``[start, end)`` as dicts, oldest first,
+    reading archived months from disk and the rest from the database.
+
+    Database rows are fetched in keyset-paginated chunks of ``chunk_size``
+    so memory stays bounded even on backends (MySQL) whose drivers buffer
+    whole result sets.
+    """
+    yield from iter_archived_readings(device_id, start, end)
+
+    readings = SensorReading.objects.filter(device_id=device_id)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lt=end)
+    readings = readings.order_by('timestamp', 'id').values(
+        'id', 'timestamp', *NUMERIC_FIELDS, 'wind_direction'
+    )
+
+    chunk = list(readings[:chunk_size])
+    while chunk:
+        yield from chunk
+        if len(chunk) < chunk_size:
+            break
+        last = chunk[-1]
+        chunk = list(readings.filter(
+            Q(timestamp__gt=last['timestamp']) | Q(timestamp=last['timestamp'], id__gt=last['id'])
+        )[:chunk_size])
@@ -0,0 +1,324 @@
+"""
+Repeatable performance benchmarks for the WebSocket consumers and views.
+
+Run with ``python manage.py benchmark_suite --settings glycine.settings.benchmark``,
+which uses SQLite and the in-memory channel layer so no MySQL, Redis or
+network is needed. Every benchmark repeats one operation against a
+throwaway test database and reports throughput, latency percentiles and
+database queries per operation:
+
+    device.connect          a device opens its socket and is greeted
+    device.sensor_data      one reading sent and acknowledged
+    device.sensor_batch     BATCH_SIZE replayed readings in one message
+    dashboard.connect       a browser opens the dashboard socket
+    dashboard.devices_data  get_dashboard_data round trip
+    dashboard.fanout        one reading delivered to FANOUT_CLIENTS subscribed dashboards
+    view.dashboard          GET /dashboard
+    view.soysmart_ai        one leaf photo classified (skipped without TensorFlow)
+
+Results are compared against a stored baseline with ``compare()``.
+"""
+import io
+import platform
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from . import inference, ingest, presence
+from .models import Device, SensorReading
+from .stats import percentile
+
+DEVICES = 20
+READINGS_PER_DEVICE = 200
+BATCH_SIZE = 50
+FANOUT_CLIENTS = 20
+
+ASYNC_BENCHMARKS = ['device.connect', 'device.sensor_data', 'device.sensor_batch',
+                    'dashboard.connect', 'dashboard.devices_data', 'dashboard.fanout']
+VIEW_BENCHMARKS = ['view.dashboard', 'view.soysmart_ai']
+BENCHMARKS = ASYNC_BENCHMARKS + VIEW_BENCHMARKS
+
+
+class Skipped(Exception):
+    """Raised by a benchmark that cannot run in this environment"""
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries run on a connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Recorder:
+    """Latency of each operation and the queries run while it was in progress"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.latencies = []
+        self.queries = 0
+        self.started = None
+        self.finished = None
+
+    @contextmanager
+    def operation(self):
+        queries = self.counter.count
+        started = time.perf_counter()
+        if self.started is None:
+            self.started = started
+        yield
+        self.finished = time.perf_counter()
+        self.latencies.append(self.finished - started)
+        self.queries += self.counter.count - queries
+
+    def result(self):
+        latencies = sorted(self.latencies)
+        return {
+            'iterations': len(latencies),
+            'ops_per_second': round(len(latencies) / (self.finished - self.started), 2),
+            'mean_ms': round(1000 * statistics.fmean(latencies), 3),
+            'p50_ms': round(1000 * percentile(latencies, 0.50), 3),
+            'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+            'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+            'queries_per_op': round(self.queries / len(latencies), 2),
+        }
+
+
+def seed(count=DEVICES, readings=READINGS_PER_DEVICE):
+    """Devices with a history of readings, written through the normal ingest path"""
+    now = timezone.now()
+    devices = Device.objects.bulk_create([
+        Device(name=f'Benchmark {i}', device_uuid=f'bench-{i:03d}') for i in range(max(count, 3))
+    ])
+    rng = np.random.default_rng(0)
+    for device in devices:
+        temperatures = 28 + np.cumsum(rng.normal(0, 0.2, readings))
+        ingest.bulk_insert_readings([
+            (SensorReading(device=device, timestamp=now - timedelta(minutes=readings - i),
+                           air_temperature=float(t), soil_moisture=60.0), 90)
+            for i, t in enumerate(temperatures)
+        ])
+    return devices
+
+
+def sensor_data(i):
+    return {'air_temperature': 28 + i % 7 * 0.1, 'air_humidity': 70.0, 'soil_moisture': 60.0, 'soil_ph': 6.5,
+            'wind_speed': 3.0, 'wind_direction': 'Utara', 'nitrogen': 150, 'phosphorus': 90,
+            'potassium': 200, 'rainfall': 0.0, 'battery_level': 90}
+
+
+def websocket_application():
+    import glycine.routing
+
+    return URLRouter(glycine.routing.websocket_urlpatterns)
+
+
+async def receive_type(communicator, message_type, timeout=10):
+    """Receive messages until one of ``message_type`` arrives"""
+    while True:
+        message = await communicator.receive_json_from(timeout=timeout)
+        if message.get('type') == message_type:
+            return message
+
+
+async def open_device(application, device):
+    communicator = WebsocketCommunicator(application, f'/ws/device/{device.device_uuid}/')
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError(f'Device {device.device_uuid} was rejected')
+    await receive_type(communicator, 'connection_established')
+    return communicator
+
+
+async def open_dashboard(application, subscribe=None):
+    communicator = WebsocketCommunicator(application, '/ws/dashboard/')
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError('Dashboard connection was rejected')
+    await receive_type(communicator, 'online_devices')
+    if subscribe:
+        await communicator.send_json_to({'type': 'subscribe', 'devices': [device.device_uuid for device in subscribe]})
+        await receive_type(communicator, 'subscriptions')
+    return communicator
+
+
+async def run_async(names, devices, iterations, recorders):
+    """Run the consumer benchmarks on one event loop"""
+    application = websocket_application()
+
+    if 'device.connect' in names:
+        recorder = recorders['device.connect']
+        for i in range(iterations):
+            with recorder.operation():
+                communicator = await open_device(application, devices[i % len(devices)])
+            await communicator.disconnect()
+
+    if 'device.sensor_data' in names:
+        recorder = recorders['device.sensor_data']
+        communicator = await open_device(application, devices[0])
+        for i in range(iterations):
+            with recorder.operation():
+                await communicator.send_json_to({'type': 'sensor_data', 'data': sensor_data(i)})
+                await receive_type(communicator, 'data_received')
+        await communicator.disconnect()
+
+    if 'device.sensor_batch' in names:
+        recorder = recorders['device.sensor_batch']
+        communicator = await open_device(application, devices[1])
+        start = timezone.now() - timedelta(seconds=iterations * BATCH_SIZE + 60)
+        for i in range(iterations):
+            readings = [
+                {'timestamp': (start + timedelta(seconds=i * BATCH_SIZE + j)).isoformat(), 'data': sensor_data(j)}
+                for j in range(BATCH_SIZE)
+            ]
+            with recorder.operation():
+                await communicator.send_json_to({'type': 'sensor_batch', 'readings': readings})
+                await receive_type(communicator, 'batch_received')
+        await communicator.disconnect()
+
+    if 'dashboard.connect' in names:
+        recorder = recorders['dashboard.connect']
+        for _ in range(iterations):
+            with recorder.operation():
+                communicator = await open_dashboard(application)
+            await communicator.disconnect()
+
+    if 'dashboard.devices_data' in names:
+        recorder = recorders['dashboard.devices_data']
+        communicator = await open_dashboard(application)
+        for _ in range(iterations):
+            with recorder.operation():
+                await communicator.send_json_to({'type': 'get_dashboard_data'})
+                await receive_type(communicator, 'devices_data')
+        await communicator.disconnect()
+
+    if 'dashboard.fanout' in names:
+        recorder = recorders['dashboard.fanout']
+        dashboards = [await open_dashboard(application, subscribe=[devices[2]]) for _ in range(FANOUT_CLIENTS)]
+        communicator = await open_device(application, devices[2])
+        for i in range(iterations):
+            with recorder.operation():
+                await communicator.send_json_to({'type': 'sensor_data', 'data': sensor_data(i)})
+                for dashboard in dashboards:
+                    await receive_type(dashboard, 'sensor_update')
+            await receive_type(communicator, 'data_received')
+        await communicator.disconnect()
+        for dashboard in dashboards:
+            await dashboard.disconnect()
+
+
+def leaf_photos(count):
+    """Distinct JPEG uploads, so every request misses the prediction cache"""
+    from PIL import Image
+
+    rng = np.random.default_rng(1)
+    photos = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)).save(buffer, 'JPEG', quality=85)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def run_views(names, iterations, recorders):
+    client = Client()
+
+    if 'view.dashboard' in names:
+        recorder = recorders['view.dashboard']
+        for _ in range(iterations):
+            with recorder.operation():
+                response = client.get(reverse('dashboard'))
+            if response.status_code != 200:
+                raise RuntimeError(f'/dashboard answered {response.status_code}')
+
+    if 'view.soysmart_ai' in names:
+        try:
+            inference.get_scheduler()
+        except Exception as e:
+            raise Skipped(f'model unavailable: {e}')
+        recorder = recorders['view.soysmart_ai']
+        for photo in leaf_photos(iterations):
+            upload = io.BytesIO(photo)
+            upload.name = 'leaf.jpg'
+            with recorder.operation():
+                response = client.post(reverse('soysmart-ai'), {'image': upload},
+                                       headers={'X-Requested-With': 'XMLHttpRequest'})
+            if response.status_code != 200:
+                raise RuntimeError(f'/soysmart-ai answered {response.status_code}: {response.content[:200]}')
+
+
+def run(names=BENCHMARKS, iterations=200, devices=DEVICES, readings=READINGS_PER_DEVICE):
+    """
+    Run the selected benchmarks against the current (test) database.
+
+    Consumer code reaches the database through ``database_sync_to_async``,
+    which runs on this thread while ``async_to_sync`` waits, so one query
+    counter on this thread's connection sees every query.
+    """
+    devices = seed(devices, readings)
+    counter = QueryCounter()
+    recorders = {name: Recorder(counter) for name in names}
+    skipped = {}
+
+    with connection.execute_wrapper(counter):
+        if set(names) & set(ASYNC_BENCHMARKS):
+            async_to_sync(run_async)(names, devices, iterations, recorders)
+        try:
+            run_views(names, iterations, recorders)
+        except Skipped as e:
+            skipped['view.soysmart_ai'] = str(e)
+    # Write presence changes now, while the test database still exists
+    presence.get_tracker().flush_sync()
+
+    results = {name: recorder.result() for name, recorder in recorders.items() if recorder.latencies}
+    return {
+        'environment': environment(),
+        'iterations': iterations,
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'database': connection.vendor,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def compare(baseline, current, tolerance=0.25):
+    """
+    Differences between two runs, as ``(name, field, before, after, regressed)`` rows.
+
+    Latency may grow by ``tolerance`` (a fraction) before it is reported as
+    a regression; any increase in queries per operation is one.
+    """
+    rows = []
+    for name, after in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        for field in ('p50_ms', 'p95_ms'):
+            rows.append((name, field, before[field], after[field], after[field] > before[field] * (1 + tolerance)))
+        rows.append((name, 'queries_per_op', before['queries_per_op'], after['queries_per_op'],
+                     after['queries_per_op'] > before['queries_per_op']))
+    return rows
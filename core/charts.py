@@ -0,0 +1,137 @@
+"""
+Time-range chart series for the chart API.
+
+A request is served from the finest source whose row count for the range
+stays within ``CHART_MAX_SOURCE_ROWS``: raw readings (database and
+archive), then minute, hour or day rollups. Each requested field is then
+downsampled to the point budget with ``core.downsample``, so the response
+size is bounded however long the range is. Raw loads are also capped at
+``CHART_MAX_SOURCE_ROWS`` rows in case the estimate was too low.
+"""
+from datetime import datetime, time
+from itertools import islice
+
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import archive, downsample, rollups
+from .models import DayRollup, SensorReading
+
+RAW = 'raw'
+
+# Bucket length of each rollup resolution, finest first
+_BUCKET_SECONDS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+_DECIMALS = 4
+
+
+def parse_moment(value):
+    """Parse a date or datetime as an aware local datetime, or raise ValueError"""
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValueError(f'Invalid date or datetime: {value}')
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def estimate_readings(device, start, end):
+    """Approximate number of raw readings of ``device`` in ``[start, end)``, from the day rollups"""
+    total = DayRollup.objects.filter(
+        device=device,
+        bucket__gte=rollups.bucket_start(start, 'day'),
+        bucket__lt=end,
+    ).aggregate(total=Sum('count'))['total']
+    return total or 0
+
+
+def count_readings(device, start, end, limit):
+    """Number of database readings of ``device`` in ``[start, end)``, counting no further than ``limit``"""
+    return SensorReading.objects.filter(
+        device=device, timestamp__gte=start, timestamp__lt=end,
+    ).values('pk')[:limit].count()
+
+
+def choose_source(device, start, end, max_rows):
+    """Finest source that covers ``[start, end)`` with at most ``max_rows`` rows"""
+    estimate = estimate_readings(device, start, end)
+    if not estimate:
+        # No day rollups (not built yet, or built with --no-rollups): count instead
+        estimate = count_readings(device, start, end, max_rows + 1)
+    if estimate <= max_rows:
+        return RAW
+    span = (end - start).total_seconds()
+    for resolution, seconds in _BUCKET_SECONDS.items():
+        if span / seconds <= max_rows:
+            return resolution
+    return 'day'
+
+
+def load_columns(device, source, start, end, fields, max_rows=None):
+    """Epoch-second timestamps and one float array per field, oldest first"""
+    if source == RAW:
+        rows = list(islice(archive.iter_readings(device.pk, start, end), max_rows))
+        times = np.fromiter((row['timestamp'].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+        columns = {
+            field: np.fromiter(
+                (np.nan if row[field] is None else row[field] for row in rows),
+                dtype=np.float64, count=len(rows),
+            )
+            for field in fields
+        }
+        return times, columns
+
+    # Rollups store sums and counts; the bucket mean is computed column-wise
+    model = rollups.RESOLUTIONS[source]
+    names = [f'{field}_{stat}' for field in fields for stat in ('sum', 'count')]
+    rows = list(model.objects.filter(
+        device=device,
+        bucket__gte=rollups.bucket_start(start, source),
+        bucket__lt=end,
+    ).order_by('bucket').values_list('bucket', *names))
+
+    times = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(names))
+    columns = {}
+    for i, field in enumerate(fields):
+        sums, counts = values[:, 2 * i], values[:, 2 * i + 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns[field] = np.where(counts > 0, sums / counts, np.nan)
+    return times, columns
+
+
+def chart_series(device, start, end, fields, points, mode='lttb', max_rows=20000):
+    """
+    Downsampled series of ``fields`` for ``device`` in ``[start, end)``.
+
+    Returns the source used and, per field, at most ``points`` pairs of
+    ``[epoch milliseconds, value]``.
+    """
+    source = choose_source(device, start, end, max_rows)
+    times, columns = load_columns(device, source, start, end, fields, max_rows)
+
+    series = {}
+    for field in fields:
+        x, y = downsample.downsample(times, columns[field], points, mode)
+        series[field] = [
+            [t, v] for t, v in zip((x * 1000).astype(np.int64).tolist(), np.round(y, _DECIMALS).tolist())
+        ]
+    return {
+        'source': source,
+        'series': series,
+    }
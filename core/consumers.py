@@ -1,11 +1,27 @@
 import json
+import time
 from datetime import datetime
+from itertools import islice
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
 from django.utils import timezone
+from . import archive, fanout, ingest, metrics, presence, protocol, registry
 from .models import Device, SensorReading
 
+# Device message types counted under their own label; anything else is 'unknown'
+MESSAGE_TYPES = {'sensor_data', 'sensor_batch', 'heartbeat'}
+
+MESSAGES = metrics.counter('device_messages_total', 'Messages received from IoT devices', labelnames=('type',))
+MESSAGE_ERRORS = metrics.counter(
+    'device_message_errors_total', 'Device messages answered with an error', labelnames=('type', 'reason'),
+)
+CONNECTIONS = metrics.gauge(
+    'websocket_connections', 'Open WebSocket connections', labelnames=('consumer',), aggregate='sum',
+)
+DISCONNECTS = metrics.counter(
+    'websocket_disconnects_total', 'Closed WebSocket connections by close code', labelnames=('consumer', 'code'),
+)
+
 
 class DeviceConsumer(AsyncWebsocketConsumer):
     """WebSocket Consumer to receive data from IoT devices"""
@@ -18,8 +34,16 @@ class DeviceConsumer(AsyncWebsocketConsumer):
         try:
             self.device = await self.get_device(self.device_uuid)
             if self.device:
-                await self.update_device_status(self.device, 'online')
-                await self.accept()
+                tracker = presence.get_tracker()
+                tracker.start()
+                tracker.connected(self.device)
+
+                # Devices offering the binary subprotocol may send bytes frames
+                subprotocol = None
+                if protocol.SUBPROTOCOL in self.scope.get('subprotocols', []):
+                    subprotocol = protocol.SUBPROTOCOL
+                await self.accept(subprotocol=subprotocol)
+                CONNECTIONS.labels('device').inc()
                 
                 await self.send(text_data=json.dumps({
                     'type': 'connection_established',
@@ -34,108 +58,197 @@ class DeviceConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         """Called when the IoT device disconnects"""
+        DISCONNECTS.labels('device', close_code).inc()
         if self.device:
-            await self.update_device_status(self.device, 'offline')
+            CONNECTIONS.labels('device').dec()
+            presence.get_tracker().disconnected(self.device)
 
-    async def receive(self, text_data):
-        """Receives sensor data from the IoT device"""
+    async def receive(self, text_data=None, bytes_data=None):
+        """Receives sensor data from the IoT device as JSON text or binary frames"""
+        message_type = 'invalid'
         try:
-            data = json.loads(text_data)
+            if bytes_data is not None:
+                data = protocol.decode_frame(bytes_data)
+            else:
+                data = json.loads(text_data)
             message_type = data.get('type', 'unknown')
+            if not isinstance(message_type, str) or message_type not in MESSAGE_TYPES:
+                message_type = 'unknown'
             
             if message_type == 'sensor_data':
                 await self._handle_sensor_data(data.get('data', {}))
+            elif message_type == 'sensor_batch':
+                await self._handle_sensor_batch(data.get('readings', []))
             elif message_type == 'heartbeat':
                 await self._handle_heartbeat()
             else:
+                MESSAGE_ERRORS.labels(message_type, 'unknown_type').inc()
                 await self.send(text_data=json.dumps({
                     'type': 'error',
-                    'message': f'Unknown message type: {message_type}'
+                    'message': f'Unknown message type: {data.get("type", "unknown")}'
                 }))
                 
         except json.JSONDecodeError:
+            MESSAGE_ERRORS.labels(message_type, 'json').inc()
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': 'Invalid JSON format'
             }))
+        except ingest.InvalidReading as e:
+            MESSAGE_ERRORS.labels(message_type, 'invalid_reading').inc()
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid sensor data: {str(e)}'
+            }))
+        except protocol.FrameError as e:
+            MESSAGE_ERRORS.labels(message_type, 'frame').inc()
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid binary frame: {str(e)}'
+            }))
         except Exception as e:
+            MESSAGE_ERRORS.labels(message_type, 'exception').inc()
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': f'Error processing data: {str(e)}'
             }))
+        finally:
+            MESSAGES.labels(message_type).inc()
 
     async def _handle_sensor_data(self, sensor_data):
         """Handle sensor data processing"""
+        if not isinstance(sensor_data, dict):
+            raise ingest.InvalidReading('data must be an object')
+        ingest.validate_sensor_data(sensor_data)
+        presence.get_tracker().seen(self.device, sensor_data.get('battery_level'))
+
+        buffer = ingest.get_buffer()
+        if buffer is not None:
+            await self._buffer_sensor_data(buffer, sensor_data)
+            return
+
+        started = time.perf_counter()
         reading = await self.save_sensor_reading(self.device, sensor_data)
+        ingest.SAVE_SECONDS.labels('reading').observe(time.perf_counter() - started)
         
         if reading:
-            # Update battery level if provided
-            battery_level = sensor_data.get('battery_level')
-            if battery_level is not None:
-                await self.update_device_battery(self.device, battery_level)
-            
-            # Broadcast to dashboard
-            await self.broadcast_to_dashboard(reading, sensor_data)
-            
-            # Send confirmation
+            await self._reading_saved(reading, sensor_data)
+        else:
+            raise Exception("Failed to save sensor reading")
+
+    async def _buffer_sensor_data(self, buffer, sensor_data):
+        """Queue sensor data in the worker's write-behind buffer"""
+        saved = await buffer.add(
+            ingest.build_reading(self.device, sensor_data),
+            battery_level=sensor_data.get('battery_level')
+        )
+
+        if buffer.early_ack:
+            # Acknowledge before the row is durable, finish the rest after the flush.
+            # The reading is only accepted: it has no id yet and may still fail to store.
             await self.send(text_data=json.dumps({
                 'type': 'data_received',
+                'status': 'accepted',
+                'message': 'Sensor data accepted and queued for storage',
+                'reading_id': None,
+                'timestamp': datetime.now().isoformat()
+            }))
+            ingest.spawn(self._finish_buffered(saved, sensor_data))
+        else:
+            await self._reading_saved(await saved, sensor_data)
+
+    async def _finish_buffered(self, saved, sensor_data):
+        """Complete an early-acknowledged reading once it has been flushed"""
+        try:
+            reading = await saved
+        except Exception:
+            return  # Already logged by the buffer
+        await self._reading_saved(reading, sensor_data, send_ack=False)
+
+    async def _reading_saved(self, reading, sensor_data, send_ack=True):
+        """Follow-up work once a reading is stored in the database"""
+        # Broadcast to dashboard
+        await self.broadcast_to_dashboard(reading, sensor_data)
+        
+        # Send confirmation; reading_id is null when the database does not
+        # return primary keys from bulk inserts (MySQL with the buffer enabled)
+        if send_ack:
+            await self.send(text_data=json.dumps({
+                'type': 'data_received',
+                'status': 'saved',
                 'message': 'Sensor data saved successfully',
                 'reading_id': reading.id,
                 'timestamp': reading.timestamp.isoformat()
             }))
-        else:
-            raise Exception("Failed to save sensor reading")
+
+    async def _handle_sensor_batch(self, items):
+        """Handle readings replayed by a device with their original timestamps"""
+        max_size = getattr(settings, 'SENSOR_BATCH_MAX_SIZE', 1000)
+        if not isinstance(items, list):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'sensor_batch readings must be a list'
+            }))
+            return
+        if len(items) > max_size:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Batch too large: {len(items)} readings (maximum {max_size})'
+            }))
+            return
+
+        entries, latest_data, rejected = ingest.parse_reading_batch(self.device, items)
+        presence.get_tracker().seen(self.device, entries[-1][1] if entries else None)
+
+        if entries:
+            started = time.perf_counter()
+            await self.save_sensor_batch(entries)
+            ingest.SAVE_SECONDS.labels('batch').observe(time.perf_counter() - started)
+
+            # One dashboard update carrying the newest reading of the batch
+            newest = entries[-1][0]
+            await self.broadcast_to_dashboard(newest, latest_data, batch_size=len(entries))
+
+        await self.send(text_data=json.dumps({
+            'type': 'batch_received',
+            'message': f'{len(entries)} of {len(items)} readings saved',
+            'accepted': len(entries),
+            'rejected': rejected,
+            'first_timestamp': entries[0][0].timestamp.isoformat() if entries else None,
+            'last_timestamp': entries[-1][0].timestamp.isoformat() if entries else None
+        }))
 
     async def _handle_heartbeat(self):
         """Handle heartbeat message"""
+        presence.get_tracker().seen(self.device)
         await self.send(text_data=json.dumps({
             'type': 'heartbeat_ack',
             'timestamp': datetime.now().isoformat()
         }))
 
-    @database_sync_to_async
+    @ingest.database_call
     def get_device(self, device_uuid):
-        """Get device by UUID"""
-        try:
-            return Device.objects.get(device_uuid=device_uuid)
-        except ObjectDoesNotExist:
-            return None
+        """Get device by UUID through the device registry cache"""
+        return registry.get_device(device_uuid)
 
-    @database_sync_to_async
-    def update_device_status(self, device, status):
-        """Update device status"""
-        device.status = status
-        device.save(update_fields=['status'])
-
-    @database_sync_to_async
-    def update_device_battery(self, device, battery_level):
-        """Update device battery level"""
-        device.battery_level = battery_level
-        device.save(update_fields=['battery_level'])
-
-    @database_sync_to_async
+    @ingest.database_call
     def save_sensor_reading(self, device, sensor_data):
-        """Save sensor reading to database"""
+        """Save sensor reading and refresh the device in one transaction"""
         try:
-            return SensorReading.objects.create(
-                device=device,
-                air_temperature=sensor_data.get('air_temperature'),
-                air_humidity=sensor_data.get('air_humidity'),
-                soil_moisture=sensor_data.get('soil_moisture'),
-                soil_ph=sensor_data.get('soil_ph'),
-                wind_speed=sensor_data.get('wind_speed'),
-                wind_direction=sensor_data.get('wind_direction'),
-                nitrogen=sensor_data.get('nitrogen'),
-                phosphorus=sensor_data.get('phosphorus'),
-                potassium=sensor_data.get('potassium'),
-                rainfall=sensor_data.get('rainfall')
+            return ingest.save_reading(
+                ingest.build_reading(device, sensor_data),
+                battery_level=sensor_data.get('battery_level')
             )
         except Exception:
             return None
 
-    async def broadcast_to_dashboard(self, reading, sensor_data):
-        """Broadcast sensor data to dashboard group"""
+    @ingest.database_call
+    def save_sensor_batch(self, entries):
+        """Save a batch of readings with one bulk insert"""
+        return ingest.bulk_insert_readings(entries)
+
+    async def broadcast_to_dashboard(self, reading, sensor_data, batch_size=None):
+        """Broadcast sensor data to the device's subscribers and the summary group"""
         try:
             # Convert to local timezone (Asia/Jakarta)
             local_time = timezone.localtime(reading.timestamp)
@@ -148,14 +261,19 @@ class DeviceConsumer(AsyncWebsocketConsumer):
                 'timestamp': local_time.strftime('%d/%m/%Y %H:%M:%S'),
                 'data': sensor_data
             }
+            if batch_size is not None:
+                message_data['batch_size'] = batch_size
             
-            await self.channel_layer.group_send(
-                'dashboard_group',
+            # Rate limited per device; the latest reading in each window wins
+            await fanout.get_dashboard_throttle().publish(
+                fanout.device_group(self.device.pk),
                 {
                     'type': 'sensor_data_update',
                     'message': message_data
                 }
             )
+            summary = {key: value for key, value in message_data.items() if key != 'type'}
+            await fanout.get_summary_broadcaster().publish(self.device_uuid, summary)
         except Exception:
             pass  # Fail silently for broadcast errors
 
@@ -165,14 +283,13 @@ class DashboardConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
         """Called when the browser connects to the dashboard WebSocket"""
-        self.group_name = 'dashboard_group'
-        
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        # Groups joined through "subscribe" messages: device_uuid -> group
+        self.subscriptions = {}
+        self.summary = False
+        presence.get_tracker().start()
         
         await self.accept()
+        CONNECTIONS.labels('dashboard').inc()
         
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
@@ -184,10 +301,13 @@ class DashboardConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         """Called when the dashboard disconnects"""
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        CONNECTIONS.labels('dashboard').dec()
+        DISCONNECTS.labels('dashboard', close_code).inc()
+        groups = list(self.subscriptions.values())
+        if self.summary:
+            groups.append(fanout.SUMMARY_GROUP)
+        for group in groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
 
     async def receive(self, text_data):
         """Receives messages from the browser dashboard"""
@@ -202,6 +322,10 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 await self.send_latest_readings(device_uuid)
             elif message_type == 'get_dashboard_data':
                 await self.send_dashboard_data()
+            elif message_type == 'subscribe':
+                await self.subscribe(data.get('devices', []), data.get('summary', False))
+            elif message_type == 'unsubscribe':
+                await self.unsubscribe(data.get('devices', []), data.get('summary', False))
             else:
                 await self.send(text_data=json.dumps({
                     'type': 'echo',
@@ -214,32 +338,75 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'message': 'Invalid JSON format'
             }))
 
+    async def subscribe(self, device_uuids, summary=False):
+        """Start receiving the readings of the given devices, and optionally the all-devices summary"""
+        if not isinstance(device_uuids, list) or not all(isinstance(uuid, str) for uuid in device_uuids):
+            await self.send_error('devices must be a list of device UUIDs')
+            return
+
+        new = [uuid for uuid in dict.fromkeys(device_uuids) if uuid not in self.subscriptions]
+        limit = getattr(settings, 'DASHBOARD_MAX_SUBSCRIPTIONS', 50)
+        if len(self.subscriptions) + len(new) > limit:
+            await self.send_error(f'Too many subscriptions (maximum {limit} devices)')
+            return
+
+        device_ids = await self.get_device_ids(new)
+        for device_uuid, device_id in device_ids.items():
+            group = fanout.device_group(device_id)
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.subscriptions[device_uuid] = group
+        if summary and not self.summary:
+            await self.channel_layer.group_add(fanout.SUMMARY_GROUP, self.channel_name)
+            self.summary = True
+
+        await self.send_subscriptions(unknown=[uuid for uuid in new if uuid not in device_ids])
+
+    async def unsubscribe(self, device_uuids, summary=False):
+        """Stop receiving the readings of the given devices, and optionally the summary"""
+        if not isinstance(device_uuids, list) or not all(isinstance(uuid, str) for uuid in device_uuids):
+            await self.send_error('devices must be a list of device UUIDs')
+            return
+
+        for device_uuid in device_uuids:
+            group = self.subscriptions.pop(device_uuid, None)
+            if group is not None:
+                await self.channel_layer.group_discard(group, self.channel_name)
+        if summary and self.summary:
+            await self.channel_layer.group_discard(fanout.SUMMARY_GROUP, self.channel_name)
+            self.summary = False
+
+        await self.send_subscriptions()
+
     async def sensor_data_update(self, event):
         """Handler to receive sensor data updates from DeviceConsumer"""
         message = event['message']
         await self.send(text_data=json.dumps(message))
 
+    async def devices_summary_update(self, event):
+        """Handler for the periodic all-devices summary"""
+        await self.send(text_data=json.dumps(event['message']))
+
     async def device_status_update(self, event):
         """Handler for device status updates"""
         await self.send(text_data=json.dumps(event['message']))
 
-    @database_sync_to_async
-    def get_online_devices(self):
-        """Get list of online devices"""
-        return list(Device.objects.filter(status='online').values(
-            'device_uuid', 'name', 'status', 'battery_level'
-        ))
+    async def get_online_devices(self):
+        """Get list of online devices from the presence tracker"""
+        return await presence.get_tracker().online_devices()
 
-    @database_sync_to_async
+    @ingest.database_call
     def get_dashboard_data(self):
         """Get complete dashboard data"""
         try:
             devices_data = []
-            devices = Device.objects.all()
-            
+            online_devices = 0
+            # One query: each device joined with its denormalized newest reading
+            devices = Device.objects.select_related('latest_reading').order_by('pk')
+
             for device in devices:
-                latest_reading = SensorReading.objects.filter(device=device).order_by('-timestamp').first()
-                
+                if device.status == 'online':
+                    online_devices += 1
+
                 device_data = {
                     'device': {
                         'uuid': device.device_uuid,
@@ -250,10 +417,11 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                     },
                     'readings': None
                 }
-                
+
+                latest_reading = getattr(device, 'latest_reading', None)
                 if latest_reading:
                     device_data['readings'] = {
-                        'id': latest_reading.id,
+                        'id': latest_reading.reading_id,
                         'timestamp': latest_reading.timestamp.isoformat(),
                         'air_temperature': latest_reading.air_temperature,
                         'air_humidity': latest_reading.air_humidity,
@@ -266,14 +434,13 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                         'potassium': latest_reading.potassium,
                         'rainfall': latest_reading.rainfall,
                     }
-                
+
                 devices_data.append(device_data)
-            
+
             # Calculate device counts
-            total_devices = devices.count()
-            online_devices = devices.filter(status='online').count()
+            total_devices = len(devices_data)
             offline_devices = total_devices - online_devices
-            
+
             return {
                 'devices_data': devices_data,
                 'total_devices_count': total_devices,
@@ -290,28 +457,45 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'has_devices': False
             }
 
-    @database_sync_to_async
+    @ingest.database_call
+    def get_device_ids(self, device_uuids):
+        """Primary keys of the registered devices among ``device_uuids``, through the registry cache"""
+        devices = {device_uuid: registry.get_device(device_uuid) for device_uuid in device_uuids}
+        return {device_uuid: device.pk for device_uuid, device in devices.items() if device is not None}
+
+    @ingest.database_call
     def get_latest_readings_for_device(self, device_uuid, limit=10):
         """Get latest sensor readings for specific device"""
         try:
-            readings = SensorReading.objects.filter(
+            readings = list(SensorReading.objects.filter(
                 device__device_uuid=device_uuid
-            ).order_by('-timestamp')[:limit]
+            ).order_by('-timestamp')[:limit].values('device_id', 'id', 'timestamp', *archive.NUMERIC_FIELDS, 'wind_direction'))
+
+            if len(readings) < limit:
+                # Older readings may already have been moved to the archive
+                if readings:
+                    device_id, oldest = readings[-1]['device_id'], readings[-1]['timestamp']
+                else:
+                    device_id = Device.objects.filter(device_uuid=device_uuid).values_list('pk', flat=True).first()
+                    oldest = None
+                if device_id is not None:
+                    archived = archive.iter_archived_readings(device_id, end=oldest, reverse=True)
+                    readings.extend(islice(archived, limit - len(readings)))
             
             return [
                 {
-                    'id': reading.id,
-                    'timestamp': reading.timestamp.isoformat(),
-                    'air_temperature': reading.air_temperature,
-                    'air_humidity': reading.air_humidity,
-                    'soil_moisture': reading.soil_moisture,
-                    'soil_ph': reading.soil_ph,
-                    'wind_speed': reading.wind_speed,
-                    'wind_direction': reading.wind_direction,
-                    'nitrogen': reading.nitrogen,
-                    'phosphorus': reading.phosphorus,
-                    'potassium': reading.potassium,
-                    'rainfall': reading.rainfall,
+                    'id': reading['id'],
+                    'timestamp': reading['timestamp'].isoformat(),
+                    'air_temperature': reading['air_temperature'],
+                    'air_humidity': reading['air_humidity'],
+                    'soil_moisture': reading['soil_moisture'],
+                    'soil_ph': reading['soil_ph'],
+                    'wind_speed': reading['wind_speed'],
+                    'wind_direction': reading['wind_direction'],
+                    'nitrogen': reading['nitrogen'],
+                    'phosphorus': reading['phosphorus'],
+                    'potassium': reading['potassium'],
+                    'rainfall': reading['rainfall'],
                 }
                 for reading in readings
             ]
@@ -346,3 +530,19 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'readings': readings,
                 'timestamp': datetime.now().isoformat()
             }))
+
+    async def send_subscriptions(self, unknown=()):
+        """Tell the client what it is subscribed to"""
+        await self.send(text_data=json.dumps({
+            'type': 'subscriptions',
+            'devices': sorted(self.subscriptions),
+            'summary': self.summary,
+            'unknown': list(unknown),
+            'timestamp': datetime.now().isoformat()
+        }))
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
@@ -0,0 +1,89 @@
+"""
+Downsampling of time series for charts.
+
+Both algorithms take the x (time) and y values of one series as NumPy
+arrays sorted by x and return the indexes of the points to keep, so the
+caller can pick timestamps and values from its own columns. Buckets are
+formed by position rather than by time, which keeps every bucket non-empty
+when readings arrive irregularly.
+
+* ``lttb``: Largest-Triangle-Three-Buckets. Keeps the point of each bucket
+  that forms the largest triangle with the previously kept point and the
+  mean of the next bucket, which preserves the visual shape of the line.
+* ``minmax``: keeps the lowest and the highest point of each bucket, so
+  every extreme value survives at the cost of a noisier line.
+"""
+import numpy as np
+
+MODES = ('lttb', 'minmax')
+
+
+def lttb(x, y, threshold):
+    """Indexes of at most ``threshold`` points chosen with LTTB"""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:max(threshold, 0)], dtype=np.int64)
+
+    # Bucket i covers [edges[i], edges[i + 1]); the first and last points
+    # are always kept and sit outside the buckets
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.int64) + 1, n)
+
+    # Mean of the bucket after each bucket, the last one being the final point
+    starts = edges[1:-1]
+    counts = np.diff(edges[1:])
+    next_x = np.add.reduceat(x, starts) / counts
+    next_y = np.add.reduceat(y, starts) / counts
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, threshold):
+    """Indexes of at most ``threshold`` points, the minimum and maximum of each bucket"""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = threshold // 2
+    if buckets < 1:
+        return np.arange(max(threshold, 0))
+
+    ids = np.arange(n) * buckets // n
+    order = np.lexsort((y, ids))
+    starts = np.searchsorted(ids, np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    return np.unique(np.concatenate([order[starts], order[ends - 1]]))
+
+
+def downsample(x, y, threshold, mode='lttb'):
+    """
+    Downsample one series to at most ``threshold`` points.
+
+    Points whose value is NaN are dropped first. Returns the kept
+    ``(x, y)`` arrays.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    present = ~np.isnan(y)
+    if not present.all():
+        x, y = x[present], y[present]
+
+    if mode == 'lttb':
+        keep = lttb(x, y, threshold)
+    elif mode == 'minmax':
+        keep = minmax(x, y, threshold)
+    else:
+        raise ValueError(f'Unknown downsampling mode: {mode}')
+    return x[keep], y[keep]
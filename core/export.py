@@ -0,0 +1,118 @@
+"""
+Streaming export of sensor readings as CSV or NDJSON.
+
+Rows are read device by device through ``archive.iter_readings``, which
+covers archived months as well as live rows and fetches the database in
+fixed-size chunks. Encoded rows are grouped into output chunks of about
+``CHUNK_BYTES`` and optionally gzip-compressed on the fly, so memory use
+does not depend on the size of the export. Under ASGI the stream is
+wrapped with ``aiter_chunks``; Django would otherwise read a synchronous
+iterator to the end before sending the first byte.
+"""
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from . import archive
+from .models import Device
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = ('device_uuid', 'id', 'timestamp', *archive.NUMERIC_FIELDS, 'wind_direction')
+
+CHUNK_BYTES = 64 * 1024
+
+
+class _Echo:
+    """File-like object whose write() returns what it was given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(devices=None, start=None, end=None, chunk_size=2000):
+    """Yield readings of ``devices`` (all by default) in ``[start, end)`` as dicts"""
+    if devices is None:
+        devices = Device.objects.order_by('pk')
+    for device in devices:
+        for row in archive.iter_readings(device.pk, start, end, chunk_size=chunk_size):
+            row['device_uuid'] = device.device_uuid
+            yield row
+
+
+def encode_csv(rows):
+    """Encode rows as CSV lines, header first"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row['timestamp'].isoformat() if column == 'timestamp' else row.get(column)
+            for column in COLUMNS
+        ])
+
+
+def encode_ndjson(rows):
+    """Encode rows as one JSON object per line"""
+    for row in rows:
+        record = {column: row.get(column) for column in COLUMNS}
+        record['timestamp'] = row['timestamp'].isoformat()
+        yield json.dumps(record) + '\n'
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+def _chunked(lines, size=CHUNK_BYTES):
+    """Join encoded lines into UTF-8 chunks of roughly ``size`` bytes"""
+    buffer = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(rows, format='csv', compress=False):
+    """Encode rows as a stream of byte chunks in ``format``, optionally gzipped"""
+    chunks = _chunked(ENCODERS[format](rows))
+    return _gzipped(chunks) if compress else chunks
+
+
+async def aiter_chunks(chunks):
+    """Async iterator over ``chunks``, producing each one in the sync thread that owns the database connection"""
+    chunks = iter(chunks)
+    pull = sync_to_async(next, thread_sensitive=True)
+    end = object()
+    while (chunk := await pull(chunks, end)) is not end:
+        yield chunk
+
+
+def filename(format, compress=False, moment=None):
+    """Download file name for an export"""
+    name = 'sensor-readings'
+    if moment is not None:
+        name += moment.strftime('-%Y%m%d-%H%M%S')
+    name += f'.{format}'
+    return name + '.gz' if compress else name
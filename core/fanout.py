@@ -0,0 +1,205 @@
+"""
+Fan-out of device updates to dashboard clients.
+
+Dashboards only receive what they subscribe to. Each device has its own
+group (``device_group()``), joined by the dashboards showing that device,
+so the channel layer delivers a reading only to the browsers that
+display it. Overview pages join ``SUMMARY_GROUP`` instead, which gets
+the newest reading of every device that reported, as one message every
+``DASHBOARD_SUMMARY_INTERVAL`` seconds.
+
+Every worker keeps a ``BroadcastThrottle`` that limits how often a single
+device's readings are forwarded to the channel layer. Within each window
+only the most recent update is kept; older ones are dropped from the
+broadcast (they are still stored in the database) so Redis and browsers
+only carry what can actually be rendered.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import ingest, metrics
+
+logger = logging.getLogger(__name__)
+
+GROUP_SEND_SECONDS = metrics.histogram(
+    'channel_group_send_seconds', 'Time to hand one message to the channel layer for a group', labelnames=('group',),
+)
+COALESCED = metrics.counter(
+    'broadcasts_coalesced_total', 'Group messages replaced by a newer one within the throttle window',
+    labelnames=('group',),
+)
+
+SUMMARY_GROUP = 'dashboard_summary'
+
+
+def device_group(device_id):
+    """Group of the dashboards subscribed to one device, by primary key"""
+    return f'dashboard_device.{device_id}'
+
+
+class _DeviceWindow:
+    __slots__ = ('last_sent', 'pending', 'handle')
+
+    def __init__(self):
+        self.last_sent = None
+        self.pending = None
+        self.handle = None
+
+
+class _GroupSender:
+    """Sends to channel layer groups, timed under the metric label ``name``"""
+
+    def __init__(self, name, channel_layer=None):
+        self.name = name
+        self._channel_layer = channel_layer
+        self.sent = 0
+
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    async def _send(self, group, message):
+        started = time.perf_counter()
+        await self.channel_layer.group_send(group, message)
+        GROUP_SEND_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+        self.sent += 1
+
+    async def _send_quietly(self, group, message):
+        try:
+            await self._send(group, message)
+        except Exception:
+            logger.exception('Failed to send update to %s', group)
+
+
+class BroadcastThrottle(_GroupSender):
+    """
+    Rate limit messages per group, keeping the latest message.
+
+    The first message for a group is sent immediately. Messages that arrive
+    before ``min_interval`` seconds have passed replace each other, and the
+    survivor is sent once the window closes.
+    """
+
+    def __init__(self, name, min_interval, channel_layer=None):
+        super().__init__(name, channel_layer)
+        self.min_interval = min_interval
+        self._windows = {}
+        self._loop = None
+        self.coalesced = 0
+
+    async def publish(self, key, message):
+        """Send ``message`` to group ``key`` now, or keep it for the end of the window"""
+        if self.min_interval <= 0:
+            await self._send(key, message)
+            return
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous event loop is gone with its timers
+            self._loop, self._windows = loop, {}
+        now = loop.time()
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _DeviceWindow()
+
+        if window.handle is None and (window.last_sent is None or now - window.last_sent >= self.min_interval):
+            window.last_sent = now
+            await self._send(key, message)
+            return
+
+        if window.pending is not None:
+            self.coalesced += 1
+            COALESCED.labels(self.name).inc()
+        window.pending = message
+        if window.handle is None:
+            delay = window.last_sent + self.min_interval - now
+            window.handle = loop.call_later(delay, self._on_window_closed, key)
+
+    def _on_window_closed(self, key):
+        window = self._windows[key]
+        window.handle = None
+        message, window.pending = window.pending, None
+        if message is not None:
+            window.last_sent = asyncio.get_running_loop().time()
+            ingest.spawn(self._send_quietly(key, message))
+
+
+class SummaryBroadcaster(_GroupSender):
+    """
+    Collect the latest entry per key and send them to ``group`` together.
+
+    At most one message goes out every ``interval`` seconds, listing the
+    entries published since the previous one. Each worker sends its own
+    summaries; clients merge them by key.
+    """
+
+    def __init__(self, group, interval, message_type, channel_layer=None):
+        super().__init__(group, channel_layer)
+        self.group = group
+        self.interval = interval
+        self.message_type = message_type
+        self._pending = {}
+        self._last_sent = None
+        self._handle = None
+        self._loop = None
+
+    async def publish(self, key, entry):
+        """Add ``entry`` to the next summary, replacing an older entry for ``key``"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous event loop is gone with its timer
+            self._loop, self._handle, self._last_sent = loop, None, None
+        self._pending[key] = entry
+        if self._handle is None:
+            delay = 0 if self._last_sent is None else max(0, self._last_sent + self.interval - loop.time())
+            self._handle = loop.call_later(delay, self._on_interval)
+
+    def _on_interval(self):
+        self._handle = None
+        entries, self._pending = list(self._pending.values()), {}
+        self._last_sent = asyncio.get_running_loop().time()
+        ingest.spawn(self._send_quietly(self.group, {
+            'type': self.message_type,
+            'message': {
+                'type': 'devices_summary',
+                'devices': entries,
+                'timestamp': datetime.now().isoformat(),
+            },
+        }))
+
+
+_throttle = None
+_summary = None
+
+
+def get_dashboard_throttle():
+    """Return this worker's throttle for the per-device dashboard groups"""
+    global _throttle
+
+    if _throttle is None:
+        max_rate = getattr(settings, 'DASHBOARD_MAX_UPDATES_PER_SECOND', 1.0)
+        _throttle = BroadcastThrottle(
+            'dashboard_device',
+            min_interval=1.0 / max_rate if max_rate > 0 else 0,
+        )
+    return _throttle
+
+
+def get_summary_broadcaster():
+    """Return this worker's broadcaster for the all-devices summary group"""
+    global _summary
+
+    if _summary is None:
+        _summary = SummaryBroadcaster(
+            SUMMARY_GROUP,
+            interval=getattr(settings, 'DASHBOARD_SUMMARY_INTERVAL', 5.0),
+            message_type='devices_summary_update',
+        )
+    return _summary
@@ -0,0 +1,561 @@
+"""
+SoySmart AI inference.
+
+Leaf images are classified by a TensorFlow Lite model. Instead of running
+each upload through the interpreter on its own, requests go through a
+``BatchScheduler``: uploads that arrive within ``SOYSMART_BATCH_WAIT``
+seconds of each other (up to ``SOYSMART_MAX_BATCH_SIZE``) are stacked into
+one input tensor and classified with a single ``invoke()``. Each caller
+gets back a future for its own row of the output.
+
+Batches are run by ``SOYSMART_INTERPRETERS`` (2 by default) worker threads,
+each checking out one of as many preallocated interpreters from a
+``ClassifierPool``, so a process can use several cores. Decoding and preprocessing happen in the
+request's own thread and never hold a lock.
+
+Finished predictions are cached in the ``SOYSMART_CACHE_ALIAS`` cache under
+the SHA-256 of the uploaded bytes and the model version, so re-uploads and
+client retries skip decoding and inference entirely.
+
+Each request's time is broken down by stage (``StageTimings``): upload
+read, cache lookup, decode, resize, queue wait, interpreter checkout,
+``invoke()`` and response building. The breakdown is returned in the
+``Server-Timing`` header and recorded in the ``soysmart_stage_seconds``
+histogram.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+# Suppress TensorFlow logging
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(settings.BASE_DIR) / 'model'
+MODEL_PATH = MODEL_DIR / 'model_kedelai_v1.tflite'
+REKOMENDASI_PATH = MODEL_DIR / 'rekomendasi.json'
+
+INPUT_SIZE = (224, 224)
+
+CACHE_HITS = metrics.counter('soysmart_cache_hits_total', 'SoySmart predictions served from the cache')
+CACHE_MISSES = metrics.counter('soysmart_cache_misses_total', 'SoySmart predictions that had to run the model')
+STAGE_SECONDS = metrics.histogram(
+    'soysmart_stage_seconds', 'Time SoySmart AI requests spent in each pipeline stage', labelnames=('stage',),
+)
+MODEL_LOAD_SECONDS = metrics.gauge('soysmart_model_load_seconds', 'Time it took to load the SoySmart model')
+MODEL_WARMUP_SECONDS = metrics.gauge('soysmart_model_warmup_seconds', 'Time it took to warm up the SoySmart model')
+INTERPRETERS = metrics.gauge('soysmart_interpreters', 'TFLite interpreters loaded in this process')
+INTERPRETER_THREADS = metrics.gauge('soysmart_interpreter_threads', 'Threads used by each TFLite interpreter')
+MAX_BATCH_SIZE = metrics.gauge('soysmart_max_batch_size', 'Most images classified in one invoke()')
+
+
+class StageTimings:
+    """Seconds one request spent in each pipeline stage, in the order they ran"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, stages):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def observe(self):
+        """Record every stage in the soysmart_stage_seconds histogram"""
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.labels(name).observe(seconds)
+
+    def header(self):
+        """The stages as a ``Server-Timing`` header value, in milliseconds"""
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items())
+
+
+class ModelError(Exception):
+    """Raised when the model or its disease catalogue cannot be loaded"""
+
+
+_model_version = None
+
+
+def model_version():
+    """SOYSMART_MODEL_VERSION, or a digest of the model and catalogue files"""
+    global _model_version
+
+    if _model_version is None:
+        version = getattr(settings, 'SOYSMART_MODEL_VERSION', '')
+        if not version:
+            digest = hashlib.sha256()
+            for path in (MODEL_PATH, REKOMENDASI_PATH):
+                try:
+                    with open(path, 'rb') as f:
+                        for block in iter(lambda: f.read(1 << 20), b''):
+                            digest.update(block)
+                except OSError:
+                    digest.update(b'missing')
+            version = digest.hexdigest()[:16]
+        _model_version = version
+    return _model_version
+
+
+def upload_digest(image_file):
+    """SHA-256 of an uploaded file, read in chunks; the file is rewound afterwards"""
+    digest = hashlib.sha256()
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(digest):
+    return f'soysmart:{model_version()}:{digest}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SOYSMART_CACHE_ALIAS', 'soysmart')]
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload is not an image the model can take"""
+
+
+def preprocess(image_file, max_pixels=None, timings=None):
+    """
+    Decode an uploaded image into a (224, 224, 3) float32 array scaled to [0, 1].
+
+    The image is read straight from the upload's storage. JPEGs are decoded
+    at the smallest DCT scale that still covers the model input (draft
+    mode), so a 12 MP photo is never expanded to full size. Images with
+    more than ``max_pixels`` pixels are rejected before decoding. Decode
+    and resize times are added to ``timings`` when given.
+    """
+    from PIL import Image
+
+    if max_pixels is None:
+        max_pixels = getattr(settings, 'SOYSMART_MAX_PIXELS', 40_000_000)
+    if timings is None:
+        timings = StageTimings()
+
+    with timings.stage('decode'):
+        try:
+            img = Image.open(image_file)
+        except (OSError, Image.DecompressionBombError):
+            # UnidentifiedImageError is an OSError too
+            raise ImageRejected('File bukan gambar yang valid')
+    with img:
+        with timings.stage('decode'):
+            width, height = img.size
+            if width * height > max_pixels:
+                raise ImageRejected(f'Resolusi gambar terlalu besar (maksimal {max_pixels // 1_000_000} MP)')
+            try:
+                img.draft('RGB', INPUT_SIZE)
+                img.load()
+            except (OSError, Image.DecompressionBombError):
+                # Truncated or corrupt image data
+                raise ImageRejected('File gambar rusak atau tidak lengkap')
+
+        with timings.stage('resize'):
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img = img.resize(INPUT_SIZE, Image.BILINEAR, reducing_gap=3.0)
+            pixels = np.asarray(img)
+            array = np.empty(pixels.shape, dtype=np.float32)
+            np.multiply(pixels, np.float32(1 / 255), out=array)
+    return array
+
+
+class Classifier:
+    """A TFLite interpreter together with the disease catalogue"""
+
+    def __init__(self, model_path=MODEL_PATH, rekomendasi_path=REKOMENDASI_PATH, num_threads=None, rekomendasi=None):
+        if not os.path.exists(model_path):
+            raise ModelError('Model tidak ditemukan')
+
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input_index = self.interpreter.get_input_details()[0]['index']
+        self._output_index = self.interpreter.get_output_details()[0]['index']
+        self._batch_size = 1
+
+        if rekomendasi is None:
+            with open(rekomendasi_path, 'r', encoding='utf-8') as f:
+                rekomendasi = json.load(f)
+        self.rekomendasi = rekomendasi
+        self.labels = list(self.rekomendasi.keys())
+
+    def predict(self, images):
+        """Class probabilities for a stacked (N, 224, 224, 3) float32 batch"""
+        batch_size = len(images)
+        if batch_size != self._batch_size:
+            # Reallocation only happens when the batch size changes
+            self.interpreter.resize_tensor_input(self._input_index, [batch_size, *INPUT_SIZE, 3])
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+        self.interpreter.set_tensor(self._input_index, images)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output_index).copy()
+
+    def describe(self, probabilities):
+        """Response payload for one row of predictions"""
+        predicted_index = int(np.argmax(probabilities))
+        predicted_class = self.labels[predicted_index]
+        disease_info = self.rekomendasi[predicted_class]
+        return {
+            'penyakit': predicted_class,
+            'nama_ilmiah': disease_info['nama_ilmiah'],
+            'deskripsi': disease_info['deskripsi'],
+            'rekomendasi': disease_info['rekomendasi'],
+            'confidence': float(probabilities[predicted_index]),
+        }
+
+
+class ClassifierPool:
+    """
+    A fixed set of preallocated classifiers shared by several threads.
+
+    ``predict()`` checks out a free classifier for the duration of one
+    call; the pool's queue is the only synchronization.
+    """
+
+    def __init__(self, classifiers):
+        self.classifiers = list(classifiers)
+        self.size = len(self.classifiers)
+        self._free = queue.LifoQueue()
+        for classifier in self.classifiers:
+            self._free.put(classifier)
+
+    @classmethod
+    def load(cls, size=1, num_threads=None, model_path=MODEL_PATH, rekomendasi_path=REKOMENDASI_PATH):
+        """Load ``size`` interpreters of the model, each using ``num_threads`` threads"""
+        first = Classifier(model_path, rekomendasi_path, num_threads=num_threads)
+        others = [
+            Classifier(model_path, num_threads=num_threads, rekomendasi=first.rekomendasi)
+            for _ in range(size - 1)
+        ]
+        return cls([first, *others])
+
+    @contextmanager
+    def checkout(self):
+        """Borrow a classifier, waiting until one is free"""
+        classifier = self._free.get()
+        try:
+            yield classifier
+        finally:
+            self._free.put(classifier)
+
+    def predict(self, images):
+        with self.checkout() as classifier:
+            return classifier.predict(images)
+
+    def warm_up(self, images):
+        """Run ``images`` through every classifier, holding them all meanwhile"""
+        with ExitStack() as stack:
+            classifiers = [stack.enter_context(self.checkout()) for _ in range(self.size)]
+            for classifier in classifiers:
+                classifier.predict(images)
+
+    def describe(self, probabilities):
+        return self.classifiers[0].describe(probabilities)
+
+
+class BatchScheduler:
+    """
+    Collect single-image requests into batches for one classifier.
+
+    A single collector thread forms the batches: once one of the
+    ``workers`` runner threads is free, it takes the first queued image,
+    then keeps taking more until ``max_batch_size`` images are waiting or
+    ``max_wait`` seconds have passed since the first one, and hands them
+    to that runner as one batch. While every runner is busy, images keep
+    queueing and go out together in the next batch. ``classifier`` may be
+    a ClassifierPool with at least as many classifiers as there are
+    workers.
+
+    Each future carries a ``timings`` dict with the seconds its image spent
+    queued, waiting for an interpreter, in ``invoke()`` and being described.
+    """
+
+    _STOP = object()
+
+    def __init__(self, classifier, max_batch_size=8, max_wait=0.01, workers=1):
+        self.classifier = classifier
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+
+        self.batches = 0
+        self.images = 0
+        self._stats_lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._batches = queue.Queue()
+        self._free_runners = threading.Semaphore(max(1, workers))
+        self._runners = [
+            threading.Thread(target=self._run, name=f'soysmart-batcher-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._collector = threading.Thread(target=self._dispatch, name='soysmart-collector', daemon=True)
+        for thread in (self._collector, *self._runners):
+            thread.start()
+
+    def submit(self, image):
+        """Queue one preprocessed image; returns a Future of its response payload"""
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    async def classify(self, image, timings=None):
+        """Classify one preprocessed image from async code, adding its stages to ``timings``"""
+        future = self.submit(image)
+        result = await asyncio.wrap_future(future)
+        if timings is not None:
+            timings.update(future.timings)
+        return result
+
+    def close(self):
+        """Stop the batching threads once the queued images are done"""
+        self._queue.put(self._STOP)
+        for thread in (self._collector, *self._runners):
+            thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is self._STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self):
+        """Collector thread: form a batch whenever a runner is free"""
+        while True:
+            self._free_runners.acquire()
+            batch = self._collect()
+            if batch is None:
+                for _ in self._runners:
+                    self._batches.put(self._STOP)
+                return
+            self._batches.put(batch)
+
+    def _run(self):
+        while True:
+            batch = self._batches.get()
+            if batch is self._STOP:
+                return
+            try:
+                self._run_batch(batch)
+            finally:
+                self._free_runners.release()
+
+    def _run_batch(self, batch):
+        collected = time.perf_counter()
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        images = [image for image, _, _ in batch]
+        futures = [future for _, future, _ in batch]
+        try:
+            with self._checkout() as classifier:
+                acquired = time.perf_counter()
+                predictions = classifier.predict(np.stack(images))
+                invoked = time.perf_counter()
+            results = [self.classifier.describe(row) for row in predictions]
+            described = time.perf_counter()
+        except Exception as e:
+            logger.exception('SoySmart inference failed for a batch of %d', len(images))
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.batches += 1
+            self.images += len(images)
+        for (_, future, submitted), result in zip(batch, results):
+            future.timings = {
+                'queue': collected - submitted,
+                'checkout': acquired - collected,
+                'invoke': invoked - acquired,
+                'describe': described - invoked,
+            }
+            future.set_result(result)
+
+    def _checkout(self):
+        checkout = getattr(self.classifier, 'checkout', None)
+        return checkout() if checkout else nullcontext(self.classifier)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Load and warm-up state of this process, reported by /readyz
+_status = {
+    'loaded': False,
+    'warmed': False,
+    'load_seconds': None,
+    'warmup_seconds': None,
+    'interpreters': None,
+    'num_threads': None,
+    'max_batch_size': None,
+    'batch_wait': None,
+    'error': None,
+}
+
+
+def get_scheduler():
+    """
+    Return this process's inference entry point: the local BatchScheduler,
+    or a client of the inference worker when SOYSMART_INFERENCE_BACKEND is
+    ``'worker'``. Both offer ``async classify(image)``.
+    """
+    global _scheduler
+
+    if _scheduler is None:
+        if getattr(settings, 'SOYSMART_INFERENCE_BACKEND', 'local') == 'worker':
+            from .inference_worker import WorkerClient
+
+            with _scheduler_lock:
+                if _scheduler is None:
+                    _scheduler = WorkerClient(timeout=getattr(settings, 'SOYSMART_WORKER_TIMEOUT', 30))
+        else:
+            get_local_scheduler()
+    return _scheduler
+
+
+def get_local_scheduler():
+    """Return this process's BatchScheduler, loading the model on first use"""
+    global _scheduler
+
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                started = time.monotonic()
+                num_threads = getattr(settings, 'SOYSMART_NUM_THREADS', 1)
+                pool = ClassifierPool.load(interpreter_count(), num_threads=num_threads)
+                _scheduler = BatchScheduler(
+                    pool,
+                    max_batch_size=getattr(settings, 'SOYSMART_MAX_BATCH_SIZE', 8),
+                    max_wait=getattr(settings, 'SOYSMART_BATCH_WAIT', 0.01),
+                    workers=pool.size,
+                )
+                _status.update(
+                    loaded=True, load_seconds=time.monotonic() - started, error=None,
+                    interpreters=pool.size, num_threads=num_threads,
+                    max_batch_size=_scheduler.max_batch_size, batch_wait=_scheduler.max_wait,
+                )
+                MODEL_LOAD_SECONDS.set(_status['load_seconds'])
+                INTERPRETERS.set(pool.size)
+                INTERPRETER_THREADS.set(num_threads)
+                MAX_BATCH_SIZE.set(_scheduler.max_batch_size)
+                logger.info(
+                    'SoySmart model loaded in %.2fs: %d interpreter(s) x %d thread(s), batches of up to %d',
+                    _status['load_seconds'], pool.size, num_threads, _scheduler.max_batch_size,
+                )
+    return _scheduler
+
+
+def warm_up(scheduler):
+    """Run a blank image through the model so the first real request is not slower"""
+    image = np.zeros((1, *INPUT_SIZE, 3), dtype=np.float32)
+    if isinstance(scheduler, BatchScheduler):
+        classifier = scheduler.classifier
+        if isinstance(classifier, ClassifierPool):
+            classifier.warm_up(image)
+        else:
+            classifier.predict(image)
+    else:
+        scheduler.classify_sync(image[0])
+
+
+def preload(factory=get_scheduler):
+    """Load and warm up the model, recording timings and errors for readiness checks"""
+    try:
+        scheduler = factory()
+        started = time.monotonic()
+        warm_up(scheduler)
+        _status.update(warmed=True, warmup_seconds=time.monotonic() - started, error=None)
+        MODEL_WARMUP_SECONDS.set(_status['warmup_seconds'])
+        logger.info(
+            'SoySmart model ready (load %.2fs, warm-up %.2fs)',
+            _status['load_seconds'] or 0, _status['warmup_seconds'],
+        )
+    except ModelError as e:
+        _status['error'] = str(e)
+    except Exception as e:
+        _status['error'] = f'Gagal memuat model: {e}'
+    if _status['error']:
+        logger.error('SoySmart model preload failed: %s', _status['error'])
+
+
+def start_preload():
+    """Preload the model in a background thread; readiness reports when it is done"""
+    threading.Thread(target=preload, name='soysmart-preload', daemon=True).start()
+
+
+def load_status():
+    """Load and warm-up state of this process"""
+    return dict(_status)
+
+
+def readiness():
+    """
+    Whether SoySmart requests to this process will be served without a cold
+    start. Without SOYSMART_PRELOAD the model loads lazily and the process
+    is always reported ready.
+    """
+    if getattr(settings, 'SOYSMART_INFERENCE_BACKEND', 'local') == 'worker':
+        from .inference_worker import WorkerError
+
+        try:
+            status = get_scheduler().ping(timeout=2)
+        except WorkerError as e:
+            return {'ready': False, 'backend': 'worker', 'error': str(e)}
+        return {'ready': status['warmed'], 'backend': 'worker', **status}
+
+    status = load_status()
+    preloading = getattr(settings, 'SOYSMART_PRELOAD', False)
+    return {'ready': status['warmed'] or not preloading, 'backend': 'local', 'preload': preloading, **status}
+
+
+def interpreter_count():
+    """Configured pool size; 0 means one interpreter per available core group"""
+    count = getattr(settings, 'SOYSMART_INTERPRETERS', 2)
+    if count > 0:
+        return count
+    num_threads = max(1, getattr(settings, 'SOYSMART_NUM_THREADS', 1) or 1)
+    return max(1, (os.cpu_count() or 1) // num_threads)
@@ -0,0 +1,278 @@
+"""
+Out-of-process SoySmart AI inference.
+
+With ``SOYSMART_INFERENCE_BACKEND = 'worker'`` the web processes never
+import TensorFlow. They preprocess uploads and send the model input over
+``multiprocessing.connection`` to a long-lived inference process, started
+with ``python manage.py run_inference_worker``. That process holds the
+interpreter pool and batch scheduler warm, and batches uploads from every
+web process together.
+
+Messages are tuples, authenticated with a key derived from ``SECRET_KEY``:
+
+    ('classify', image)  ->  ('ok', payload, stage_seconds) | ('error', kind, message)
+    ('ping',)            ->  ('ok', status)
+
+The supervisor (``Supervisor``) restarts the inference process whenever it
+exits or stops answering health checks.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import inference
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """Raised when the inference worker cannot be reached or fails a request"""
+
+
+def worker_address():
+    """Configured worker address: a Unix socket path or a ``(host, port)`` pair"""
+    address = getattr(settings, 'SOYSMART_WORKER_ADDRESS', '/tmp/glycine-soysmart.sock')
+    if not address.startswith('/') and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address
+
+
+def worker_authkey():
+    """Connection key shared by the web processes and the worker"""
+    return hashlib.sha256(f'soysmart-worker:{settings.SECRET_KEY}'.encode()).digest()
+
+
+class WorkerClient:
+    """
+    Web-side stand-in for the BatchScheduler that forwards to the worker.
+
+    Connections are opened on demand and reused; a connection that breaks
+    (for example because the worker was restarted) is dropped and the
+    request is retried once on a fresh one.
+    """
+
+    def __init__(self, address=None, authkey=None, timeout=30):
+        self.address = address or worker_address()
+        self.authkey = authkey or worker_authkey()
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        # Like multiprocessing.connection.Client, but with kernel send and
+        # receive timeouts so a frozen worker cannot block the handshake
+        sock = socket.socket(socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET)
+        timeval = struct.pack('ll', int(self.timeout), int(self.timeout % 1 * 1e6))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+        try:
+            sock.connect(self.address)
+            connection = Connection(sock.detach())
+        except OSError as e:
+            sock.close()
+            raise WorkerError(f'Inference worker unavailable: {e}')
+        try:
+            answer_challenge(connection, self.authkey)
+            deliver_challenge(connection, self.authkey)
+        except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+            connection.close()
+            raise WorkerError(f'Inference worker handshake failed: {e}')
+        return connection
+
+    def _call(self, message, timeout):
+        for attempt in (1, 2):
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                connection.send(message)
+                if not connection.poll(timeout):
+                    connection.close()
+                    raise WorkerError('Inference worker timed out')
+                reply = connection.recv()
+            except (OSError, EOFError) as e:
+                connection.close()
+                if attempt == 2:
+                    raise WorkerError(f'Inference worker connection lost: {e}')
+                continue
+            self._idle.put(connection)
+            return reply
+
+    def classify_sync(self, image, timings=None):
+        """
+        Classify one preprocessed image, blocking until the worker answers.
+
+        The worker's stage timings are added to ``timings``, along with the
+        rest of the round trip as ``transport``.
+        """
+        started = time.perf_counter()
+        reply = self._call(('classify', image), self.timeout)
+        if reply[0] == 'ok':
+            if timings is not None:
+                stages = reply[2]
+                timings.add('transport', time.perf_counter() - started - sum(stages.values()))
+                timings.update(stages)
+            return reply[1]
+        _, kind, message = reply
+        if kind == 'model':
+            raise inference.ModelError(message)
+        raise WorkerError(message)
+
+    async def classify(self, image, timings=None):
+        """Classify one preprocessed image from async code"""
+        return await sync_to_async(self.classify_sync, thread_sensitive=False)(image, timings)
+
+    def ping(self, timeout=5):
+        """Return the worker's status dict, or raise WorkerError"""
+        return self._call(('ping',), timeout)[1]
+
+
+class _WorkerServer:
+    """Runs inside the inference process: serves connections from web processes"""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.scheduler = None
+        self.loaded = threading.Event()
+
+    def load(self):
+        inference.preload(inference.get_local_scheduler)
+        if inference.load_status()['loaded']:
+            self.scheduler = inference.get_local_scheduler()
+        self.loaded.set()
+
+    def status(self):
+        status = inference.load_status()
+        status['pid'] = os.getpid()
+        if self.scheduler is not None:
+            status.update(batches=self.scheduler.batches, images=self.scheduler.images)
+        return status
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)  # Left behind by a previous worker
+        with Listener(self.address, authkey=self.authkey) as listener:
+            # Accept health checks while the model is still loading
+            threading.Thread(target=self.load, name='soysmart-loader', daemon=True).start()
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, multiprocessing.AuthenticationError):
+                    logger.warning('Rejected an inference worker connection', exc_info=True)
+                    continue
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection):
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                    connection.send(self.reply(message))
+                except (OSError, EOFError):
+                    return
+
+    def reply(self, message):
+        if message[0] == 'ping':
+            return ('ok', self.status())
+        if message[0] != 'classify':
+            return ('error', 'request', f'Unknown request: {message[0]}')
+
+        self.loaded.wait()
+        if self.scheduler is None:
+            return ('error', 'model', inference.load_status()['error'])
+        try:
+            future = self.scheduler.submit(message[1])
+            return ('ok', future.result(), future.timings)
+        except Exception as e:
+            return ('error', 'inference', str(e))
+
+
+def serve(address, authkey):
+    """Entry point of the inference process"""
+    import django
+
+    django.setup()
+    _WorkerServer(address, authkey).serve_forever()
+
+
+class Supervisor:
+    """
+    Keep one inference process running, restarting it when it exits or
+    fails ``max_failures`` health checks in a row.
+    """
+
+    def __init__(self, address=None, authkey=None, health_interval=5, max_failures=3, log=None):
+        self.address = address or worker_address()
+        self.authkey = authkey or worker_authkey()
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.log = log or logger.info
+        self.process = None
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = threading.Event()
+
+    def start_process(self):
+        self.process = self._context.Process(
+            target=serve, args=(self.address, self.authkey), name='soysmart-inference', daemon=True,
+        )
+        self.process.start()
+        self.log(f'Started inference process {self.process.pid}')
+
+    def _client(self):
+        return WorkerClient(self.address, self.authkey, timeout=self.health_interval)
+
+    def stop_process(self):
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def run(self):
+        """Supervise until ``stop()`` is called"""
+        client = self._client()
+        self.start_process()
+        failures = 0
+        backoff = 1
+        while not self._stopping.wait(self.health_interval):
+            if not self.process.is_alive():
+                reason = f'exited with code {self.process.exitcode}'
+            else:
+                try:
+                    client.ping(timeout=self.health_interval)
+                    failures, backoff = 0, 1
+                    continue
+                except WorkerError as e:
+                    failures += 1
+                    if failures < self.max_failures:
+                        continue
+                    reason = f'failed {failures} health checks ({e})'
+
+            self.log(f'Inference process {self.process.pid} {reason}; restarting in {backoff}s')
+            self.stop_process()
+            if self._stopping.wait(backoff):
+                break
+            backoff = min(backoff * 2, 30)
+            failures = 0
+            self.restarts += 1
+            client = self._client()
+            self.start_process()
+        self.stop_process()
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,467 @@
+"""
+Write path for sensor readings received from IoT devices.
+
+Every write stores the readings, refreshes the owning devices' battery
+level, updates each device's ``LatestReading`` and folds the readings into
+the rollup tables in one transaction, so a message costs a single trip to
+the database thread. Device status and last-seen time belong to
+``core.presence``, which writes them in batches.
+
+By default every reading is inserted as soon as it arrives. When
+``SENSOR_BUFFER_ENABLED`` is set, readings from all device connections
+served by this worker are collected in a single ``ReadingBuffer`` and
+written with one ``bulk_create`` whenever the batch is full or the flush
+interval has elapsed.
+"""
+import asyncio
+import atexit
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics, rollups
+from .models import Device, LatestReading, SensorReading
+
+logger = logging.getLogger(__name__)
+
+SAVE_SECONDS = metrics.histogram(
+    'sensor_save_seconds', 'Time to store the readings of one device message or buffer flush', labelnames=('kind',),
+)
+DATABASE_CALLS = metrics.gauge(
+    'database_calls_in_progress', 'database_sync_to_async calls queued for or running on the database thread',
+    aggregate='sum',
+)
+
+
+def database_call(func):
+    """``database_sync_to_async`` that also counts the calls waiting for the database thread"""
+    return DATABASE_CALLS.track_inprogress()(database_sync_to_async(func))
+
+
+# The event loop only keeps weak references to tasks; these are kept until done
+_background_tasks = set()
+
+
+def spawn(coroutine):
+    """Run ``coroutine`` as a background task that is not garbage-collected early and whose failure is logged"""
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+
+def _background_task_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Background task failed', exc_info=task.exception())
+
+
+# Fields copied verbatim from a device payload into a SensorReading
+SENSOR_FIELDS = (
+    'air_temperature',
+    'air_humidity',
+    'soil_moisture',
+    'soil_ph',
+    'wind_speed',
+    'wind_direction',
+    'nitrogen',
+    'phosphorus',
+    'potassium',
+    'rainfall',
+)
+
+# Sensor fields that must be numeric when present
+NUMERIC_FIELDS = tuple(field for field in SENSOR_FIELDS if field != 'wind_direction')
+
+
+class InvalidReading(ValueError):
+    """Raised when a reading in a sensor batch fails validation"""
+
+
+def validate_sensor_data(sensor_data):
+    """Raise InvalidReading unless every sensor field and the battery level can be stored as sent"""
+    for field in (*NUMERIC_FIELDS, 'battery_level'):
+        value = sensor_data.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidReading(f'{field} must be a number')
+        if not math.isfinite(value):
+            raise InvalidReading(f'{field} must be a finite number')
+    wind_direction = sensor_data.get('wind_direction')
+    if wind_direction is not None and (not isinstance(wind_direction, str) or len(wind_direction) > 50):
+        raise InvalidReading('wind_direction must be text of at most 50 characters')
+
+
+def build_reading(device, sensor_data):
+    """Build an unsaved SensorReading from a device payload"""
+    return SensorReading(
+        device=device,
+        **{field: sensor_data.get(field) for field in SENSOR_FIELDS}
+    )
+
+
+def parse_timestamp(value):
+    """Parse a device timestamp given as ISO 8601 text or epoch seconds"""
+    if isinstance(value, bool):
+        raise InvalidReading('timestamp must be ISO 8601 text or epoch seconds')
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise InvalidReading('timestamp is out of range')
+    if isinstance(value, str):
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise InvalidReading('timestamp is not a valid ISO 8601 datetime')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+    raise InvalidReading('timestamp is required')
+
+
+def parse_reading_batch(device, items):
+    """
+    Validate a list of replayed readings in a single pass.
+
+    Each item is either ``{"timestamp": ..., "data": {...}}`` or a flat
+    object holding the sensor fields next to its ``timestamp``. Returns the
+    valid (reading, battery_level) pairs sorted by timestamp, the payload of
+    the newest valid item, and a list of ``{"index", "error"}`` rejections.
+    """
+    now = timezone.now()
+    latest_allowed = now + timedelta(seconds=getattr(settings, 'SENSOR_BATCH_MAX_CLOCK_SKEW', 300))
+    max_age = getattr(settings, 'SENSOR_BATCH_MAX_AGE', 604800)
+    earliest_allowed = now - timedelta(seconds=max_age) if max_age > 0 else None
+
+    accepted = []
+    rejected = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise InvalidReading('reading must be an object')
+            sensor_data = item.get('data', item)
+            if not isinstance(sensor_data, dict):
+                raise InvalidReading('data must be an object')
+
+            timestamp = parse_timestamp(item.get('timestamp', sensor_data.get('timestamp')))
+            if timestamp > latest_allowed:
+                raise InvalidReading('timestamp is in the future')
+            if earliest_allowed is not None and timestamp < earliest_allowed:
+                raise InvalidReading('timestamp is too old')
+
+            validate_sensor_data(sensor_data)
+            battery_level = sensor_data.get('battery_level')
+        except InvalidReading as e:
+            rejected.append({'index': index, 'error': str(e)})
+            continue
+
+        reading = build_reading(device, sensor_data)
+        reading.timestamp = timestamp
+        battery_level = int(battery_level) if battery_level is not None else None
+        accepted.append((reading, battery_level, sensor_data))
+
+    accepted.sort(key=lambda entry: entry[0].timestamp)
+    latest_data = accepted[-1][2] if accepted else None
+    entries = [(reading, battery_level) for reading, battery_level, _ in accepted]
+    return entries, latest_data, rejected
+
+
+def save_reading(reading, battery_level=None):
+    """Store one reading and refresh its device in a single transaction"""
+    with transaction.atomic():
+        reading.save()
+        update_battery_levels([(reading, battery_level)])
+        update_latest([reading])
+        rollups.apply_readings([reading])
+    return reading
+
+
+def bulk_insert_readings(entries):
+    """Store (reading, battery_level) pairs and refresh their devices in a single transaction"""
+    with transaction.atomic():
+        readings = SensorReading.objects.bulk_create([reading for reading, _ in entries])
+        update_battery_levels(entries)
+        update_latest(readings)
+        rollups.apply_readings(readings)
+    return entries
+
+
+def write_isolated(entries):
+    """
+    Store (reading, battery_level) pairs, isolating readings that cannot be written.
+
+    The entries are inserted together first. If that fails, each reading is
+    retried in its own transaction so one bad row cannot take the rest of
+    the batch with it. Returns one exception (or None) per entry.
+    """
+    try:
+        bulk_insert_readings(entries)
+        return [None] * len(entries)
+    except Exception as e:
+        if len(entries) == 1:
+            return [e]
+        logger.warning('Bulk insert of %d sensor readings failed (%s); retrying one by one', len(entries), e)
+
+    errors = []
+    for entry in entries:
+        try:
+            bulk_insert_readings([entry])
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+def update_battery_levels(entries):
+    """
+    Store the latest battery level reported in (reading, battery_level) pairs.
+
+    Status and last-seen time are left to the presence sweep, so a reading
+    committed after a disconnect cannot mark the device online again.
+    """
+    # Latest reported battery level per device, in arrival order
+    batteries = {}
+    for reading, battery_level in entries:
+        if battery_level is not None:
+            batteries[reading.device_id] = battery_level
+    if not batteries:
+        return
+
+    if len(batteries) == 1:
+        device_id, battery_level = batteries.popitem()
+        Device.objects.filter(pk=device_id).update(battery_level=battery_level)
+        return
+    Device.objects.bulk_update(
+        [Device(pk=device_id, battery_level=battery_level) for device_id, battery_level in batteries.items()],
+        ['battery_level'],
+    )
+
+
+def update_latest(readings):
+    """
+    Copy the newest of ``readings`` into each device's LatestReading.
+
+    Rows are only replaced by a reading at least as new as the one they
+    hold, so replayed or out-of-order batches never move a device back in
+    time. This is one conditional upsert, so no rows are read or locked
+    beforehand.
+    """
+    newest = {}
+    for reading in readings:
+        current = newest.get(reading.device_id)
+        if current is None or reading.timestamp >= current.timestamp:
+            newest[reading.device_id] = reading
+    if not newest:
+        return
+
+    fields = {field.attname: field for field in LatestReading._meta.concrete_fields}
+    columns = ['device_id', *_LATEST_COLUMNS]
+    rows = []
+    for reading in newest.values():
+        row = _latest_from(reading)
+        rows.append([fields[column].get_db_prep_save(getattr(row, column), connection) for column in columns])
+    rollups.execute_upsert(_latest_upsert_sql(columns), columns, rows)
+
+
+# Columns rewritten when a newer reading arrives. timestamp comes last:
+# MySQL applies assignments left to right and the others compare against it.
+_LATEST_COLUMNS = ['reading_id', *SENSOR_FIELDS, 'timestamp']
+
+
+def _latest_from(reading):
+    return LatestReading(
+        device_id=reading.device_id,
+        reading_id=reading.pk,
+        timestamp=reading.timestamp,
+        **{field: getattr(reading, field) for field in SENSOR_FIELDS}
+    )
+
+
+def _latest_upsert_sql(columns):
+    """``INSERT ... VALUES %(values)s`` that replaces a LatestReading only with a reading at least as new"""
+    qn = connection.ops.quote_name
+    table = qn(LatestReading._meta.db_table)
+    suffix, new = rollups.upsert_syntax(('device_id',))
+    newer = f'{new(qn("timestamp"))} >= {table}.{qn("timestamp")}'
+    assignments = ', '.join(
+        f'{qn(column)} = CASE WHEN {newer} THEN {new(qn(column))} ELSE {table}.{qn(column)} END'
+        for column in _LATEST_COLUMNS
+    )
+    return (
+        f'INSERT INTO {table} ({", ".join(qn(column) for column in columns)}) '
+        f'VALUES %(values)s {suffix} {assignments}'
+    )
+
+
+class ReadingBuffer:
+    """
+    Per-worker write-behind buffer for sensor readings.
+
+    ``add()`` queues a reading and returns a future that resolves to the
+    saved reading once its batch has been committed, or raises if the
+    batch could not be written. The buffer is bounded: when
+    ``max_pending`` readings are waiting, callers are held back until a
+    flush has made room.
+    """
+
+    def __init__(self, max_batch_size=500, flush_interval=1.0, max_pending=5000, early_ack=False):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, max_batch_size)
+        self.early_ack = early_ack
+
+        self._pending = []
+        self._flush_lock = None
+        self._timer = None
+
+        # Flush statistics, reported in the log after every flush
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.last_flush_seconds = None
+        self.max_flush_seconds = 0.0
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, reading, battery_level=None):
+        """
+        Queue a reading and return a future for its durable write.
+
+        Raises InvalidReading, without queueing anything, for readings the
+        database would refuse.
+        """
+        validate_sensor_data({
+            **{field: getattr(reading, field) for field in SENSOR_FIELDS},
+            'battery_level': battery_level,
+        })
+        while len(self._pending) >= self.max_pending:
+            await self.flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((reading, battery_level, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            spawn(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self._on_timer
+            )
+        return future
+
+    def _on_timer(self):
+        self._timer = None
+        spawn(self.flush())
+
+    async def flush(self):
+        """Write the oldest pending batch to the database"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+
+            entries = [(reading, battery_level) for reading, battery_level, _ in batch]
+            started = time.perf_counter()
+            try:
+                errors = await database_call(write_isolated)(entries)
+            except Exception as e:
+                errors = [e] * len(batch)  # The database thread itself failed
+            self._record_flush(len(batch), time.perf_counter() - started)
+
+            for (reading, _, future), error in zip(batch, errors):
+                if error is not None:
+                    self.failed_rows += 1
+                    logger.error('Failed to store a sensor reading of device %s: %s', reading.device_id, error)
+                if not future.done():
+                    if error is None:
+                        future.set_result(reading)
+                    else:
+                        future.set_exception(error)
+
+        # Keep draining if more readings arrived while we were writing
+        if self._pending:
+            if len(self._pending) >= self.max_batch_size:
+                spawn(self.flush())
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(
+                    self.flush_interval, self._on_timer
+                )
+
+    def _record_flush(self, rows, seconds):
+        SAVE_SECONDS.labels('buffer_flush').observe(seconds)
+        self.flush_count += 1
+        self.flushed_rows += rows
+        self.last_flush_seconds = seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+        logger.debug(
+            'Flushed %d sensor readings in %.1f ms (%d pending)',
+            rows, seconds * 1000, len(self._pending)
+        )
+
+    def flush_sync(self):
+        """Write everything still pending; used when the process exits"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+
+            started = time.perf_counter()
+            errors = write_isolated([(reading, battery_level) for reading, battery_level, _ in batch])
+            self._record_flush(len(batch), time.perf_counter() - started)
+            failed = sum(error is not None for error in errors)
+            if failed:
+                self.failed_rows += failed
+                logger.error('Failed to store %d sensor readings on shutdown', failed)
+
+
+_buffer = None
+
+
+def get_buffer():
+    """Return this worker's ReadingBuffer, or None when buffering is disabled"""
+    global _buffer
+
+    if not getattr(settings, 'SENSOR_BUFFER_ENABLED', False):
+        return None
+
+    if _buffer is None:
+        _buffer = ReadingBuffer(
+            max_batch_size=getattr(settings, 'SENSOR_BUFFER_MAX_BATCH', 500),
+            flush_interval=getattr(settings, 'SENSOR_BUFFER_FLUSH_INTERVAL', 1.0),
+            max_pending=getattr(settings, 'SENSOR_BUFFER_MAX_PENDING', 5000),
+            early_ack=getattr(settings, 'SENSOR_BUFFER_EARLY_ACK', False),
+        )
+    return _buffer
+
+
+def _flush_at_exit():
+    if _buffer is not None:
+        _buffer.flush_sync()
+
+
+def flush_at_exit():
+    """
+    Write readings still in this worker's buffer when the process exits.
+
+    Called by the ASGI entry point only, like ``presence.flush_at_exit``.
+    """
+    atexit.register(_flush_at_exit)
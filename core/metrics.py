@@ -0,0 +1,384 @@
+"""
+Application metrics, exposed in the Prometheus text format at /metrics.
+
+Metrics are created once at import time of the module that owns them:
+
+    CACHE_HITS = metrics.counter('soysmart_cache_hits_total', 'SoySmart predictions served from cache')
+    CACHE_HITS.inc()
+
+    STAGE_SECONDS = metrics.histogram('soysmart_stage_seconds', 'Time per stage', labelnames=('stage',))
+    STAGE_SECONDS.labels('decode').observe(0.012)
+
+Metrics live in the memory of the process that records them; updating
+one takes a lock and an addition. With several Daphne processes behind
+one address, set ``METRICS_MULTIPROCESS_DIR``: every process then writes
+a snapshot of its metrics there every ``METRICS_WRITE_INTERVAL`` seconds
+(``start_writer()``), and /metrics merges the snapshots of all processes.
+Counters and histograms are summed, including those of processes that
+have exited; gauges are combined according to their ``aggregate`` mode
+and only count live processes.
+"""
+import bisect
+import fcntl
+import functools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, from sub-millisecond stages up to model loading
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _CounterValue:
+    def __init__(self, metric):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class _GaugeValue(_CounterValue):
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    def __init__(self, metric):
+        self.buckets = metric.buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            yield f'{name}_bucket', {**labels, 'le': bound}, cumulative
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, cumulative
+
+
+class Metric:
+    """
+    A named metric, optionally split by labels.
+
+    ``labels(*values)`` returns the child for one combination of label
+    values; metrics without labels are used directly.
+    """
+
+    type = None
+    value_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._unlabelled = None if self.labelnames else self.labels()
+
+    def labels(self, *values, **named):
+        if named:
+            values = tuple(named[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(key, self.value_class(self))
+        return child
+
+    def samples(self):
+        for key, child in sorted(self._children.items()):
+            yield from child.samples(self.name, dict(zip(self.labelnames, key)))
+
+
+class Counter(Metric):
+    """A monotonically increasing count"""
+
+    type = 'counter'
+    value_class = _CounterValue
+
+    def inc(self, amount=1):
+        self._unlabelled.inc(amount)
+
+    @property
+    def value(self):
+        return self._unlabelled.value
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down.
+
+    ``aggregate`` says how the values of several processes are combined:
+    ``'all'`` keeps one series per process (with a ``pid`` label),
+    ``'sum'``, ``'max'`` and ``'min'`` merge them into one.
+    """
+
+    type = 'gauge'
+    value_class = _GaugeValue
+
+    def __init__(self, name, documentation, labelnames=(), aggregate='all'):
+        if aggregate not in _GAUGE_AGGREGATES:
+            raise ValueError(f'Unknown gauge aggregate: {aggregate}')
+        self.aggregate = aggregate
+        super().__init__(name, documentation, labelnames)
+
+    def set(self, value):
+        self._unlabelled.set(value)
+
+    def inc(self, amount=1):
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled.dec(amount)
+
+    @property
+    def value(self):
+        return self._unlabelled.value
+
+    def track_inprogress(self):
+        """Decorator for async functions: the gauge counts calls that have not returned yet"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                self.inc()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.dec()
+            return wrapper
+        return decorator
+
+
+_GAUGE_AGGREGATES = {'all': None, 'sum': sum, 'max': max, 'min': min}
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative ``le`` buckets"""
+
+    type = 'histogram'
+    value_class = _HistogramValue
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value):
+        self._unlabelled.observe(value)
+
+
+def _register(cls, name, documentation, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Return the counter called ``name``, creating it on first use"""
+    return _register(Counter, name, documentation, labelnames=labelnames)
+
+
+def gauge(name, documentation, labelnames=(), aggregate='all'):
+    """Return the gauge called ``name``, creating it on first use"""
+    return _register(Gauge, name, documentation, labelnames=labelnames, aggregate=aggregate)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Return the histogram called ``name``, creating it on first use"""
+    return _register(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = _format_value(value) if isinstance(value, (int, float)) else value
+        value = value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def snapshot():
+    """This process's metrics as a JSON-serializable dict"""
+    return {
+        name: {
+            'type': metric.type,
+            'documentation': metric.documentation,
+            'aggregate': getattr(metric, 'aggregate', None),
+            'samples': list(metric.samples()),
+        }
+        for name, metric in list(_registry.items())
+    }
+
+
+def multiprocess_dir():
+    """Directory shared by the processes whose metrics are merged, or None"""
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', '') or None
+
+
+def write_snapshot(directory=None):
+    """Atomically replace this process's snapshot file"""
+    directory = directory or multiprocess_dir()
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+_writer = None
+
+
+def start_writer(interval=None):
+    """Write this process's snapshot every ``interval`` seconds in a background thread"""
+    global _writer
+
+    directory = multiprocess_dir()
+    if directory is None or _writer is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    interval = interval or getattr(settings, 'METRICS_WRITE_INTERVAL', 5)
+
+    def run():
+        while True:
+            try:
+                write_snapshot(directory)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    _writer = threading.Thread(target=run, name='metrics-writer', daemon=True)
+    _writer.start()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(families, snapshot, pid=None):
+    """Fold one process's snapshot into ``families``; ``pid`` is None for exited processes"""
+    for name, family in snapshot.items():
+        if family['type'] == 'gauge' and pid is None:
+            continue  # A dead process no longer holds connections or memory
+        merged = families.setdefault(name, {**family, 'samples': {}})
+        aggregate = _GAUGE_AGGREGATES.get(family['aggregate']) if family['type'] == 'gauge' else sum
+        for sample, labels, value in family['samples']:
+            if family['type'] == 'gauge' and aggregate is None:
+                labels = {**labels, 'pid': pid}
+            key = (sample, tuple(labels.items()))
+            if key in merged['samples']:
+                value = aggregate([merged['samples'][key], value])
+            merged['samples'][key] = value
+
+
+def collect(directory=None):
+    """
+    Metrics of every process sharing ``directory``, merged.
+
+    Snapshots of processes that have exited are folded into ``dead.json``
+    (counters and histograms only) and removed.
+    """
+    directory = directory or multiprocess_dir()
+    write_snapshot(directory)
+    families = {}
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead_path = os.path.join(directory, 'dead.json')
+        dead = {}
+        if os.path.exists(dead_path):
+            with open(dead_path) as f:
+                _merge(dead, json.load(f))
+        dead_changed = False
+
+        for filename in os.listdir(directory):
+            stem, ext = os.path.splitext(filename)
+            if ext != '.json' or not stem.isdigit():
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path) as f:
+                    process = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if _alive(int(stem)):
+                _merge(families, process, pid=stem)
+            else:
+                _merge(dead, process)
+                os.unlink(path)
+                dead_changed = True
+
+        if dead_changed:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    name: {**family, 'samples': [[sample, dict(labels), value] for (sample, labels), value in family['samples'].items()]}
+                    for name, family in dead.items()
+                }, f)
+            os.replace(tmp, dead_path)
+
+    for name, family in dead.items():
+        merged = families.setdefault(name, {**family, 'samples': {}})
+        for key, value in family['samples'].items():
+            merged['samples'][key] = merged['samples'].get(key, 0) + value
+    return {
+        name: {**family, 'samples': [(sample, dict(labels), value) for (sample, labels), value in family['samples'].items()]}
+        for name, family in families.items()
+    }
+
+
+def render():
+    """All metrics in the Prometheus text exposition format, merged across processes when configured"""
+    families = collect() if multiprocess_dir() else snapshot()
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f'# HELP {name} {family["documentation"]}')
+        lines.append(f'# TYPE {name} {family["type"]}')
+        for sample, labels, value in family['samples']:
+            lines.append(f'{sample}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
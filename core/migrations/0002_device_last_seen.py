@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, help_text='Timestamp when the server last received a message from the device.', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_device_last_seen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Timestamp when the data was measured; defaults to when the server received it.'),
+        ),
+    ]
@@ -0,0 +1,173 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_sensorreading_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket (local time boundaries).')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of readings in the bucket.')),
+                ('last_reading_at', models.DateTimeField(blank=True, help_text='Timestamp of the newest reading in the bucket.', null=True)),
+                ('wind_direction', models.CharField(blank=True, help_text='Wind direction of the newest reading in the bucket.', max_length=50, null=True)),
+                ('air_temperature_min', models.FloatField(blank=True, null=True)),
+                ('air_temperature_max', models.FloatField(blank=True, null=True)),
+                ('air_temperature_sum', models.FloatField(default=0)),
+                ('air_temperature_count', models.PositiveIntegerField(default=0)),
+                ('air_humidity_min', models.FloatField(blank=True, null=True)),
+                ('air_humidity_max', models.FloatField(blank=True, null=True)),
+                ('air_humidity_sum', models.FloatField(default=0)),
+                ('air_humidity_count', models.PositiveIntegerField(default=0)),
+                ('soil_moisture_min', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_max', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_sum', models.FloatField(default=0)),
+                ('soil_moisture_count', models.PositiveIntegerField(default=0)),
+                ('soil_ph_min', models.FloatField(blank=True, null=True)),
+                ('soil_ph_max', models.FloatField(blank=True, null=True)),
+                ('soil_ph_sum', models.FloatField(default=0)),
+                ('soil_ph_count', models.PositiveIntegerField(default=0)),
+                ('wind_speed_min', models.FloatField(blank=True, null=True)),
+                ('wind_speed_max', models.FloatField(blank=True, null=True)),
+                ('wind_speed_sum', models.FloatField(default=0)),
+                ('wind_speed_count', models.PositiveIntegerField(default=0)),
+                ('nitrogen_min', models.FloatField(blank=True, null=True)),
+                ('nitrogen_max', models.FloatField(blank=True, null=True)),
+                ('nitrogen_sum', models.FloatField(default=0)),
+                ('nitrogen_count', models.PositiveIntegerField(default=0)),
+                ('phosphorus_min', models.FloatField(blank=True, null=True)),
+                ('phosphorus_max', models.FloatField(blank=True, null=True)),
+                ('phosphorus_sum', models.FloatField(default=0)),
+                ('phosphorus_count', models.PositiveIntegerField(default=0)),
+                ('potassium_min', models.FloatField(blank=True, null=True)),
+                ('potassium_max', models.FloatField(blank=True, null=True)),
+                ('potassium_sum', models.FloatField(default=0)),
+                ('potassium_count', models.PositiveIntegerField(default=0)),
+                ('rainfall_min', models.FloatField(blank=True, null=True)),
+                ('rainfall_max', models.FloatField(blank=True, null=True)),
+                ('rainfall_sum', models.FloatField(default=0)),
+                ('rainfall_count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(help_text='The device whose readings are aggregated.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'day rollup',
+                'ordering': ['-bucket'],
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='core_dayrollup_device_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket (local time boundaries).')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of readings in the bucket.')),
+                ('last_reading_at', models.DateTimeField(blank=True, help_text='Timestamp of the newest reading in the bucket.', null=True)),
+                ('wind_direction', models.CharField(blank=True, help_text='Wind direction of the newest reading in the bucket.', max_length=50, null=True)),
+                ('air_temperature_min', models.FloatField(blank=True, null=True)),
+                ('air_temperature_max', models.FloatField(blank=True, null=True)),
+                ('air_temperature_sum', models.FloatField(default=0)),
+                ('air_temperature_count', models.PositiveIntegerField(default=0)),
+                ('air_humidity_min', models.FloatField(blank=True, null=True)),
+                ('air_humidity_max', models.FloatField(blank=True, null=True)),
+                ('air_humidity_sum', models.FloatField(default=0)),
+                ('air_humidity_count', models.PositiveIntegerField(default=0)),
+                ('soil_moisture_min', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_max', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_sum', models.FloatField(default=0)),
+                ('soil_moisture_count', models.PositiveIntegerField(default=0)),
+                ('soil_ph_min', models.FloatField(blank=True, null=True)),
+                ('soil_ph_max', models.FloatField(blank=True, null=True)),
+                ('soil_ph_sum', models.FloatField(default=0)),
+                ('soil_ph_count', models.PositiveIntegerField(default=0)),
+                ('wind_speed_min', models.FloatField(blank=True, null=True)),
+                ('wind_speed_max', models.FloatField(blank=True, null=True)),
+                ('wind_speed_sum', models.FloatField(default=0)),
+                ('wind_speed_count', models.PositiveIntegerField(default=0)),
+                ('nitrogen_min', models.FloatField(blank=True, null=True)),
+                ('nitrogen_max', models.FloatField(blank=True, null=True)),
+                ('nitrogen_sum', models.FloatField(default=0)),
+                ('nitrogen_count', models.PositiveIntegerField(default=0)),
+                ('phosphorus_min', models.FloatField(blank=True, null=True)),
+                ('phosphorus_max', models.FloatField(blank=True, null=True)),
+                ('phosphorus_sum', models.FloatField(default=0)),
+                ('phosphorus_count', models.PositiveIntegerField(default=0)),
+                ('potassium_min', models.FloatField(blank=True, null=True)),
+                ('potassium_max', models.FloatField(blank=True, null=True)),
+                ('potassium_sum', models.FloatField(default=0)),
+                ('potassium_count', models.PositiveIntegerField(default=0)),
+                ('rainfall_min', models.FloatField(blank=True, null=True)),
+                ('rainfall_max', models.FloatField(blank=True, null=True)),
+                ('rainfall_sum', models.FloatField(default=0)),
+                ('rainfall_count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(help_text='The device whose readings are aggregated.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'hour rollup',
+                'ordering': ['-bucket'],
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='core_hourrollup_device_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MinuteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket (local time boundaries).')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of readings in the bucket.')),
+                ('last_reading_at', models.DateTimeField(blank=True, help_text='Timestamp of the newest reading in the bucket.', null=True)),
+                ('wind_direction', models.CharField(blank=True, help_text='Wind direction of the newest reading in the bucket.', max_length=50, null=True)),
+                ('air_temperature_min', models.FloatField(blank=True, null=True)),
+                ('air_temperature_max', models.FloatField(blank=True, null=True)),
+                ('air_temperature_sum', models.FloatField(default=0)),
+                ('air_temperature_count', models.PositiveIntegerField(default=0)),
+                ('air_humidity_min', models.FloatField(blank=True, null=True)),
+                ('air_humidity_max', models.FloatField(blank=True, null=True)),
+                ('air_humidity_sum', models.FloatField(default=0)),
+                ('air_humidity_count', models.PositiveIntegerField(default=0)),
+                ('soil_moisture_min', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_max', models.FloatField(blank=True, null=True)),
+                ('soil_moisture_sum', models.FloatField(default=0)),
+                ('soil_moisture_count', models.PositiveIntegerField(default=0)),
+                ('soil_ph_min', models.FloatField(blank=True, null=True)),
+                ('soil_ph_max', models.FloatField(blank=True, null=True)),
+                ('soil_ph_sum', models.FloatField(default=0)),
+                ('soil_ph_count', models.PositiveIntegerField(default=0)),
+                ('wind_speed_min', models.FloatField(blank=True, null=True)),
+                ('wind_speed_max', models.FloatField(blank=True, null=True)),
+                ('wind_speed_sum', models.FloatField(default=0)),
+                ('wind_speed_count', models.PositiveIntegerField(default=0)),
+                ('nitrogen_min', models.FloatField(blank=True, null=True)),
+                ('nitrogen_max', models.FloatField(blank=True, null=True)),
+                ('nitrogen_sum', models.FloatField(default=0)),
+                ('nitrogen_count', models.PositiveIntegerField(default=0)),
+                ('phosphorus_min', models.FloatField(blank=True, null=True)),
+                ('phosphorus_max', models.FloatField(blank=True, null=True)),
+                ('phosphorus_sum', models.FloatField(default=0)),
+                ('phosphorus_count', models.PositiveIntegerField(default=0)),
+                ('potassium_min', models.FloatField(blank=True, null=True)),
+                ('potassium_max', models.FloatField(blank=True, null=True)),
+                ('potassium_sum', models.FloatField(default=0)),
+                ('potassium_count', models.PositiveIntegerField(default=0)),
+                ('rainfall_min', models.FloatField(blank=True, null=True)),
+                ('rainfall_max', models.FloatField(blank=True, null=True)),
+                ('rainfall_sum', models.FloatField(default=0)),
+                ('rainfall_count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(help_text='The device whose readings are aggregated.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'minute rollup',
+                'ordering': ['-bucket'],
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='core_minuterollup_device_bucket')],
+            },
+        ),
+    ]
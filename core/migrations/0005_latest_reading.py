@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SENSOR_FIELDS = (
+    'air_temperature',
+    'air_humidity',
+    'soil_moisture',
+    'soil_ph',
+    'wind_speed',
+    'wind_direction',
+    'nitrogen',
+    'phosphorus',
+    'potassium',
+    'rainfall',
+)
+
+
+def backfill_latest_readings(apps, schema_editor):
+    Device = apps.get_model('core', 'Device')
+    SensorReading = apps.get_model('core', 'SensorReading')
+    LatestReading = apps.get_model('core', 'LatestReading')
+
+    latest = []
+    for device_id in Device.objects.values_list('pk', flat=True).iterator():
+        reading = SensorReading.objects.filter(device_id=device_id).order_by('-timestamp').first()
+        if reading is None:
+            continue
+        latest.append(LatestReading(
+            device_id=device_id,
+            reading_id=reading.pk,
+            timestamp=reading.timestamp,
+            **{field: getattr(reading, field) for field in SENSOR_FIELDS}
+        ))
+    LatestReading.objects.bulk_create(latest, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_reading_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestReading',
+            fields=[
+                ('device', models.OneToOneField(help_text='The device this reading belongs to.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_reading', serialize=False, to='core.device')),
+                ('reading_id', models.BigIntegerField(blank=True, help_text='ID of the copied SensorReading, when the database reported it.', null=True)),
+                ('timestamp', models.DateTimeField(help_text='Timestamp of the copied reading.')),
+                ('air_temperature', models.FloatField(blank=True, null=True)),
+                ('air_humidity', models.FloatField(blank=True, null=True)),
+                ('soil_moisture', models.FloatField(blank=True, null=True)),
+                ('soil_ph', models.FloatField(blank=True, null=True)),
+                ('wind_speed', models.FloatField(blank=True, null=True)),
+                ('wind_direction', models.CharField(blank=True, max_length=50, null=True)),
+                ('nitrogen', models.FloatField(blank=True, null=True)),
+                ('phosphorus', models.FloatField(blank=True, null=True)),
+                ('potassium', models.FloatField(blank=True, null=True)),
+                ('rainfall', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_latest_readings, migrations.RunPython.noop),
+    ]
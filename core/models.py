@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class Device(models.Model):
     """
@@ -27,6 +28,11 @@ class Device(models.Model):
         blank=True,
         help_text="The last reported battery level percentage (0-100)."
     )
+    last_seen = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Timestamp when the server last received a message from the device."
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         help_text="Timestamp when the device was first registered in the system."
@@ -50,8 +56,8 @@ class SensorReading(models.Model):
         help_text="The device that this reading originated from."
     )
     timestamp = models.DateTimeField(
-        auto_now_add=True,
-        help_text="Timestamp when the data was received by the server."
+        default=timezone.now,
+        help_text="Timestamp when the data was measured; defaults to when the server received it."
     )
 
     # Sensor Data Fields
@@ -75,4 +81,147 @@ class SensorReading(models.Model):
 
     def __str__(self) -> str:
         """String representation of the SensorReading model."""
-        return f"Reading for {self.device.name} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Reading for {self.device.name} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class LatestReading(models.Model):
+    """
+    Denormalized copy of the newest sensor reading of each device.
+
+    Updated in the same transaction that stores readings, so dashboards can
+    load every device together with its current values in a single query
+    instead of looking up the newest SensorReading per device.
+    """
+    device = models.OneToOneField(
+        Device,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='latest_reading',
+        help_text="The device this reading belongs to."
+    )
+    reading_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="ID of the copied SensorReading, when the database reported it."
+    )
+    timestamp = models.DateTimeField(help_text="Timestamp of the copied reading.")
+
+    air_temperature = models.FloatField(null=True, blank=True)
+    air_humidity = models.FloatField(null=True, blank=True)
+    soil_moisture = models.FloatField(null=True, blank=True)
+    soil_ph = models.FloatField(null=True, blank=True)
+    wind_speed = models.FloatField(null=True, blank=True)
+    wind_direction = models.CharField(max_length=50, null=True, blank=True)
+    nitrogen = models.FloatField(null=True, blank=True)
+    phosphorus = models.FloatField(null=True, blank=True)
+    potassium = models.FloatField(null=True, blank=True)
+    rainfall = models.FloatField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        """String representation of the LatestReading model."""
+        return f"Latest reading for device {self.device_id} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class ReadingRollup(models.Model):
+    """
+    Aggregated sensor readings of one device over a fixed time bucket.
+
+    For every numeric sensor field the rollup keeps the minimum, maximum,
+    sum and number of non-null values, so buckets can be merged
+    incrementally and the mean is ``sum / count``. Rainfall totals are the
+    ``rainfall_sum`` column. Concrete subclasses exist per bucket size.
+    """
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text="The device whose readings are aggregated."
+    )
+    bucket = models.DateTimeField(help_text="Start of the time bucket (local time boundaries).")
+    count = models.PositiveIntegerField(default=0, help_text="Number of readings in the bucket.")
+    last_reading_at = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the newest reading in the bucket.")
+    wind_direction = models.CharField(max_length=50, null=True, blank=True, help_text="Wind direction of the newest reading in the bucket.")
+
+    air_temperature_min = models.FloatField(null=True, blank=True)
+    air_temperature_max = models.FloatField(null=True, blank=True)
+    air_temperature_sum = models.FloatField(default=0)
+    air_temperature_count = models.PositiveIntegerField(default=0)
+
+    air_humidity_min = models.FloatField(null=True, blank=True)
+    air_humidity_max = models.FloatField(null=True, blank=True)
+    air_humidity_sum = models.FloatField(default=0)
+    air_humidity_count = models.PositiveIntegerField(default=0)
+
+    soil_moisture_min = models.FloatField(null=True, blank=True)
+    soil_moisture_max = models.FloatField(null=True, blank=True)
+    soil_moisture_sum = models.FloatField(default=0)
+    soil_moisture_count = models.PositiveIntegerField(default=0)
+
+    soil_ph_min = models.FloatField(null=True, blank=True)
+    soil_ph_max = models.FloatField(null=True, blank=True)
+    soil_ph_sum = models.FloatField(default=0)
+    soil_ph_count = models.PositiveIntegerField(default=0)
+
+    wind_speed_min = models.FloatField(null=True, blank=True)
+    wind_speed_max = models.FloatField(null=True, blank=True)
+    wind_speed_sum = models.FloatField(default=0)
+    wind_speed_count = models.PositiveIntegerField(default=0)
+
+    nitrogen_min = models.FloatField(null=True, blank=True)
+    nitrogen_max = models.FloatField(null=True, blank=True)
+    nitrogen_sum = models.FloatField(default=0)
+    nitrogen_count = models.PositiveIntegerField(default=0)
+
+    phosphorus_min = models.FloatField(null=True, blank=True)
+    phosphorus_max = models.FloatField(null=True, blank=True)
+    phosphorus_sum = models.FloatField(default=0)
+    phosphorus_count = models.PositiveIntegerField(default=0)
+
+    potassium_min = models.FloatField(null=True, blank=True)
+    potassium_max = models.FloatField(null=True, blank=True)
+    potassium_sum = models.FloatField(default=0)
+    potassium_count = models.PositiveIntegerField(default=0)
+
+    rainfall_min = models.FloatField(null=True, blank=True)
+    rainfall_max = models.FloatField(null=True, blank=True)
+    rainfall_sum = models.FloatField(default=0)
+    rainfall_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Metadata options shared by all rollup models."""
+        abstract = True
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'bucket'], name='%(app_label)s_%(class)s_device_bucket'),
+        ]
+
+    def mean(self, field):
+        """Mean of a numeric sensor field over the bucket, or None without values."""
+        count = getattr(self, f'{field}_count')
+        return getattr(self, f'{field}_sum') / count if count else None
+
+    def __str__(self) -> str:
+        """String representation of a rollup bucket."""
+        return f"{self._meta.verbose_name} for {self.device_id} at {self.bucket.strftime('%Y-%m-%d %H:%M')}"
+
+
+class MinuteRollup(ReadingRollup):
+    """Per-device sensor aggregates for each minute."""
+
+    class Meta(ReadingRollup.Meta):
+        """Metadata options for the MinuteRollup model."""
+        verbose_name = 'minute rollup'
+
+
+class HourRollup(ReadingRollup):
+    """Per-device sensor aggregates for each hour."""
+
+    class Meta(ReadingRollup.Meta):
+        """Metadata options for the HourRollup model."""
+        verbose_name = 'hour rollup'
+
+
+class DayRollup(ReadingRollup):
+    """Per-device sensor aggregates for each local calendar day."""
+
+    class Meta(ReadingRollup.Meta):
+        """Metadata options for the DayRollup model."""
+        verbose_name = 'day rollup'
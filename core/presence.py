@@ -0,0 +1,223 @@
+"""
+Device presence tracking.
+
+Each worker keeps the online state and last-seen time of the devices
+connected to it in memory, refreshed by connects, heartbeats and readings.
+A periodic sweeper task then:
+
+* writes the accumulated status and last-seen changes to the database
+  with one bulk update per status,
+* marks devices that have been silent for ``DEVICE_STALE_AFTER`` seconds
+  as offline, including devices left "online" by a worker that crashed
+  before its ``disconnect`` ran, and
+* refreshes a fleet-wide snapshot of online devices, which dashboards
+  read instead of querying the database on every request.
+"""
+import asyncio
+import atexit
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import ingest
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+ONLINE = 'online'
+OFFLINE = 'offline'
+
+
+class _Connection:
+    __slots__ = ('device_uuid', 'name', 'battery_level', 'last_seen', 'stale')
+
+    def __init__(self, device, last_seen):
+        self.device_uuid = device.device_uuid
+        self.name = device.name
+        self.battery_level = device.battery_level
+        self.last_seen = last_seen
+        self.stale = False
+
+    def as_dict(self):
+        return {
+            'device_uuid': self.device_uuid,
+            'name': self.name,
+            'status': ONLINE,
+            'battery_level': self.battery_level,
+        }
+
+
+class PresenceTracker:
+    """In-memory presence for one worker, written to the database in batches"""
+
+    def __init__(self, stale_after=600, sweep_interval=15):
+        self.stale_after = timedelta(seconds=stale_after)
+        self.sweep_interval = sweep_interval
+
+        self._connections = {}  # device pk -> _Connection for devices on this worker
+        self._pending = {}      # device pk -> (status, last_seen, device_uuid) not yet written
+        self._online = None     # device_uuid -> dict, fleet-wide snapshot
+        self._task = None
+        self._sweep_lock = None
+
+        self.sweeps = 0
+        self.expired = 0
+
+    def start(self):
+        """Start the sweeper task on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception('Presence sweep failed')
+
+    def connected(self, device):
+        """Record that a device opened a connection to this worker"""
+        now = timezone.now()
+        self._connections[device.pk] = connection = _Connection(device, now)
+        self._pending[device.pk] = (ONLINE, now, device.device_uuid)
+        if self._online is not None:
+            self._online[device.device_uuid] = connection.as_dict()
+
+    def seen(self, device, battery_level=None):
+        """Record a heartbeat or reading from a connected device"""
+        connection = self._connections.get(device.pk)
+        if connection is None:
+            return
+        connection.last_seen = timezone.now()
+        if battery_level is not None:
+            connection.battery_level = battery_level
+        connection.stale = False
+        self._pending[device.pk] = (ONLINE, connection.last_seen, connection.device_uuid)
+        if self._online is not None:
+            self._online[connection.device_uuid] = connection.as_dict()
+
+    def disconnected(self, device):
+        """Record that a device closed its connection to this worker"""
+        connection = self._connections.pop(device.pk, None)
+        last_seen = connection.last_seen if connection else timezone.now()
+        self._pending[device.pk] = (OFFLINE, last_seen, device.device_uuid)
+        if self._online is not None:
+            self._online.pop(device.device_uuid, None)
+
+    async def online_devices(self):
+        """Return the online devices across all workers"""
+        if self._online is None:
+            await self.sweep()
+        return list(self._online.values())
+
+    async def sweep(self):
+        """Write pending changes, expire silent devices and refresh the snapshot"""
+        if self._sweep_lock is None:
+            self._sweep_lock = asyncio.Lock()
+
+        async with self._sweep_lock:
+            now = timezone.now()
+            cutoff = now - self.stale_after
+
+            # Connected devices that stopped talking are offline until they speak again
+            for pk, connection in self._connections.items():
+                if not connection.stale and connection.last_seen < cutoff:
+                    connection.stale = True
+                    self._pending[pk] = (OFFLINE, connection.last_seen, connection.device_uuid)
+
+            pending, self._pending = self._pending, {}
+            try:
+                expired, online = await ingest.database_call(self._write)(pending, cutoff)
+            except Exception:
+                # Keep the changes for the next sweep unless newer ones arrived
+                for pk, change in pending.items():
+                    self._pending.setdefault(pk, change)
+                raise
+
+            self.sweeps += 1
+            self.expired += expired
+            if expired:
+                logger.info('Marked %d silent devices offline', expired)
+
+            snapshot = {device['device_uuid']: device for device in online}
+            # Local state, including changes made while we were in the
+            # database thread, wins over what the database returned
+            for status, _, device_uuid in self._pending.values():
+                if status == OFFLINE:
+                    snapshot.pop(device_uuid, None)
+            for connection in self._connections.values():
+                if connection.stale:
+                    snapshot.pop(connection.device_uuid, None)
+                else:
+                    snapshot[connection.device_uuid] = connection.as_dict()
+            self._online = snapshot
+
+    @staticmethod
+    def _write(pending, cutoff):
+        by_status = {}
+        for pk, (status, last_seen, _) in pending.items():
+            by_status.setdefault(status, []).append(
+                Device(pk=pk, status=status, last_seen=last_seen)
+            )
+
+        with transaction.atomic():
+            for devices in by_status.values():
+                Device.objects.bulk_update(devices, ['status', 'last_seen'])
+            expired = Device.objects.filter(status=ONLINE).filter(
+                Q(last_seen__lt=cutoff) | Q(last_seen__isnull=True)
+            ).update(status=OFFLINE)
+
+        online = list(Device.objects.filter(status=ONLINE).values(
+            'device_uuid', 'name', 'status', 'battery_level'
+        ))
+        return expired, online
+
+    def flush_sync(self):
+        """Mark this worker's devices offline and write pending changes; used at exit"""
+        if not self._connections and not self._pending:
+            return
+        for pk, connection in self._connections.items():
+            self._pending[pk] = (OFFLINE, connection.last_seen, connection.device_uuid)
+        self._connections.clear()
+
+        pending, self._pending = self._pending, {}
+        if pending:
+            try:
+                self._write(pending, timezone.now() - self.stale_after)
+            except Exception:
+                logger.exception('Failed to write device presence on shutdown')
+
+
+_tracker = None
+
+
+def get_tracker():
+    """Return this worker's PresenceTracker"""
+    global _tracker
+
+    if _tracker is None:
+        _tracker = PresenceTracker(
+            stale_after=getattr(settings, 'DEVICE_STALE_AFTER', 600),
+            sweep_interval=getattr(settings, 'PRESENCE_SWEEP_INTERVAL', 15),
+        )
+    return _tracker
+
+
+def _flush_at_exit():
+    if _tracker is not None:
+        _tracker.flush_sync()
+
+
+def flush_at_exit():
+    """
+    Write this worker's presence when the process exits.
+
+    Called by the ASGI entry point only, so management commands and test
+    runs never write to the configured database on their way out.
+    """
+    atexit.register(_flush_at_exit)
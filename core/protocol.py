@@ -0,0 +1,189 @@
+"""
+Compact binary encoding for device WebSocket frames.
+
+Devices that offer the ``glycine.bin.v1`` WebSocket subprotocol may send
+binary frames instead of JSON. Every frame starts with a two byte header,
+``<version:u8><message type:u8>``, followed by the message body. All
+numbers are little-endian.
+
+A sensor record is laid out as::
+
+    presence  u16      bit i set when field i of RECORD_FIELDS is present
+    values    9 x f32  numeric sensor fields, in NUMERIC_FIELDS order
+    battery   u8       battery level percentage
+    wind_len  u8       length of the UTF-8 wind direction that follows
+    wind      bytes
+
+Message bodies:
+
+    MSG_SENSOR_DATA   one sensor record
+    MSG_HEARTBEAT     empty
+    MSG_SENSOR_BATCH  count:u16, then count x (timestamp:f64 epoch seconds, sensor record)
+
+This module only depends on the standard library so it can be copied to
+device firmware unchanged.
+"""
+import math
+import struct
+
+SUBPROTOCOL = 'glycine.bin.v1'
+VERSION = 1
+
+MSG_SENSOR_DATA = 1
+MSG_HEARTBEAT = 2
+MSG_SENSOR_BATCH = 3
+
+MESSAGE_TYPES = {
+    MSG_SENSOR_DATA: 'sensor_data',
+    MSG_HEARTBEAT: 'heartbeat',
+    MSG_SENSOR_BATCH: 'sensor_batch',
+}
+
+NUMERIC_FIELDS = (
+    'air_temperature',
+    'air_humidity',
+    'soil_moisture',
+    'soil_ph',
+    'wind_speed',
+    'nitrogen',
+    'phosphorus',
+    'potassium',
+    'rainfall',
+)
+
+# Order of the presence bits
+RECORD_FIELDS = NUMERIC_FIELDS + ('battery_level', 'wind_direction')
+
+_HEADER = struct.Struct('<BB')
+_RECORD = struct.Struct('<H9fBB')
+_BATCH_COUNT = struct.Struct('<H')
+_TIMESTAMP = struct.Struct('<d')
+
+# float32 keeps about 7 significant digits; sensor values use far fewer
+_DECIMALS = 4
+
+
+class FrameError(ValueError):
+    """Raised when a binary frame cannot be decoded"""
+
+
+def _encode_record(data):
+    presence = 0
+    values = []
+    for bit, field in enumerate(NUMERIC_FIELDS):
+        value = data.get(field)
+        if value is None:
+            values.append(0.0)
+        else:
+            presence |= 1 << bit
+            values.append(float(value))
+
+    battery = data.get('battery_level')
+    if battery is not None:
+        presence |= 1 << RECORD_FIELDS.index('battery_level')
+        battery = max(0, min(int(battery), 255))
+    else:
+        battery = 0
+
+    wind = data.get('wind_direction')
+    if wind is not None:
+        presence |= 1 << RECORD_FIELDS.index('wind_direction')
+        # Cut on a character boundary so the bytes stay valid UTF-8
+        wind = wind.encode('utf-8')[:255].decode('utf-8', 'ignore').encode('utf-8')
+    else:
+        wind = b''
+
+    return _RECORD.pack(presence, *values, battery, len(wind)) + wind
+
+
+def _decode_record(frame, offset):
+    try:
+        presence, *values, battery, wind_len = _RECORD.unpack_from(frame, offset)
+    except struct.error:
+        raise FrameError('truncated sensor record')
+    offset += _RECORD.size
+
+    wind = frame[offset:offset + wind_len]
+    if len(wind) != wind_len:
+        raise FrameError('truncated wind direction')
+    offset += wind_len
+
+    data = {}
+    for bit, (field, value) in enumerate(zip(NUMERIC_FIELDS, values)):
+        if presence & (1 << bit):
+            if not math.isfinite(value):
+                raise FrameError(f'{field} is not a finite number')
+            data[field] = round(value, _DECIMALS)
+    if presence & (1 << RECORD_FIELDS.index('battery_level')):
+        data['battery_level'] = battery
+    if presence & (1 << RECORD_FIELDS.index('wind_direction')):
+        try:
+            data['wind_direction'] = bytes(wind).decode('utf-8')
+        except UnicodeDecodeError:
+            raise FrameError('wind direction is not valid UTF-8')
+    return data, offset
+
+
+def encode_sensor_data(data):
+    """Encode a sensor_data payload dict as a binary frame"""
+    return _HEADER.pack(VERSION, MSG_SENSOR_DATA) + _encode_record(data)
+
+
+def encode_heartbeat():
+    """Encode a heartbeat as a binary frame"""
+    return _HEADER.pack(VERSION, MSG_HEARTBEAT)
+
+
+def encode_sensor_batch(readings):
+    """Encode (epoch seconds, payload dict) pairs as a sensor_batch frame"""
+    parts = [_HEADER.pack(VERSION, MSG_SENSOR_BATCH), _BATCH_COUNT.pack(len(readings))]
+    for timestamp, data in readings:
+        parts.append(_TIMESTAMP.pack(timestamp))
+        parts.append(_encode_record(data))
+    return b''.join(parts)
+
+
+def decode_frame(frame):
+    """
+    Decode a binary frame into the same message dict a JSON frame carries,
+    e.g. ``{"type": "sensor_data", "data": {...}}``.
+    """
+    frame = memoryview(frame)
+    try:
+        version, message_id = _HEADER.unpack_from(frame, 0)
+    except struct.error:
+        raise FrameError('frame is too short')
+    if version != VERSION:
+        raise FrameError(f'unsupported schema version {version}')
+    message_type = MESSAGE_TYPES.get(message_id)
+    if message_type is None:
+        raise FrameError(f'unknown message type {message_id}')
+
+    offset = _HEADER.size
+    if message_id == MSG_SENSOR_DATA:
+        data, offset = _decode_record(frame, offset)
+        message = {'type': message_type, 'data': data}
+    elif message_id == MSG_HEARTBEAT:
+        message = {'type': message_type}
+    else:
+        try:
+            (count,) = _BATCH_COUNT.unpack_from(frame, offset)
+        except struct.error:
+            raise FrameError('truncated batch header')
+        offset += _BATCH_COUNT.size
+
+        readings = []
+        for _ in range(count):
+            try:
+                (timestamp,) = _TIMESTAMP.unpack_from(frame, offset)
+            except struct.error:
+                raise FrameError('truncated batch record')
+            if not math.isfinite(timestamp):
+                raise FrameError('batch timestamp is not a finite number')
+            data, offset = _decode_record(frame, offset + _TIMESTAMP.size)
+            readings.append({'timestamp': timestamp, 'data': data})
+        message = {'type': message_type, 'readings': readings}
+
+    if offset != len(frame):
+        raise FrameError('unexpected trailing bytes')
+    return message
@@ -0,0 +1,60 @@
+"""
+Cached device lookup for WebSocket connects.
+
+Devices are cached by ``device_uuid`` in the ``DEVICE_CACHE_ALIAS`` cache,
+so a reconnect storm after a deploy does not turn into thousands of
+identical point queries. Unknown UUIDs are cached too, for a few seconds,
+so misconfigured firmware cannot hammer the database. Entries are
+dropped whenever a device is saved or deleted (see ``core.signals``), but
+only in the cache of the process that made the change unless the cache is
+shared between workers; see the note next to ``DEVICE_CACHE_TTL``.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Device
+
+# Cached in place of a device for UUIDs that are not registered
+_MISSING = 'missing'
+
+# Longest device_uuid the model can store
+_MAX_UUID_LENGTH = Device._meta.get_field('device_uuid').max_length
+
+
+def _cache():
+    return caches[getattr(settings, 'DEVICE_CACHE_ALIAS', 'default')]
+
+
+def _key(device_uuid):
+    return f'glycine:device:{device_uuid}'
+
+
+def get_device(device_uuid):
+    """Return the Device with this UUID, or None if it is not registered"""
+    if len(device_uuid) > _MAX_UUID_LENGTH:
+        return None
+
+    cache = _cache()
+    cached = cache.get(_key(device_uuid))
+    if cached == _MISSING:
+        return None
+    if cached is not None:
+        return cached
+
+    try:
+        device = Device.objects.get(device_uuid=device_uuid)
+    except Device.DoesNotExist:
+        negative_ttl = getattr(settings, 'DEVICE_CACHE_NEGATIVE_TTL', 10)
+        if negative_ttl > 0:
+            cache.set(_key(device_uuid), _MISSING, negative_ttl)
+        return None
+
+    cache.set(_key(device_uuid), device, getattr(settings, 'DEVICE_CACHE_TTL', 30))
+    return device
+
+
+def invalidate(*device_uuids):
+    """Drop cached lookups for the given UUIDs"""
+    keys = [_key(device_uuid) for device_uuid in device_uuids if device_uuid]
+    if keys:
+        _cache().delete_many(keys)
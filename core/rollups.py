@@ -0,0 +1,300 @@
+"""
+Incremental per-device rollups of sensor readings.
+
+Readings are folded into minute, hour and day buckets in the same
+transaction that stores them (see ``core.ingest``). Chart and history
+queries read these tables instead of scanning ``SensorReading``.
+Buckets follow local time (``TIME_ZONE``), so a day rollup covers one
+calendar day in the field.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import archive
+from .models import DayRollup, Device, HourRollup, MinuteRollup
+
+# Numeric sensor fields aggregated in every bucket
+ROLLUP_FIELDS = (
+    'air_temperature',
+    'air_humidity',
+    'soil_moisture',
+    'soil_ph',
+    'wind_speed',
+    'nitrogen',
+    'phosphorus',
+    'potassium',
+    'rainfall',
+)
+
+RESOLUTIONS = {
+    'minute': MinuteRollup,
+    'hour': HourRollup,
+    'day': DayRollup,
+}
+
+# Columns rewritten when a bucket is merged
+_AGGREGATE_COLUMNS = ['count', 'last_reading_at', 'wind_direction'] + [
+    f'{field}_{stat}' for field in ROLLUP_FIELDS for stat in ('min', 'max', 'sum', 'count')
+]
+
+
+def bucket_start(timestamp, resolution):
+    """Start of the bucket containing ``timestamp``, as an aware local datetime"""
+    local = timezone.localtime(timestamp)
+    if resolution == 'minute':
+        return local.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'Unknown rollup resolution: {resolution}')
+
+
+def next_bucket(bucket, resolution):
+    """Start of the bucket following ``bucket``"""
+    if resolution == 'minute':
+        return bucket + timedelta(minutes=1)
+    if resolution == 'hour':
+        return bucket + timedelta(hours=1)
+    return bucket_start(bucket + timedelta(days=1, hours=12), 'day')
+
+
+class _Partial:
+    """Aggregates for one bucket, built from readings or other buckets"""
+
+    __slots__ = ('count', 'last_reading_at', 'wind_direction', 'stats')
+
+    def __init__(self):
+        self.count = 0
+        self.last_reading_at = None
+        self.wind_direction = None
+        self.stats = {field: [None, None, 0.0, 0] for field in ROLLUP_FIELDS}
+
+    def add_reading(self, reading):
+        self.add_row(reading.__dict__)
+
+    def add_row(self, row):
+        """Add one reading given as a dict of field values (see ``archive.iter_readings``)"""
+        self.count += 1
+        for field in ROLLUP_FIELDS:
+            value = row[field]
+            if value is None:
+                continue
+            stat = self.stats[field]
+            stat[0] = value if stat[0] is None else min(stat[0], value)
+            stat[1] = value if stat[1] is None else max(stat[1], value)
+            stat[2] += value
+            stat[3] += 1
+        self._advance(row['timestamp'], row['wind_direction'])
+
+    def add_rollup(self, row):
+        self.count += row.count
+        for field in ROLLUP_FIELDS:
+            count = getattr(row, f'{field}_count')
+            if not count:
+                continue
+            stat = self.stats[field]
+            low, high = getattr(row, f'{field}_min'), getattr(row, f'{field}_max')
+            stat[0] = low if stat[0] is None else min(stat[0], low)
+            stat[1] = high if stat[1] is None else max(stat[1], high)
+            stat[2] += getattr(row, f'{field}_sum')
+            stat[3] += count
+        if row.last_reading_at is not None:
+            self._advance(row.last_reading_at, row.wind_direction)
+
+    def _advance(self, timestamp, wind_direction):
+        if self.last_reading_at is None or timestamp >= self.last_reading_at:
+            self.last_reading_at = timestamp
+            self.wind_direction = wind_direction
+
+    def write_to(self, row):
+        row.count = self.count
+        row.last_reading_at = self.last_reading_at
+        row.wind_direction = self.wind_direction
+        for field, (low, high, total, count) in self.stats.items():
+            setattr(row, f'{field}_min', low)
+            setattr(row, f'{field}_max', high)
+            setattr(row, f'{field}_sum', total)
+            setattr(row, f'{field}_count', count)
+
+
+def _partials_from_readings(readings, resolution):
+    partials = {}
+    for reading in readings:
+        key = (reading.device_id, bucket_start(reading.timestamp, resolution))
+        partial = partials.get(key)
+        if partial is None:
+            partial = partials[key] = _Partial()
+        partial.add_reading(reading)
+    return partials
+
+
+def _merge_into(model, partials):
+    """
+    Add partial aggregates to the stored buckets, creating missing ones.
+
+    One upsert statement per batch of buckets: counts and sums are added,
+    minima and maxima combined, and the newest wind direction kept, all
+    inside the database, so no rows are read back or locked beforehand.
+    """
+    if not partials:
+        return
+
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    columns = ['device_id', 'bucket', *_AGGREGATE_COLUMNS]
+    rows = []
+    for (device_id, bucket), partial in partials.items():
+        row = model(device_id=device_id, bucket=bucket)
+        partial.write_to(row)
+        rows.append([fields[column].get_db_prep_save(getattr(row, column), connection) for column in columns])
+
+    execute_upsert(_upsert_sql(model._meta.db_table, columns), columns, rows)
+
+
+def upsert_syntax(conflict_columns):
+    """
+    Vendor syntax for an INSERT that updates the row it conflicts with.
+
+    Returns the clause that follows ``VALUES ...`` (up to the assignments)
+    and a formatter giving the SQL for the value the INSERT tried to write
+    to a quoted column.
+    """
+    qn = connection.ops.quote_name
+    if connection.vendor == 'mysql':
+        if connection.mysql_is_mariadb:
+            return 'ON DUPLICATE KEY UPDATE', 'VALUE({})'.format
+        if connection.mysql_version >= (8, 0, 19):
+            return 'AS new ON DUPLICATE KEY UPDATE', 'new.{}'.format
+        return 'ON DUPLICATE KEY UPDATE', 'VALUES({})'.format
+    conflict = ', '.join(qn(column) for column in conflict_columns)
+    return f'ON CONFLICT ({conflict}) DO UPDATE SET', 'excluded.{}'.format
+
+
+def execute_upsert(sql, columns, rows):
+    """Run an ``INSERT ... VALUES %(values)s`` statement over ``rows`` in as few batches as the backend allows"""
+    batch_size = connection.ops.bulk_batch_size(columns, rows) or len(rows)
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(batch))
+            cursor.execute(sql % {'values': placeholders}, [value for row in batch for value in row])
+
+
+def _upsert_sql(table, columns):
+    """``INSERT ... VALUES %(values)s`` that merges into an existing bucket instead of failing"""
+    qn = connection.ops.quote_name
+    suffix, new = upsert_syntax(('device_id', 'bucket'))
+    old = f'{qn(table)}.{{}}'.format
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+
+    def merged(column):
+        o, n = old(qn(column)), new(qn(column))
+        if column.endswith(('_sum', '_count')) or column == 'count':
+            return f'{o} + {n}'
+        if column.endswith(('_min', '_max')):
+            function = least if column.endswith('_min') else greatest
+            return f'COALESCE({function}({o}, {n}), {o}, {n})'
+        # wind_direction and last_reading_at follow the newest reading
+        o_last, n_last = old(qn('last_reading_at')), new(qn('last_reading_at'))
+        return f'CASE WHEN {o_last} IS NULL OR {n_last} >= {o_last} THEN {n} ELSE {o} END'
+
+    # MySQL applies assignments left to right, so wind_direction must be
+    # compared against last_reading_at before that column is replaced
+    ordered = sorted(_AGGREGATE_COLUMNS, key=lambda column: column != 'wind_direction')
+    assignments = ', '.join(f'{qn(column)} = {merged(column)}' for column in ordered)
+    return (
+        f'INSERT INTO {qn(table)} ({", ".join(qn(column) for column in columns)}) '
+        f'VALUES %(values)s {suffix} {assignments}'
+    )
+
+
+def apply_readings(readings):
+    """Fold newly stored readings into every rollup table; callers provide the transaction"""
+    for resolution, model in RESOLUTIONS.items():
+        _merge_into(model, _partials_from_readings(readings, resolution))
+
+
+def rebuild(start, end, device_ids=None, chunk_size=5000):
+    """
+    Recompute rollups for the local days overlapping ``[start, end)``.
+
+    Work is split per device and day, each in its own transaction: minute
+    buckets are rebuilt from raw readings (live and archived), hour and day
+    buckets from those minute buckets. Returns the number of buckets written per resolution.
+    """
+    if device_ids is None:
+        device_ids = list(Device.objects.values_list('pk', flat=True))
+
+    written = dict.fromkeys(RESOLUTIONS, 0)
+    day = bucket_start(start, 'day')
+    while day < end:
+        day_end = next_bucket(day, 'day')
+        for device_id in device_ids:
+            with transaction.atomic():
+                for resolution, count in _rebuild_day(device_id, day, day_end, chunk_size).items():
+                    written[resolution] += count
+        day = day_end
+    return written
+
+
+def _rebuild_day(device_id, day, day_end, chunk_size):
+    written = {}
+    for resolution, model in RESOLUTIONS.items():
+        model.objects.filter(device_id=device_id, bucket__gte=day, bucket__lt=day_end).delete()
+
+        partials = {}
+        if resolution == 'minute':
+            # Archived months count too, or rebuilding them would erase their history
+            for row in archive.iter_readings(device_id, day, day_end, chunk_size=chunk_size):
+                bucket = bucket_start(row['timestamp'], resolution)
+                partial = partials.get(bucket)
+                if partial is None:
+                    partial = partials[bucket] = _Partial()
+                partial.add_row(row)
+        else:
+            source = MinuteRollup.objects.filter(device_id=device_id, bucket__gte=day, bucket__lt=day_end)
+            for item in source.order_by().iterator(chunk_size=chunk_size):
+                bucket = bucket_start(item.bucket, resolution)
+                partial = partials.get(bucket)
+                if partial is None:
+                    partial = partials[bucket] = _Partial()
+                partial.add_rollup(item)
+
+        rows = []
+        for bucket, partial in partials.items():
+            row = model(device_id=device_id, bucket=bucket)
+            partial.write_to(row)
+            rows.append(row)
+        model.objects.bulk_create(rows, batch_size=chunk_size)
+        written[resolution] = len(rows)
+    return written
+
+
+def series(device, resolution, start, end, fields=ROLLUP_FIELDS, limit=None):
+    """
+    Mean values per bucket for ``device`` in ``[start, end)``, oldest first.
+
+    With ``limit``, only the newest ``limit`` buckets are returned.
+    """
+    model = RESOLUTIONS[resolution]
+    rows = model.objects.filter(device=device, bucket__gte=start, bucket__lt=end)
+    if limit is not None:
+        rows = reversed(rows.order_by('-bucket')[:limit])
+    else:
+        rows = rows.order_by('bucket')
+
+    points = []
+    for row in rows:
+        point = {
+            'bucket': row.bucket,
+            'count': row.count,
+            'wind_direction': row.wind_direction,
+        }
+        for field in fields:
+            point[field] = row.mean(field)
+        # Rainfall is accumulated, so its bucket total matters more than the mean
+        point['rainfall_total'] = row.rainfall_sum if row.rainfall_count else None
+        points.append(point)
+    return points
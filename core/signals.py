@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import registry
+from .models import Device
+
+
+@receiver(post_init, sender=Device)
+def remember_device_uuid(sender, instance, **kwargs):
+    """Keep the UUID a device was loaded with, so renames invalidate the old entry"""
+    instance._loaded_device_uuid = instance.device_uuid
+
+
+@receiver(post_save, sender=Device)
+def invalidate_saved_device(sender, instance, **kwargs):
+    """Drop cached lookups after a device is added or edited"""
+    registry.invalidate(instance._loaded_device_uuid, instance.device_uuid)
+    instance._loaded_device_uuid = instance.device_uuid
+
+
+@receiver(post_delete, sender=Device)
+def invalidate_deleted_device(sender, instance, **kwargs):
+    """Drop cached lookups after a device is deleted"""
+    registry.invalidate(instance._loaded_device_uuid, instance.device_uuid)
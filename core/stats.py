@@ -0,0 +1,12 @@
+"""
+Small statistics helpers shared by the benchmarks and the device simulator.
+
+Standard library only, so ``iot_device_simulator.py`` can import it
+without Django, like ``core.protocol``.
+"""
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
@@ -1,3 +1,1358 @@
+import asyncio
+import gzip
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, benchmarks, charts, downsample, fanout, inference, inference_worker, ingest, metrics, presence, protocol, registry, rollups
+from .consumers import MESSAGE_ERRORS, MESSAGES, DashboardConsumer, DeviceConsumer
+from .models import DayRollup, Device, HourRollup, LatestReading, MinuteRollup, SensorReading
+
+
+class LatestReadingTests(TestCase):
+    """Denormalized newest reading per device"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+
+    def test_save_reading_updates_latest(self):
+        reading = ingest.save_reading(ingest.build_reading(self.device, {'air_temperature': 28.5}), 80)
+
+        latest = LatestReading.objects.get(device=self.device)
+        self.assertEqual(latest.reading_id, reading.pk)
+        self.assertEqual(latest.air_temperature, 28.5)
+
+    def test_older_replay_does_not_overwrite_latest(self):
+        now = timezone.now()
+        ingest.save_reading(SensorReading(device=self.device, timestamp=now, air_temperature=30.0))
+
+        entries, _, _ = ingest.parse_reading_batch(self.device, [
+            {'timestamp': (now - timedelta(minutes=5)).isoformat(), 'air_temperature': 20.0},
+            {'timestamp': (now - timedelta(minutes=1)).isoformat(), 'air_temperature': 21.0},
+        ])
+        ingest.bulk_insert_readings(entries)
+
+        latest = LatestReading.objects.get(device=self.device)
+        self.assertEqual(latest.timestamp, now)
+        self.assertEqual(latest.air_temperature, 30.0)
+
+    def test_newer_batch_reading_wins(self):
+        now = timezone.now()
+        ingest.save_reading(SensorReading(device=self.device, timestamp=now - timedelta(hours=1), air_temperature=30.0))
+
+        entries, _, _ = ingest.parse_reading_batch(self.device, [
+            {'timestamp': (now - timedelta(minutes=1)).isoformat(), 'air_temperature': 22.0},
+            {'timestamp': (now - timedelta(minutes=5)).isoformat(), 'air_temperature': 21.0},
+        ])
+        ingest.bulk_insert_readings(entries)
+
+        self.assertEqual(LatestReading.objects.get(device=self.device).air_temperature, 22.0)
+
+    def test_update_latest_is_one_statement(self):
+        now = timezone.now()
+        older = SensorReading.objects.create(device=self.device, timestamp=now - timedelta(minutes=1), soil_ph=6.0)
+        newer = SensorReading.objects.create(device=self.device, timestamp=now, soil_ph=7.0)
+
+        with self.assertNumQueries(1):
+            ingest.update_latest([newer])
+        with self.assertNumQueries(1):
+            ingest.update_latest([older])
+
+        latest = LatestReading.objects.get(device=self.device)
+        self.assertEqual((latest.reading_id, latest.soil_ph), (newer.pk, 7.0))
+
+    def test_batch_rejects_timestamps_outside_the_window(self):
+        now = timezone.now()
+        items = [
+            {'timestamp': (now - timedelta(days=2)).isoformat(), 'air_temperature': 20.0},
+            {'timestamp': (now - timedelta(minutes=1)).isoformat(), 'air_temperature': 21.0},
+            {'timestamp': (now + timedelta(hours=1)).isoformat(), 'air_temperature': 22.0},
+        ]
+        with self.settings(SENSOR_BATCH_MAX_AGE=86400):
+            entries, _, rejected = ingest.parse_reading_batch(self.device, items)
+        self.assertEqual([reading.air_temperature for reading, _ in entries], [21.0])
+        self.assertEqual(rejected, [
+            {'index': 0, 'error': 'timestamp is too old'},
+            {'index': 2, 'error': 'timestamp is in the future'},
+        ])
+
+        with self.settings(SENSOR_BATCH_MAX_AGE=0):
+            entries, _, _ = ingest.parse_reading_batch(self.device, items)
+        self.assertEqual(len(entries), 2)
+
+
+class SaveReadingTests(TestCase):
+    """One transaction per device message"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+
+    def test_failing_device_update_rolls_back_the_reading(self):
+        reading = ingest.build_reading(self.device, {'air_temperature': 28.5})
+        with mock.patch.object(ingest, 'update_battery_levels', side_effect=DatabaseError('device locked')):
+            with self.assertRaises(DatabaseError):
+                ingest.save_reading(reading, 80)
+
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertFalse(LatestReading.objects.exists())
+        self.assertFalse(MinuteRollup.objects.exists())
+
+    def test_statements_per_reading(self):
+        # Reading, battery level, latest reading and three rollup upserts
+        with self.assertNumQueries(6 + 2):  # + SAVEPOINT / RELEASE inside the test transaction
+            ingest.save_reading(ingest.build_reading(self.device, {'air_temperature': 28.5}), 80)
+        # No battery level: no device update
+        with self.assertNumQueries(5 + 2):
+            ingest.save_reading(ingest.build_reading(self.device, {'air_temperature': 28.6}))
+
+    def test_sensor_data_message_is_one_transaction(self):
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        async def scenario():
+            application = benchmarks.websocket_application()
+            device = await benchmarks.open_device(application, self.device)
+            start = len(executed)
+            await device.send_json_to({'type': 'sensor_data', 'data': benchmarks.sensor_data(0)})
+            await benchmarks.receive_type(device, 'data_received')
+            statements = executed[start:]
+            await device.disconnect()
+            return statements
+
+        # The consumer's database calls run on this thread's connection
+        with self.settings(SENSOR_BUFFER_ENABLED=False), connection.execute_wrapper(record):
+            statements = async_to_sync(scenario)()
+
+        self.assertEqual(len(statements), 8)
+        self.assertTrue(statements[0].startswith('SAVEPOINT'))
+        self.assertTrue(statements[-1].startswith('RELEASE SAVEPOINT'))
+        self.assertEqual(SensorReading.objects.count(), 1)
+
+
+class ReadingBufferTests(TestCase):
+    """Write-behind ReadingBuffer"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+
+    def reading(self, temperature=28.0):
+        return ingest.build_reading(self.device, {'air_temperature': temperature})
+
+    def test_full_batch_is_flushed_without_waiting_for_the_timer(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=3, flush_interval=60)
+
+        async def scenario():
+            futures = [await buffer.add(self.reading(), 90) for _ in range(3)]
+            return await asyncio.wait_for(asyncio.gather(*futures), 5)
+
+        saved = async_to_sync(scenario)()
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(SensorReading.objects.count(), 3)
+        self.assertEqual(buffer.flush_count, 1)
+        self.assertEqual(Device.objects.get(pk=self.device.pk).battery_level, 90)
+
+    def test_partial_batch_is_flushed_by_the_timer(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=100, flush_interval=0.05)
+
+        async def scenario():
+            return await asyncio.wait_for(await buffer.add(self.reading()), 5)
+
+        reading = async_to_sync(scenario)()
+        self.assertEqual(SensorReading.objects.get().pk, reading.pk)
+
+    def test_full_buffer_holds_callers_back_until_a_flush_made_room(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=2, flush_interval=60, max_pending=2)
+
+        async def scenario():
+            futures = [await buffer.add(self.reading()) for _ in range(3)]
+            state = len(buffer), await database_sync_to_async(SensorReading.objects.count)()
+            await buffer.flush()
+            await asyncio.gather(*futures)
+            return state
+
+        # The third add() had to flush the first two readings itself
+        self.assertEqual(async_to_sync(scenario)(), (1, 2))
+        self.assertEqual(SensorReading.objects.count(), 3)
+
+    def test_invalid_readings_are_rejected_before_queueing(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=10, flush_interval=60)
+
+        for data in ({'air_temperature': float('nan')}, {'soil_ph': 'high'}, {'wind_direction': 'x' * 51}):
+            with self.assertRaises(ingest.InvalidReading):
+                async_to_sync(buffer.add)(ingest.build_reading(self.device, data))
+        self.assertEqual(len(buffer), 0)
+
+    def test_a_failing_row_only_fails_its_own_future(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=3, flush_interval=60)
+        insert = ingest.bulk_insert_readings
+
+        def failing_insert(entries):
+            if any(reading.air_temperature == 99 for reading, _ in entries):
+                raise ValueError('rejected by the database')
+            return insert(entries)
+
+        async def scenario():
+            futures = [await buffer.add(self.reading(temperature)) for temperature in (20, 99, 21)]
+            return await asyncio.gather(*futures, return_exceptions=True)
+
+        with mock.patch.object(ingest, 'bulk_insert_readings', failing_insert), self.assertLogs('core.ingest', 'WARNING'):
+            results = async_to_sync(scenario)()
+
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([results[0].air_temperature, results[2].air_temperature], [20, 21])
+        self.assertEqual(sorted(SensorReading.objects.values_list('air_temperature', flat=True)), [20, 21])
+        self.assertEqual(buffer.failed_rows, 1)
+
+    def test_flush_sync_writes_everything_pending(self):
+        buffer = ingest.ReadingBuffer(max_batch_size=10, flush_interval=60)
+
+        async def scenario():
+            for _ in range(3):
+                await buffer.add(self.reading())
+        async_to_sync(scenario)()
+
+        buffer.flush_sync()
+        self.assertEqual(len(buffer), 0)
+        self.assertIsNone(buffer._timer)
+        self.assertEqual(SensorReading.objects.count(), 3)
+
+
+class PresenceTests(TestCase):
+    """PresenceTracker connect/seen/sweep bookkeeping"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01', status='offline')
+
+    def stored(self):
+        return Device.objects.values_list('status', 'last_seen').get(pk=self.device.pk)
+
+    def test_connect_is_written_by_the_sweep(self):
+        tracker = presence.PresenceTracker()
+        tracker.connected(self.device)
+        # Nothing is written until the sweep runs
+        self.assertEqual(self.stored(), ('offline', None))
+
+        async_to_sync(tracker.sweep)()
+        last_seen = tracker._connections[self.device.pk].last_seen
+        self.assertEqual(self.stored(), ('online', last_seen))
+        online = async_to_sync(tracker.online_devices)()
+        self.assertEqual([device['device_uuid'] for device in online], [self.device.device_uuid])
+
+    def test_seen_moves_last_seen_forward(self):
+        tracker = presence.PresenceTracker()
+        tracker.connected(self.device)
+        async_to_sync(tracker.sweep)()
+        Device.objects.filter(pk=self.device.pk).update(last_seen=timezone.now() - timedelta(minutes=5))
+
+        tracker.seen(self.device, battery_level=42)
+        async_to_sync(tracker.sweep)()
+        self.assertEqual(self.stored(), ('online', tracker._connections[self.device.pk].last_seen))
+        online = async_to_sync(tracker.online_devices)()
+        self.assertEqual(online[0]['battery_level'], 42)
+
+    def test_seen_ignores_devices_not_connected_here(self):
+        tracker = presence.PresenceTracker()
+        tracker.seen(self.device)
+        self.assertEqual(tracker._pending, {})
+
+    def test_silent_device_goes_offline_until_it_speaks(self):
+        tracker = presence.PresenceTracker(stale_after=60)
+        tracker.connected(self.device)
+        tracker._connections[self.device.pk].last_seen -= timedelta(seconds=120)
+        async_to_sync(tracker.sweep)()
+        self.assertEqual(self.stored()[0], 'offline')
+        self.assertEqual(async_to_sync(tracker.online_devices)(), [])
+
+        tracker.seen(self.device)
+        async_to_sync(tracker.sweep)()
+        self.assertEqual(self.stored()[0], 'online')
+
+    def test_devices_left_online_by_another_worker_expire(self):
+        Device.objects.filter(pk=self.device.pk).update(
+            status='online', last_seen=timezone.now() - timedelta(hours=1)
+        )
+        tracker = presence.PresenceTracker(stale_after=60)
+        async_to_sync(tracker.sweep)()
+        self.assertEqual(self.stored()[0], 'offline')
+        self.assertEqual(tracker.expired, 1)
+
+    def test_disconnect_is_written_as_offline(self):
+        tracker = presence.PresenceTracker()
+        tracker.connected(self.device)
+        async_to_sync(tracker.sweep)()
+        tracker.disconnected(self.device)
+        async_to_sync(tracker.sweep)()
+        self.assertEqual(self.stored()[0], 'offline')
+        self.assertEqual(async_to_sync(tracker.online_devices)(), [])
+
+    def test_reading_stored_after_a_disconnect_keeps_the_device_offline(self):
+        tracker = presence.PresenceTracker()
+        tracker.connected(self.device)
+        tracker.disconnected(self.device)
+        async_to_sync(tracker.sweep)()
+
+        # e.g. a buffered reading flushed after the sweep
+        ingest.save_reading(ingest.build_reading(self.device, {'soil_ph': 6.5}), 55)
+        device = Device.objects.get(pk=self.device.pk)
+        self.assertEqual((device.status, device.battery_level), ('offline', 55))
+
+    def test_flush_sync_marks_connected_devices_offline(self):
+        tracker = presence.PresenceTracker()
+        tracker.connected(self.device)
+        async_to_sync(tracker.sweep)()
+        tracker.flush_sync()
+        self.assertEqual(self.stored()[0], 'offline')
+
+        # Nothing left to write: no queries
+        with self.assertNumQueries(0):
+            tracker.flush_sync()
+
+
+class RegistryTests(TestCase):
+    """Cached device lookups"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+
+    def test_second_lookup_is_served_from_the_cache(self):
+        with self.assertNumQueries(1):
+            first = registry.get_device(self.device.device_uuid)
+            second = registry.get_device(self.device.device_uuid)
+        self.assertEqual(first.pk, self.device.pk)
+        self.assertEqual(second.pk, self.device.pk)
+
+    def test_unknown_uuid_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:99'))
+            self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:99'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(registry.get_device('X' * 300))
+
+        # Registering the device drops the cached miss
+        Device.objects.create(name='Sensor 99', device_uuid='AA:BB:CC:DD:EE:99')
+        self.assertIsNotNone(registry.get_device('AA:BB:CC:DD:EE:99'))
+
+    def test_negative_cache_can_be_turned_off(self):
+        with self.settings(DEVICE_CACHE_NEGATIVE_TTL=0), self.assertNumQueries(2):
+            self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:99'))
+            self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:99'))
+
+    def test_save_invalidates(self):
+        registry.get_device(self.device.device_uuid)
+        self.device.name = 'Renamed'
+        self.device.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(registry.get_device(self.device.device_uuid).name, 'Renamed')
+
+    def test_uuid_change_invalidates_the_old_uuid(self):
+        registry.get_device('AA:BB:CC:DD:EE:01')
+        self.device.device_uuid = 'AA:BB:CC:DD:EE:02'
+        self.device.save()
+        self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:01'))
+        self.assertEqual(registry.get_device('AA:BB:CC:DD:EE:02').pk, self.device.pk)
+
+    def test_delete_invalidates(self):
+        registry.get_device(self.device.device_uuid)
+        self.device.delete()
+        self.assertIsNone(registry.get_device('AA:BB:CC:DD:EE:01'))
+
+
+class RollupTests(TestCase):
+    """Incremental rollups and rebuilds"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+        self.columns = ['device_id', 'bucket', 'count', 'last_reading_at', 'wind_direction'] + [
+            f'{field}_{stat}' for field in rollups.ROLLUP_FIELDS for stat in ('min', 'max', 'sum', 'count')
+        ]
+
+    def dump(self):
+        return {model: sorted(model.objects.values_list(*self.columns)) for model in rollups.RESOLUTIONS.values()}
+
+    def test_incremental_merge_matches_a_rebuild(self):
+        base = timezone.now().replace(second=0, microsecond=0) - timedelta(hours=2)
+        # Out of order, with a field missing from the first reading of the bucket
+        for seconds, temperature, wind in ((30, None, 'Utara'), (50, 31.0, 'Barat'), (10, 25.0, 'Selatan'), (3700, 28.0, 'Timur')):
+            ingest.save_reading(SensorReading(device=self.device, timestamp=base + timedelta(seconds=seconds),
+                                              air_temperature=temperature, wind_direction=wind))
+
+        minute = MinuteRollup.objects.get(bucket=base)
+        self.assertEqual((minute.count, minute.air_temperature_count), (3, 2))
+        self.assertEqual((minute.air_temperature_min, minute.air_temperature_max), (25.0, 31.0))
+        self.assertEqual(minute.wind_direction, 'Barat')
+
+        incremental = self.dump()
+        rollups.rebuild(base, base + timedelta(hours=2))
+        self.assertEqual(incremental, self.dump())
+
+    def test_one_statement_per_rollup_table(self):
+        reading = SensorReading.objects.create(device=self.device, air_temperature=28.0)
+        with self.assertNumQueries(3):
+            rollups.apply_readings([reading])
+
+    def test_rebuild_keeps_the_history_of_archived_months(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        start = archive.month_start(timezone.now() - timedelta(days=70))
+        ingest.bulk_insert_readings([
+            (SensorReading(device=self.device, timestamp=start + timedelta(hours=i * 7), air_temperature=20.0 + i), None)
+            for i in range(20)
+        ])
+        before = self.dump()
+
+        with self.settings(SENSOR_ARCHIVE_DIR=tmp.name):
+            archive.archive_month(self.device.pk, start, archive.next_month(start))
+            self.assertFalse(SensorReading.objects.exists())
+            rollups.rebuild(start, archive.next_month(start))
+
+        self.assertEqual(before, self.dump())
+
+
+class RebuildRollupsCommandTests(TestCase):
+    """rebuild_rollups command arguments"""
+
+    def test_invalid_moment_is_a_command_error(self):
+        with self.assertRaisesMessage(CommandError, 'Invalid date or datetime: yesterday'):
+            call_command('rebuild_rollups', start='yesterday', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'Invalid date or datetime'):
+            call_command('rebuild_rollups', start='2025-02-30', stdout=io.StringIO())
+
+
+class ArchiveTests(TestCase):
+    """Monthly npz archives of old readings"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        archive_dir = self.settings(SENSOR_ARCHIVE_DIR=tmp.name)
+        archive_dir.enable()
+        self.addCleanup(archive_dir.disable)
+        self.start = archive.month_start(timezone.now() - timedelta(days=70))
+        self.end = archive.next_month(self.start)
+
+    def create(self, hours):
+        # Two readings share each timestamp, so keyset pages must break ties by id
+        return SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=self.start + timedelta(hours=hour), air_temperature=float(hour) + i / 10,
+                          soil_ph=None, wind_direction='Utara' if i else None)
+            for hour in hours for i in range(2)
+        ])
+
+    def stored(self):
+        return [(row['timestamp'], row['air_temperature'], row['soil_ph'], row['wind_direction'])
+                for row in archive.iter_archived_readings(self.device.pk)]
+
+    def test_round_trip_in_small_chunks(self):
+        self.create(range(5))
+        expected = [(r.timestamp, r.air_temperature, None, r.wind_direction)
+                    for r in SensorReading.objects.order_by('timestamp', 'id')]
+
+        self.assertEqual(archive.archive_month(self.device.pk, self.start, self.end, chunk_size=3), 10)
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertEqual(self.stored(), expected)
+
+    def test_later_runs_merge_into_the_existing_file(self):
+        self.create(range(3))
+        archive.archive_month(self.device.pk, self.start, self.start + timedelta(hours=2))
+        self.create(range(10, 12))
+        self.assertEqual(archive.archive_month(self.device.pk, self.start, self.end), 6)
+
+        hours = [(timestamp - self.start) // timedelta(hours=1) for timestamp, *_ in self.stored()]
+        self.assertEqual(hours, [0, 0, 1, 1, 2, 2, 10, 10, 11, 11])
+
+    def test_rerun_after_an_interrupted_delete_does_not_duplicate(self):
+        self.create(range(3))
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                archive.archive_month(self.device.pk, self.start, self.end)
+        self.assertEqual(SensorReading.objects.count(), 6)
+
+        archive.archive_month(self.device.pk, self.start, self.end)
+        self.assertEqual(archive.archive_month(self.device.pk, self.start, self.end), 0)
+        self.assertEqual(len(self.stored()), 6)
+        self.assertFalse(SensorReading.objects.exists())
+
+    def test_rows_are_kept_when_the_file_cannot_be_written(self):
+        self.create(range(3))
+        with mock.patch.object(archive, '_write_columns', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                archive.archive_month(self.device.pk, self.start, self.end)
+
+        self.assertEqual(SensorReading.objects.count(), 6)
+        self.assertEqual(archive.archived_months(self.device.pk), [])
+
+    def test_command_archives_readings_past_retention(self):
+        self.create(range(3))
+        SensorReading.objects.create(device=self.device, air_temperature=30.0)
+        call_command('archive_readings', '--older-than-days', '30', stdout=io.StringIO())
+
+        self.assertEqual(SensorReading.objects.count(), 1)
+        self.assertEqual(len(self.stored()), 6)
+
+
+class DashboardDataTests(TestCase):
+    """DashboardConsumer.get_dashboard_data"""
+
+    def create_devices(self, count):
+        for i in range(count):
+            device = Device.objects.create(name=f'Sensor {i}', device_uuid=f'AA:BB:CC:DD:{i // 256:02X}:{i % 256:02X}')
+            if i % 3:
+                ingest.save_reading(ingest.build_reading(device, {'soil_ph': 6.5, 'wind_direction': 'N'}))
+            Device.objects.filter(pk=device.pk).update(status='online' if i % 2 else 'offline')
+
+    def get_dashboard_data(self):
+        return async_to_sync(DashboardConsumer().get_dashboard_data)()
+
+    def test_query_count_does_not_grow_with_devices(self):
+        self.create_devices(12)
+        with self.assertNumQueries(1):
+            data = self.get_dashboard_data()
+
+        self.assertEqual(data['total_devices_count'], 12)
+        self.assertEqual(data['online_devices_count'], 6)
+        self.assertEqual(data['offline_devices_count'], 6)
+        self.assertTrue(data['has_devices'])
+
+    def test_readings_come_from_latest(self):
+        self.create_devices(3)
+        data = self.get_dashboard_data()
+
+        readings = [entry['readings'] for entry in data['devices_data']]
+        self.assertIsNone(readings[0])
+        self.assertEqual(readings[1]['soil_ph'], 6.5)
+        self.assertEqual(readings[2]['wind_direction'], 'N')
+
+    def test_no_devices(self):
+        with self.assertNumQueries(1):
+            data = self.get_dashboard_data()
+        self.assertFalse(data['has_devices'])
+        self.assertEqual(data['devices_data'], [])
+
+
+class DownsampleTests(TestCase):
+    """LTTB and min/max downsampling"""
+
+    def setUp(self):
+        self.x = np.arange(10000, dtype=np.float64)
+        self.y = np.sin(self.x / 500)
+        self.y[1234] = 50.0
+        self.y[8765] = -50.0
+
+    def test_lttb_keeps_peaks(self):
+        x, y = downsample.downsample(self.x, self.y, 200, 'lttb')
+        self.assertIn(1234, x)
+        self.assertIn(8765, x)
+        self.assertEqual((x[0], x[-1]), (0, 9999))
+
+    def test_minmax_keeps_peaks(self):
+        x, y = downsample.downsample(self.x, self.y, 200, 'minmax')
+        self.assertEqual(y.max(), 50.0)
+        self.assertEqual(y.min(), -50.0)
+
+    def test_stays_within_point_budget(self):
+        for mode in downsample.MODES:
+            for points in (1, 2, 3, 10, 333, 9999, 20000):
+                x, y = downsample.downsample(self.x, self.y, points, mode)
+                self.assertLessEqual(len(x), points)
+                self.assertTrue(np.all(np.diff(x) > 0))
+
+    def test_missing_values_are_dropped(self):
+        y = self.y.copy()
+        y[::2] = np.nan
+        x, y = downsample.downsample(self.x, y, 100, 'lttb')
+        self.assertFalse(np.isnan(y).any())
+        self.assertTrue(np.all(x % 2 == 1))
+
+
+class ProtocolTests(TestCase):
+    """Binary frame encoding and decoding"""
+
+    reading = {
+        'air_temperature': 28.5, 'air_humidity': 75.0, 'soil_moisture': 60.2, 'soil_ph': 6.5,
+        'wind_speed': 10.0, 'nitrogen': 150.0, 'phosphorus': 90.0, 'potassium': 200.0,
+        'rainfall': 0.25, 'battery_level': 87, 'wind_direction': 'Tenggara',
+    }
+
+    def test_sensor_data_round_trip(self):
+        message = protocol.decode_frame(protocol.encode_sensor_data(self.reading))
+        self.assertEqual(message, {'type': 'sensor_data', 'data': self.reading})
+
+    def test_absent_fields_stay_absent(self):
+        message = protocol.decode_frame(protocol.encode_sensor_data({'soil_ph': 7.0}))
+        self.assertEqual(message['data'], {'soil_ph': 7.0})
+
+    def test_heartbeat_round_trip(self):
+        self.assertEqual(protocol.decode_frame(protocol.encode_heartbeat()), {'type': 'heartbeat'})
+
+    def test_sensor_batch_round_trip(self):
+        frame = protocol.encode_sensor_batch([(1700000000.5, self.reading), (1700000060.0, {'rainfall': 1.5})])
+        message = protocol.decode_frame(frame)
+        self.assertEqual(message, {'type': 'sensor_batch', 'readings': [
+            {'timestamp': 1700000000.5, 'data': self.reading},
+            {'timestamp': 1700000060.0, 'data': {'rainfall': 1.5}},
+        ]})
+
+    def test_long_wind_direction_is_cut_on_a_character_boundary(self):
+        # 2-byte characters: 255 bytes would end halfway through one
+        frame = protocol.encode_sensor_data({'wind_direction': '\u00e9' * 200})
+        self.assertEqual(protocol.decode_frame(frame)['data']['wind_direction'], '\u00e9' * 127)
+
+    def test_non_finite_values_are_rejected(self):
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(protocol.FrameError):
+                protocol.decode_frame(protocol.encode_sensor_data({'soil_ph': value}))
+            with self.assertRaises(protocol.FrameError):
+                protocol.decode_frame(protocol.encode_sensor_batch([(value, {'soil_ph': 6.5})]))
+
+    def test_malformed_frames(self):
+        frame = protocol.encode_sensor_data(self.reading)
+        batch = protocol.encode_sensor_batch([(1700000000.0, self.reading)])
+        cases = {
+            'empty': b'',
+            'short header': b'\x01',
+            'wrong version': b'\x02' + frame[1:],
+            'unknown type': b'\x01\x09',
+            'short record': frame[:10],
+            'short wind direction': frame[:-1],
+            'trailing bytes': frame + b'\x00',
+            'heartbeat with a body': protocol.encode_heartbeat() + b'\x00',
+            'short batch header': batch[:3],
+            'short batch timestamp': batch[:8],
+            'missing batch record': batch[:-len(frame) + 2],
+            'invalid UTF-8': frame[:-len('Tenggara')] + b'\xff' * len('Tenggara'),
+        }
+        for name, data in cases.items():
+            with self.subTest(name), self.assertRaises(protocol.FrameError):
+                protocol.decode_frame(data)
+
+
+class ChartDataTests(TestCase):
+    """The chart-data JSON endpoint"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+        self.end = timezone.now()
+        self.start = self.end - timedelta(hours=2)
+        readings = [
+            SensorReading(
+                device=self.device,
+                timestamp=self.start + timedelta(seconds=5 * i),
+                air_temperature=100.0 if i == 700 else 25 + (i % 10) / 10,
+            )
+            for i in range(1400)
+        ]
+        ingest.bulk_insert_readings([(reading, None) for reading in readings])
+
+    def get(self, **params):
+        params.setdefault('start', self.start.isoformat())
+        params.setdefault('end', self.end.isoformat())
+        return self.client.get(reverse('chart-data'), params)
+
+    def test_raw_series_within_budget(self):
+        response = self.get(fields='air_temperature,soil_ph', points=100)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(data['source'], 'raw')
+        temperatures = data['series']['air_temperature']
+        self.assertLessEqual(len(temperatures), 100)
+        self.assertEqual(max(value for _, value in temperatures), 100.0)
+        self.assertEqual(data['series']['soil_ph'], [])
+
+    def test_falls_back_to_rollups(self):
+        with self.settings(CHART_MAX_SOURCE_ROWS=500):
+            data = self.get(fields='air_temperature', points=50, mode='minmax').json()
+        self.assertEqual(data['source'], 'minute')
+        self.assertLessEqual(len(data['series']['air_temperature']), 50)
+
+    def test_missing_day_rollups_do_not_force_raw(self):
+        DayRollup.objects.all().delete()
+        with self.settings(CHART_MAX_SOURCE_ROWS=500):
+            data = self.get(fields='air_temperature', points=50).json()
+        self.assertEqual(data['source'], 'minute')
+
+    def test_raw_load_is_capped(self):
+        times, columns = charts.load_columns(
+            self.device, charts.RAW, self.start, self.end, ['air_temperature'], max_rows=300
+        )
+        self.assertEqual(len(times), 300)
+        self.assertEqual(len(columns['air_temperature']), 300)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.get(fields='battery').status_code, 400)
+        self.assertEqual(self.get(points=10 ** 6).status_code, 400)
+        self.assertEqual(self.get(mode='average').status_code, 400)
+        self.assertEqual(self.get(start='yesterday').status_code, 400)
+        self.assertEqual(self.get(device='unknown').status_code, 404)
+
+
+class ExportTests(TestCase):
+    """Streaming reading export"""
+
+    def setUp(self):
+        self.device = Device.objects.create(name='Sensor 1', device_uuid='AA:BB:CC:DD:EE:01')
+        self.now = timezone.now()
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=self.now - timedelta(minutes=i), soil_ph=6.0 + i / 100)
+            for i in range(25)
+        ])
+
+    def get(self, **params):
+        response = self.client.get(reverse('export-readings'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_is_oldest_first_across_chunks(self):
+        with self.settings(SENSOR_EXPORT_CHUNK_SIZE=4):
+            lines = self.get().decode().splitlines()
+
+        self.assertEqual(lines[0].split(',')[:3], ['device_uuid', 'id', 'timestamp'])
+        self.assertEqual(len(lines), 26)
+        timestamps = [line.split(',')[2] for line in lines[1:]]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_gzipped_ndjson_with_range(self):
+        body = self.get(format='ndjson', gzip='1', start=(self.now - timedelta(minutes=9, seconds=30)).isoformat())
+        records = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records[-1]['soil_ph'], 6.0)
+        self.assertEqual(records[0]['device_uuid'], 'AA:BB:CC:DD:EE:01')
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        # About 150 bytes per CSV line: several 64 KiB chunks
+        await SensorReading.objects.abulk_create([
+            SensorReading(device=self.device, timestamp=self.now - timedelta(hours=1, seconds=i), soil_ph=6.5)
+            for i in range(2000)
+        ])
+        response = await self.async_client.get(reverse('export-readings'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks).decode().count('\n'), 2026)
+
+
+class FakeClassifier:
+    """Stands in for the TFLite classifier; echoes one pixel back as its score"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, images):
+        self.batch_sizes.append(len(images))
+        return images[:, 0, 0, :2].copy()
+
+    def describe(self, probabilities):
+        return {'penyakit': int(np.argmax(probabilities)), 'confidence': float(probabilities.max())}
+
+
+class BatchSchedulerTests(TestCase):
+    """Cross-request micro-batching of SoySmart inference"""
+
+    def image(self, first, second):
+        image = np.zeros((*inference.INPUT_SIZE, 3), dtype=np.float32)
+        image[0, 0, :2] = first, second
+        return image
+
+    def test_requests_share_a_batch_and_get_their_own_result(self):
+        classifier = FakeClassifier()
+        scheduler = inference.BatchScheduler(classifier, max_batch_size=8, max_wait=0.5)
+        futures = [scheduler.submit(self.image(i % 2, 1 - i % 2)) for i in range(8)]
+
+        results = [future.result(timeout=5) for future in futures]
+        scheduler.close()
+
+        self.assertEqual(classifier.batch_sizes, [8])
+        self.assertEqual([result['penyakit'] for result in results], [1, 0] * 4)
+
+    def test_batch_size_is_capped(self):
+        classifier = FakeClassifier()
+        scheduler = inference.BatchScheduler(classifier, max_batch_size=3, max_wait=0.5)
+        futures = [scheduler.submit(self.image(0, 1)) for _ in range(7)]
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.close()
+
+        self.assertLessEqual(max(classifier.batch_sizes), 3)
+        self.assertEqual(sum(classifier.batch_sizes), 7)
+
+    def test_pool_runs_batches_on_every_classifier(self):
+        classifiers = [FakeClassifier(), FakeClassifier()]
+        pool = inference.ClassifierPool(classifiers)
+        scheduler = inference.BatchScheduler(pool, max_batch_size=1, max_wait=0, workers=pool.size)
+        futures = [scheduler.submit(self.image(1, 0)) for _ in range(50)]
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.close()
+
+        self.assertEqual(sum(len(c.batch_sizes) for c in classifiers), 50)
+        self.assertEqual(pool._free.qsize(), 2)
+
+    def test_idle_runners_do_not_split_concurrent_requests(self):
+        classifiers = [FakeClassifier(), FakeClassifier()]
+        pool = inference.ClassifierPool(classifiers)
+        scheduler = inference.BatchScheduler(pool, max_batch_size=8, max_wait=0.5, workers=pool.size)
+        with ThreadPoolExecutor(8) as executor:
+            futures = list(executor.map(lambda i: scheduler.submit(self.image(1, 0)), range(8)))
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.close()
+
+        self.assertEqual(sorted(size for c in classifiers for size in c.batch_sizes), [8])
+
+    def test_requests_queue_into_one_batch_while_runners_are_busy(self):
+        classifier = _SlowClassifier(0.2)
+        scheduler = inference.BatchScheduler(classifier, max_batch_size=8, max_wait=0)
+        first = scheduler.submit(self.image(1, 0))
+        time.sleep(0.05)
+        futures = [scheduler.submit(self.image(1, 0)) for _ in range(5)]
+        for future in (first, *futures):
+            future.result(timeout=5)
+        scheduler.close()
+
+        self.assertEqual(classifier.batch_sizes, [1, 5])
+
+
+class _SlowClassifier(FakeClassifier):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def predict(self, images):
+        time.sleep(self.delay)
+        return super().predict(images)
+
+
+def _serve_stub_worker(address, authkey, delay=0.0, loaded=True):
+    """Inference process running the real server around a fake classifier"""
+    server = inference_worker._WorkerServer(address, authkey)
+
+    def load():
+        if loaded:
+            server.scheduler = inference.BatchScheduler(_SlowClassifier(delay), max_batch_size=4, max_wait=0.001)
+        else:
+            inference._status['error'] = 'model file missing'
+        server.loaded.set()
+
+    server.load = load
+    server.serve_forever()
+
+
+class InferenceWorkerTests(TestCase):
+    """Client, server and supervisor of the out-of-process inference worker"""
+
+    authkey = b'test-key'
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.address = os.path.join(tmp.name, 'worker.sock')
+        self.image = np.zeros((*inference.INPUT_SIZE, 3), dtype=np.float32)
+        self.image[0, 0, :2] = 0.2, 0.8
+
+    def start_worker(self, **kwargs):
+        process = multiprocessing.get_context('fork').Process(
+            target=_serve_stub_worker, args=(self.address, self.authkey), kwargs=kwargs, daemon=True,
+        )
+        process.start()
+        self.addCleanup(process.join, 5)
+        self.addCleanup(process.kill)
+        client = inference_worker.WorkerClient(self.address, self.authkey, timeout=2)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                client.ping(timeout=1)
+                return process
+            except inference_worker.WorkerError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.02)
+
+    def test_classify_round_trip_with_stage_timings(self):
+        process = self.start_worker()
+        client = inference_worker.WorkerClient(self.address, self.authkey)
+        timings = inference.StageTimings()
+
+        result = client.classify_sync(self.image, timings)
+
+        self.assertEqual(result['penyakit'], 1)
+        self.assertIn('transport', timings.stages)
+        self.assertIn('invoke', timings.stages)
+        self.assertEqual(client.ping()['pid'], process.pid)
+
+    def test_model_errors_and_wrong_keys_are_reported(self):
+        self.start_worker(loaded=False)
+        with self.assertRaisesMessage(inference.ModelError, 'model file missing'):
+            inference_worker.WorkerClient(self.address, self.authkey).classify_sync(self.image)
+        with self.assertRaisesMessage(inference_worker.WorkerError, 'handshake failed'):
+            inference_worker.WorkerClient(self.address, b'wrong-key').ping()
+
+    def test_slow_worker_times_out(self):
+        self.start_worker(delay=1.0)
+        client = inference_worker.WorkerClient(self.address, self.authkey, timeout=0.2)
+        with self.assertRaisesMessage(inference_worker.WorkerError, 'timed out'):
+            client.classify_sync(self.image)
+
+    def test_client_reconnects_after_the_worker_restarts(self):
+        process = self.start_worker()
+        client = inference_worker.WorkerClient(self.address, self.authkey, timeout=2)
+        client.classify_sync(self.image)  # Leaves an idle connection behind
+
+        process.kill()
+        process.join(5)
+        with self.assertRaisesMessage(inference_worker.WorkerError, 'unavailable'):
+            client.classify_sync(self.image)
+
+        self.start_worker()
+        self.assertEqual(client.classify_sync(self.image)['penyakit'], 1)
+
+    def test_stale_connection_is_retried_once(self):
+        process = self.start_worker()
+        client = inference_worker.WorkerClient(self.address, self.authkey, timeout=2)
+        client.classify_sync(self.image)
+        process.kill()
+        process.join(5)
+        self.start_worker()
+
+        # The idle connection points at the dead process; the retry uses a fresh one
+        self.assertEqual(client.classify_sync(self.image)['penyakit'], 1)
+
+
+class _FakeEvent:
+    """Stands in for Supervisor._stopping: records every wait instead of sleeping"""
+
+    def __init__(self, supervisor, restarts):
+        self.supervisor = supervisor
+        self.restarts = restarts
+        self.waits = []
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        return self.is_set()
+
+    def is_set(self):
+        return self.supervisor.restarts >= self.restarts
+
+    def set(self):
+        pass
+
+
+class SupervisorTests(TestCase):
+    """Restart policy of the inference worker supervisor"""
+
+    def supervisor(self, restarts, alive=True, ping=None):
+        supervisor = inference_worker.Supervisor('/tmp/unused.sock', b'key', health_interval=5, max_failures=3,
+                                                 log=lambda message: None)
+        supervisor._stopping = _FakeEvent(supervisor, restarts)
+        supervisor.start_process = mock.Mock(side_effect=lambda: setattr(
+            supervisor, 'process', mock.Mock(is_alive=mock.Mock(return_value=alive), exitcode=1, pid=1234)))
+        supervisor.stop_process = mock.Mock()
+        supervisor._client = mock.Mock(return_value=mock.Mock(ping=ping or mock.Mock()))
+        return supervisor
+
+    def test_exited_process_is_restarted_with_exponential_backoff(self):
+        supervisor = self.supervisor(restarts=3, alive=False)
+        supervisor.run()
+
+        self.assertEqual(supervisor.start_process.call_count, 4)
+        backoffs = [timeout for timeout in supervisor._stopping.waits if timeout != 5]
+        self.assertEqual(backoffs, [1, 2, 4])
+
+    def test_process_is_restarted_after_repeated_failed_health_checks(self):
+        ping = mock.Mock(side_effect=inference_worker.WorkerError('no answer'))
+        supervisor = self.supervisor(restarts=1, ping=ping)
+        supervisor.run()
+
+        self.assertEqual(ping.call_count, 3)
+        self.assertEqual(supervisor.start_process.call_count, 2)
+
+
+class PredictionCacheTests(TestCase):
+    """SoySmart AI results cached by upload content"""
+
+    def setUp(self):
+        inference.get_cache().clear()
+        self.scheduler = inference.BatchScheduler(FakeClassifier(), max_wait=0)
+        patcher = mock.patch.object(inference, 'get_scheduler', return_value=self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.scheduler.close)
+
+    def upload(self, color, content=None):
+        from PIL import Image
+
+        if content is None:
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+            content = buffer.getvalue()
+        image = SimpleUploadedFile('leaf.png', content, content_type='image/png')
+        return self.client.post(reverse('soysmart-ai'), {'image': image}, headers={'X-Requested-With': 'XMLHttpRequest'})
+
+    def test_repeat_upload_is_served_from_cache(self):
+        hits, misses = inference.CACHE_HITS.value, inference.CACHE_MISSES.value
+
+        first = self.upload((255, 0, 0)).json()
+        second = self.upload((255, 0, 0)).json()
+        self.upload((0, 255, 0))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.scheduler.images, 2)
+        self.assertEqual(inference.CACHE_HITS.value - hits, 1)
+        self.assertEqual(inference.CACHE_MISSES.value - misses, 2)
+        self.assertIn('soysmart_cache_hits_total', self.client.get(reverse('metrics')).content.decode())
+
+    def test_rejects_oversized_and_invalid_uploads(self):
+        with self.settings(SOYSMART_MAX_PIXELS=1000):
+            self.assertEqual(self.upload((255, 0, 0)).status_code, 400)
+        with self.settings(SOYSMART_MAX_UPLOAD_BYTES=10):
+            self.assertEqual(self.upload((255, 0, 0)).status_code, 400)
+        self.assertEqual(self.upload(None, content=b'not an image').status_code, 400)
+        self.assertEqual(self.scheduler.images, 0)
+
+    def test_stage_timings_are_returned_and_recorded(self):
+        response = self.upload((0, 0, 255))
+
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['read', 'cache', 'load', 'decode', 'resize', 'queue', 'checkout', 'invoke', 'describe', 'json', 'total'])
+        rendered = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('soysmart_stage_seconds_bucket{stage="invoke",le="+Inf"}', rendered)
+        self.assertIn('# TYPE soysmart_stage_seconds histogram', rendered)
+
+    def test_preprocess_draft_matches_full_decode(self):
+        from PIL import Image
+
+        pixels = np.random.default_rng(0).integers(0, 256, (600, 800, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, 'JPEG', quality=95)
+
+        buffer.seek(0)
+        full = np.asarray(Image.open(buffer).convert('RGB').resize(inference.INPUT_SIZE, Image.BILINEAR), dtype=np.float32) / 255
+        buffer.seek(0)
+        array = inference.preprocess(buffer)
+
+        self.assertEqual(array.shape, (*inference.INPUT_SIZE, 3))
+        self.assertEqual(array.dtype, np.float32)
+        self.assertLess(np.abs(array - full).mean(), 0.02)
+
+    def test_truncated_jpeg_is_rejected(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (0, 128, 0)).save(buffer, 'JPEG')
+        truncated = buffer.getvalue()[:len(buffer.getvalue()) // 2]
+
+        with self.assertRaises(inference.ImageRejected):
+            inference.preprocess(io.BytesIO(truncated))
+        response = self.upload(None, content=truncated)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class ReadinessTests(TestCase):
+    """The /readyz probe"""
+
+    def test_not_ready_until_preload_has_warmed_the_model(self):
+        with self.settings(SOYSMART_PRELOAD=True, SOYSMART_INFERENCE_BACKEND='local'):
+            with mock.patch.dict(inference._status, warmed=False, error='Model tidak ditemukan'):
+                response = self.client.get(reverse('readyz'))
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.json()['error'], 'Model tidak ditemukan')
+
+            with mock.patch.dict(inference._status, loaded=True, warmed=True, load_seconds=1.5, error=None):
+                response = self.client.get(reverse('readyz'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['load_seconds'], 1.5)
+
+    def test_lazy_loading_is_always_ready(self):
+        with self.settings(SOYSMART_PRELOAD=False, SOYSMART_INFERENCE_BACKEND='local'):
+            self.assertEqual(self.client.get(reverse('readyz')).status_code, 200)
+
+
+class ClassifyImagesTests(TestCase):
+    """Offline classification of a survey archive"""
+
+    class Classifier(FakeClassifier):
+        def describe(self, probabilities):
+            index = int(np.argmax(probabilities))
+            return {'penyakit': ['Sehat', 'Karat'][index], 'nama_ilmiah': '-', 'confidence': float(probabilities[index])}
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.archive = os.path.join(tmp.name, 'survey.zip')
+        self.report = os.path.join(tmp.name, 'report.csv')
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            for name, color in [('a/sehat.png', (255, 0, 0)), ('a/karat.png', (0, 255, 0)), ('b/sehat.jpg', (255, 0, 0))]:
+                buffer = io.BytesIO()
+                Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+                archive.writestr(name, buffer.getvalue())
+            archive.writestr('b/rusak.jpg', b'not an image')
+            archive.writestr('catatan.txt', b'skipped')
+
+        pool = inference.ClassifierPool([self.Classifier()])
+        patcher = mock.patch.object(inference.ClassifierPool, 'load', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def classify(self, *args):
+        call_command('classify_images', self.archive, '-o', self.report, '--workers', '0', *args, stdout=io.StringIO())
+        with open(self.report, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_classifies_every_image_in_the_archive(self):
+        rows = {row['file']: row for row in self.classify()}
+
+        self.assertEqual(sorted(rows), ['a/karat.png', 'a/sehat.png', 'b/rusak.jpg', 'b/sehat.jpg'])
+        self.assertEqual(rows['a/karat.png']['penyakit'], 'Karat')
+        self.assertEqual(rows['b/sehat.jpg']['penyakit'], 'Sehat')
+        self.assertEqual(rows['b/rusak.jpg']['error'], 'File bukan gambar yang valid')
+
+    def test_resume_skips_finished_images_and_drops_a_torn_line(self):
+        with open(self.report, 'w') as f:
+            f.write('file,penyakit,nama_ilmiah,confidence,error\r\na/sehat.png,Sehat,-,1.0,\r\na/kar')
+
+        rows = self.classify('--resume')
+
+        self.assertEqual([row['file'] for row in rows], ['a/sehat.png', 'a/karat.png', 'b/sehat.jpg', 'b/rusak.jpg'])
+
+
+class MetricsTests(TestCase):
+    """Prometheus text rendering"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', labelnames=('stage',), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.labels(stage='a').observe(value)
+
+        samples = {(name, labels.get('le')): value for name, labels, value in histogram.samples()}
+        self.assertEqual(samples[('test_seconds_bucket', 0.1)], 1)
+        self.assertEqual(samples[('test_seconds_bucket', 1)], 3)
+        self.assertEqual(samples[('test_seconds_count', None)], 4)
+        self.assertAlmostEqual(samples[('test_seconds_sum', None)], 4.05)
+
+    def test_device_messages_and_errors_are_counted_by_type(self):
+        consumer = DeviceConsumer()
+        consumer.send = mock.AsyncMock()
+        before = MESSAGES.labels('invalid').value, MESSAGE_ERRORS.labels('invalid', 'json').value, MESSAGES.labels('unknown').value
+
+        async_to_sync(consumer.receive)(text_data='{not json')
+        async_to_sync(consumer.receive)(text_data=json.dumps({'type': 'reboot'}))
+
+        after = MESSAGES.labels('invalid').value, MESSAGE_ERRORS.labels('invalid', 'json').value, MESSAGES.labels('unknown').value
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1, 1])
+
+    def test_snapshots_of_all_processes_are_merged(self):
+        dead_pid = 2 ** 22 + 1
+        while metrics._alive(dead_pid):
+            dead_pid += 1
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with open(os.path.join(tmp.name, f'{dead_pid}.json'), 'w') as f:
+            json.dump({
+                'device_messages_total': {'type': 'counter', 'documentation': 'x', 'aggregate': None,
+                                          'samples': [['device_messages_total', {'type': 'heartbeat'}, 5]]},
+                'websocket_connections': {'type': 'gauge', 'documentation': 'x', 'aggregate': 'sum',
+                                          'samples': [['websocket_connections', {'consumer': 'device'}, 3]]},
+            }, f)
+        own = MESSAGES.labels('heartbeat').value
+
+        for _ in range(2):  # The second time the exited process is read back from dead.json
+            families = metrics.collect(tmp.name)
+            samples = {(name, tuple(labels.values())): value for name, labels, value in families['device_messages_total']['samples']}
+            self.assertEqual(samples[('device_messages_total', ('heartbeat',))], own + 5)
+            gauges = families.get('websocket_connections', {'samples': []})['samples']
+            self.assertNotIn(3, [value for _, _, value in gauges])
+        self.assertEqual(sorted(os.listdir(tmp.name)), sorted(['.lock', 'dead.json', f'{os.getpid()}.json']))
+
+
+class BenchmarkSuiteTests(TestCase):
+    """Consumer and view benchmarks"""
+
+    def test_short_run_reports_every_benchmark(self):
+        with self.settings(DASHBOARD_MAX_UPDATES_PER_SECOND=0, SENSOR_BUFFER_ENABLED=False):
+            report = benchmarks.run(['device.sensor_data', 'dashboard.devices_data', 'view.dashboard'], iterations=3, devices=3, readings=5)
+
+        self.assertEqual(set(report['results']), {'device.sensor_data', 'dashboard.devices_data', 'view.dashboard'})
+        self.assertEqual(report['results']['dashboard.devices_data']['queries_per_op'], 1)
+        self.assertGreater(report['results']['device.sensor_data']['queries_per_op'], 0)
+
+    def test_compare_flags_slower_latency_and_extra_queries(self):
+        baseline = {'results': {'view.dashboard': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries_per_op': 2}}}
+        current = {'results': {'view.dashboard': {'p50_ms': 12.0, 'p95_ms': 30.0, 'queries_per_op': 3}}}
+
+        regressed = {field for _, field, _, _, slower in benchmarks.compare(baseline, current, 0.25) if slower}
+        self.assertEqual(regressed, {'p95_ms', 'queries_per_op'})
+
+
+class _RecordingLayer:
+    """Channel layer stand-in that records group_send calls"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+class BroadcastThrottleTests(TestCase):
+    """Per-group coalescing of dashboard updates"""
+
+    def test_rapid_publishes_coalesce_to_first_and_latest(self):
+        layer = _RecordingLayer()
+        throttle = fanout.BroadcastThrottle('test', min_interval=0.1, channel_layer=layer)
+
+        async def scenario():
+            for i in range(10):
+                await throttle.publish('group', {'n': i})
+            sent_at_once = len(layer.sent)
+            await asyncio.sleep(0.2)
+            return sent_at_once
+
+        self.assertEqual(async_to_sync(scenario)(), 1)
+        self.assertEqual(layer.sent, [('group', {'n': 0}), ('group', {'n': 9})])
+        self.assertEqual(throttle.coalesced, 8)
+
+    def test_window_timing(self):
+        layer = _RecordingLayer()
+        throttle = fanout.BroadcastThrottle('test', min_interval=0.2, channel_layer=layer)
+
+        async def scenario():
+            await throttle.publish('group', {'n': 0})
+            await throttle.publish('group', {'n': 1})
+            await asyncio.sleep(0.1)
+            early = len(layer.sent)
+            await asyncio.sleep(0.2)
+            return early
+
+        # The held message waits for the window to close, not longer
+        self.assertEqual(async_to_sync(scenario)(), 1)
+        self.assertEqual(len(layer.sent), 2)
+
+    def test_groups_are_throttled_separately(self):
+        layer = _RecordingLayer()
+        throttle = fanout.BroadcastThrottle('test', min_interval=10, channel_layer=layer)
+
+        async def scenario():
+            await throttle.publish('a', {'n': 0})
+            await throttle.publish('b', {'n': 0})
+
+        async_to_sync(scenario)()
+        self.assertEqual([group for group, _ in layer.sent], ['a', 'b'])
+
+    def test_new_event_loop_is_not_blocked_by_a_dead_timer(self):
+        layer = _RecordingLayer()
+        throttle = fanout.BroadcastThrottle('test', min_interval=10, channel_layer=layer)
+
+        async def publish(n):
+            await throttle.publish('group', {'n': n})
+
+        # The second message's timer dies with the first loop
+        async_to_sync(publish)(0)
+        async_to_sync(publish)(1)
+        async_to_sync(publish)(2)
+        self.assertEqual(layer.sent, [('group', {'n': 0}), ('group', {'n': 1}), ('group', {'n': 2})])
+
+
+class DashboardSubscriptionTests(TestCase):
+    """Per-device and summary groups of DashboardConsumer"""
+
+    def setUp(self):
+        self.devices = [Device.objects.create(name=f'Kebun {i}', device_uuid=f'sub-{i}') for i in range(2)]
+        for name in ('_throttle', '_summary'):
+            patcher = mock.patch.object(fanout, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_readings_reach_only_subscribers_and_the_summary(self):
+        async def scenario():
+            application = benchmarks.websocket_application()
+            first = await benchmarks.open_dashboard(application, subscribe=[self.devices[0]])
+            second = await benchmarks.open_dashboard(application, subscribe=[self.devices[1]])
+            overview = await benchmarks.open_dashboard(application)
+            await overview.send_json_to({'type': 'subscribe', 'devices': ['unknown-device'], 'summary': True})
+            subscriptions = await benchmarks.receive_type(overview, 'subscriptions')
+
+            device = await benchmarks.open_device(application, self.devices[0])
+            await device.send_json_to({'type': 'sensor_data', 'data': benchmarks.sensor_data(0)})
+            await benchmarks.receive_type(device, 'data_received')
+            update = await benchmarks.receive_type(first, 'sensor_update')
+            summary = await benchmarks.receive_type(overview, 'devices_summary')
+            missed = await second.receive_nothing(timeout=0.2)
+
+            await first.send_json_to({'type': 'unsubscribe', 'devices': ['sub-0']})
+            unsubscribed = await benchmarks.receive_type(first, 'subscriptions')
+            for communicator in (first, second, overview, device):
+                await communicator.disconnect()
+            return subscriptions, update, summary, missed, unsubscribed
+
+        with self.settings(DASHBOARD_MAX_UPDATES_PER_SECOND=0, DASHBOARD_SUMMARY_INTERVAL=0.05, SENSOR_BUFFER_ENABLED=False):
+            subscriptions, update, summary, missed, unsubscribed = async_to_sync(scenario)()
+
+        self.assertEqual((subscriptions['devices'], subscriptions['summary'], subscriptions['unknown']), ([], True, ['unknown-device']))
+        self.assertEqual(update['device_uuid'], 'sub-0')
+        self.assertEqual([entry['device_uuid'] for entry in summary['devices']], ['sub-0'])
+        self.assertTrue(missed)
+        self.assertEqual(unsubscribed['devices'], [])
+
+
+class GenerateSensorDataTests(TestCase):
+    """Synthetic history generator"""
+
+    def test_rollups_match_a_rebuild_from_the_readings(self):
+        call_command('generate_sensor_data', '--devices', '2', '--days', '1.5', '--interval', '300',
+                     '--chunk-size', '100', '--seed', '1', stdout=io.StringIO())
+
+        devices = Device.objects.filter(device_uuid__startswith='synthetic-')
+        self.assertEqual(devices.count(), 2)
+        self.assertEqual(SensorReading.objects.count(), 2 * 432)
+        latest = LatestReading.objects.get(device=devices[0])
+        self.assertEqual(latest.timestamp, SensorReading.objects.filter(device=devices[0]).latest('timestamp').timestamp)
+
+        columns = [f'{field}_{stat}' for field in rollups.ROLLUP_FIELDS for stat in ('min', 'max', 'sum', 'count')]
+
+        def dump():
+            return {
+                model: sorted(model.objects.values_list('device_id', 'bucket', 'count', 'last_reading_at', 'wind_direction', *columns))
+                for model in (MinuteRollup, HourRollup, DayRollup)
+            }
 
-# Create your tests here.
+        generated = dump()
+        days = SensorReading.objects.filter(device=devices[0]).datetimes('timestamp', 'day').count()
+        self.assertEqual(len(generated[DayRollup]), 2 * days)
+        first, last = SensorReading.objects.order_by('timestamp')[0], SensorReading.objects.latest('timestamp')
+        rollups.rebuild(first.timestamp, last.timestamp + timedelta(seconds=1))
+        rebuilt = dump()
+        for model, rows in generated.items():
+            self.assertEqual(len(rows), len(rebuilt[model]))
+            for row, expected in zip(rows, rebuilt[model]):
+                self.assertEqual(row[:5], expected[:5])
+                np.testing.assert_allclose(row[5:], expected[5:], rtol=1e-9)
@@ -1,23 +1,16 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from .models import Device, SensorReading
+from . import charts, downsample, export, inference, metrics, rollups
+from .models import Device
+from django.conf import settings
 from django.utils import timezone
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from pathlib import Path
-from datetime import datetime, time
+from django.views.decorators.http import require_GET
+from datetime import datetime, time, timedelta
 import json
-import os
-import threading
-
-# Suppress TensorFlow logging
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-
-# Global cache for TFLite model (thread-safe)
-_interpreter_cache = None
-_rekomendasi_cache = None
-_model_lock = threading.Lock()
-_model_loaded = False
 
 
 def dashboard(request):
@@ -26,7 +19,7 @@ def dashboard(request):
     Data automatically resets when the day changes.
     Further real-time updates are handled by WebSocket.
     """
-    device = Device.objects.first()
+    device = Device.objects.select_related('latest_reading').first()
     latest_reading = None
     historical_data = []
     
@@ -41,39 +34,30 @@ def dashboard(request):
         end_of_day = timezone.make_aware(datetime.combine(today, time.max))
         
         # Get latest reading from today only
-        latest_reading = SensorReading.objects.filter(
-            device=device,
-            timestamp__gte=start_of_day,
-            timestamp__lte=end_of_day
-        ).order_by('-timestamp').first()
+        latest_reading = getattr(device, 'latest_reading', None)
+        if latest_reading and not start_of_day <= latest_reading.timestamp <= end_of_day:
+            latest_reading = None
         
-        # Get all readings from today for charts (limit to last 100 for performance)
-        readings = SensorReading.objects.filter(
-            device=device,
-            timestamp__gte=start_of_day,
-            timestamp__lte=end_of_day
-        ).order_by('-timestamp')[:100]
-        
-        # Reverse to get chronological order
-        readings = reversed(readings)
+        # Chart data for today comes from the per-minute rollups (last 100 minutes with data)
+        points = rollups.series(device, 'minute', start_of_day, end_of_day, limit=100)
         
         # Prepare data for charts
-        for reading in readings:
+        for point in points:
             # Convert to Asia/Jakarta timezone
-            local_time = timezone.localtime(reading.timestamp)
+            local_time = timezone.localtime(point['bucket'])
             
             historical_data.append({
                 'timestamp': local_time.strftime('%H:%M:%S'),
-                'air_temperature': float(reading.air_temperature) if reading.air_temperature else 0,
-                'air_humidity': float(reading.air_humidity) if reading.air_humidity else 0,
-                'soil_moisture': float(reading.soil_moisture) if reading.soil_moisture else 0,
-                'soil_ph': float(reading.soil_ph) if reading.soil_ph else 7,
-                'wind_speed': float(reading.wind_speed) if reading.wind_speed else 0,
-                'wind_direction': reading.wind_direction if reading.wind_direction else 'N/A',
-                'rainfall': float(reading.rainfall) if reading.rainfall else 0,
-                'nitrogen': float(reading.nitrogen) if reading.nitrogen else 0,
-                'phosphorus': float(reading.phosphorus) if reading.phosphorus else 0,
-                'potassium': float(reading.potassium) if reading.potassium else 0,
+                'air_temperature': round(point['air_temperature'], 2) if point['air_temperature'] else 0,
+                'air_humidity': round(point['air_humidity'], 2) if point['air_humidity'] else 0,
+                'soil_moisture': round(point['soil_moisture'], 2) if point['soil_moisture'] else 0,
+                'soil_ph': round(point['soil_ph'], 2) if point['soil_ph'] else 7,
+                'wind_speed': round(point['wind_speed'], 2) if point['wind_speed'] else 0,
+                'wind_direction': point['wind_direction'] if point['wind_direction'] else 'N/A',
+                'rainfall': round(point['rainfall_total'], 2) if point['rainfall_total'] else 0,
+                'nitrogen': round(point['nitrogen'], 2) if point['nitrogen'] else 0,
+                'phosphorus': round(point['phosphorus'], 2) if point['phosphorus'] else 0,
+                'potassium': round(point['potassium'], 2) if point['potassium'] else 0,
             })
 
     context = {
@@ -85,6 +69,116 @@ def dashboard(request):
     }
     return render(request, 'dashboard.html', context)
 
+@require_GET
+def chart_data(request):
+    """
+    Downsampled sensor series for a device and time range, as JSON.
+
+    Query parameters: ``device`` (UUID, defaults to the first device),
+    ``start`` and ``end`` (date or ISO datetime, defaults to the last 24
+    hours), ``fields`` (comma separated), ``points`` and ``mode``
+    (``lttb`` or ``minmax``).
+    """
+    device_uuid = request.GET.get('device')
+    if device_uuid:
+        device = Device.objects.filter(device_uuid=device_uuid).first()
+    else:
+        device = Device.objects.first()
+    if device is None:
+        return JsonResponse({'error': 'Device not found'}, status=404)
+
+    try:
+        end = charts.parse_moment(request.GET['end']) if request.GET.get('end') else timezone.now()
+        start = charts.parse_moment(request.GET['start']) if request.GET.get('start') else end - timedelta(days=1)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if start >= end:
+        return JsonResponse({'error': 'start must be before end'}, status=400)
+
+    fields = [field for field in request.GET.get('fields', '').split(',') if field] or list(rollups.ROLLUP_FIELDS)
+    unknown = [field for field in fields if field not in rollups.ROLLUP_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f'Unknown fields: {", ".join(unknown)}'}, status=400)
+
+    max_points = getattr(settings, 'CHART_MAX_POINTS', 2000)
+    try:
+        points = int(request.GET.get('points', getattr(settings, 'CHART_DEFAULT_POINTS', 500)))
+    except ValueError:
+        return JsonResponse({'error': 'points must be an integer'}, status=400)
+    if not 3 <= points <= max_points:
+        return JsonResponse({'error': f'points must be between 3 and {max_points}'}, status=400)
+
+    mode = request.GET.get('mode', 'lttb')
+    if mode not in downsample.MODES:
+        return JsonResponse({'error': f'mode must be one of: {", ".join(downsample.MODES)}'}, status=400)
+
+    data = charts.chart_series(
+        device, start, end, fields, points, mode,
+        max_rows=getattr(settings, 'CHART_MAX_SOURCE_ROWS', 20000),
+    )
+    return JsonResponse({
+        'device': device.device_uuid,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': points,
+        'mode': mode,
+        **data,
+    })
+
+
+@require_GET
+def export_readings(request):
+    """
+    Stream sensor readings as a CSV or NDJSON download.
+
+    Query parameters: ``device`` (UUID, may repeat; all devices by
+    default), ``start`` and ``end`` (date or ISO datetime), ``format``
+    (``csv`` or ``ndjson``) and ``gzip`` (``1`` to compress).
+    """
+    format = request.GET.get('format', 'csv')
+    if format not in export.FORMATS:
+        return JsonResponse({'error': f'format must be one of: {", ".join(export.FORMATS)}'}, status=400)
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+
+    try:
+        start = charts.parse_moment(request.GET['start']) if request.GET.get('start') else None
+        end = charts.parse_moment(request.GET['end']) if request.GET.get('end') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    devices = Device.objects.order_by('pk')
+    device_uuids = request.GET.getlist('device')
+    if device_uuids:
+        devices = list(devices.filter(device_uuid__in=device_uuids))
+        missing = set(device_uuids) - {device.device_uuid for device in devices}
+        if missing:
+            return JsonResponse({'error': f'Unknown devices: {", ".join(sorted(missing))}'}, status=404)
+
+    rows = export.iter_rows(devices, start, end, chunk_size=getattr(settings, 'SENSOR_EXPORT_CHUNK_SIZE', 2000))
+    chunks = export.stream(rows, format, compress)
+    if isinstance(request, ASGIRequest):
+        # Daphne: stream chunk by chunk instead of letting Django buffer the whole export
+        chunks = export.aiter_chunks(chunks)
+    response = StreamingHttpResponse(
+        chunks,
+        content_type='application/gzip' if compress else export.FORMATS[format],
+    )
+    name = export.filename(format, compress, timezone.localtime(timezone.now()))
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+def readyz(request):
+    """Readiness probe: 200 once SoySmart AI can answer without a cold start, else 503"""
+    status = inference.readiness()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
+
+def metrics_view(request):
+    """Process metrics in the Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 def water_pump(request):
     if request.method == 'POST':
         # Example: Toggle water pump status
@@ -194,97 +288,77 @@ def device(request):
     return render(request, 'device.html', context)
 
 
-def soysmart_ai(request):
+async def _soysmart_predict(request, timings):
+    """Classify the uploaded leaf image, returning the JSON response"""
+    try:
+        # Validate image upload
+        if 'image' not in request.FILES:
+            return JsonResponse({'error': 'Tidak ada file gambar'}, status=400)
+
+        img_file = request.FILES['image']
+        if not img_file.content_type.startswith('image/'):
+            return JsonResponse({'error': 'File harus berupa gambar'}, status=400)
+        max_bytes = getattr(settings, 'SOYSMART_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+        if img_file.size > max_bytes:
+            return JsonResponse({'error': f'Ukuran file terlalu besar (maksimal {max_bytes // (1024 * 1024)} MB)'}, status=400)
+
+        # Re-uploads of the same photo are answered from the cache
+        cache = inference.get_cache()
+        with timings.stage('read'):
+            key = inference.cache_key(await sync_to_async(inference.upload_digest, thread_sensitive=False)(img_file))
+        with timings.stage('cache'):
+            cached = await cache.aget(key)
+        if cached is not None:
+            inference.CACHE_HITS.inc()
+            with timings.stage('json'):
+                return JsonResponse(cached)
+        inference.CACHE_MISSES.inc()
+
+        # Load model on first request; concurrent uploads share one batch scheduler
+        try:
+            with timings.stage('load'):
+                scheduler = await sync_to_async(inference.get_scheduler, thread_sensitive=False)()
+        except inference.ModelError as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        except Exception as e:
+            return JsonResponse({'error': f'Gagal memuat model: {str(e)}'}, status=500)
+
+        # Preprocess image for model input (224x224 RGB) off the event loop
+        try:
+            img_array = await sync_to_async(inference.preprocess, thread_sensitive=False)(img_file, timings=timings)
+        except inference.ImageRejected as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Perform inference together with any other pending uploads
+        try:
+            result = await scheduler.classify(img_array, timings)
+        except inference.ModelError as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        except Exception as e:
+            return JsonResponse({'error': f'Gagal melakukan prediksi: {str(e)}'}, status=500)
+
+        with timings.stage('cache'):
+            await cache.aset(key, result, getattr(settings, 'SOYSMART_CACHE_TTL', 86400))
+        with timings.stage('json'):
+            return JsonResponse(result)
+
+    except Exception as e:
+        return JsonResponse({'error': f'Terjadi kesalahan: {str(e)}'}, status=500)
+
+
+async def soysmart_ai(request):
     """
     SoySmart AI - Soybean disease detection using TensorFlow Lite
     Supports 8 disease classes with confidence scoring
     """
     if request.method == 'POST' and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        try:
-            with _model_lock:
-                global _interpreter_cache, _rekomendasi_cache, _model_loaded
-                
-                # Lazy load model on first request
-                if _interpreter_cache is None and not _model_loaded:
-                    try:
-                        import tensorflow as tf
-                        from PIL import Image
-                        import io
-                        import numpy as np
-                        
-                        BASE_DIR = Path(__file__).resolve().parent.parent
-                        model_path = os.path.join(BASE_DIR, 'model', 'model_kedelai_v1.tflite')
-                        rekomendasi_path = os.path.join(BASE_DIR, 'model', 'rekomendasi.json')
-                        
-                        if not os.path.exists(model_path):
-                            return JsonResponse({'error': 'Model tidak ditemukan'}, status=500)
-                        
-                        # Initialize TFLite interpreter
-                        _interpreter_cache = tf.lite.Interpreter(model_path=model_path)
-                        _interpreter_cache.allocate_tensors()
-                        
-                        # Load disease information
-                        with open(rekomendasi_path, 'r', encoding='utf-8') as f:
-                            _rekomendasi_cache = json.load(f)
-                        
-                        _model_loaded = True
-                        
-                    except Exception as e:
-                        return JsonResponse({'error': f'Gagal memuat model: {str(e)}'}, status=500)
-                
-                if _interpreter_cache is None:
-                    return JsonResponse({'error': 'Model belum berhasil dimuat'}, status=500)
-                
-                # Import required libraries
-                from PIL import Image
-                import io
-                import numpy as np
-                
-                # Validate image upload
-                if 'image' not in request.FILES:
-                    return JsonResponse({'error': 'Tidak ada file gambar'}, status=400)
-                
-                img_file = request.FILES['image']
-                if not img_file.content_type.startswith('image/'):
-                    return JsonResponse({'error': 'File harus berupa gambar'}, status=400)
-                
-                # Preprocess image for model input (224x224 RGB)
-                img = Image.open(io.BytesIO(img_file.read()))
-                img = img.convert('RGB')
-                img = img.resize((224, 224), Image.BILINEAR)
-                img_array = np.array(img, dtype=np.float32) / 255.0
-                img_array = np.expand_dims(img_array, axis=0)
-                
-                # Perform inference
-                try:
-                    input_details = _interpreter_cache.get_input_details()
-                    output_details = _interpreter_cache.get_output_details()
-                    
-                    _interpreter_cache.set_tensor(input_details[0]['index'], img_array)
-                    _interpreter_cache.invoke()
-                    predictions = _interpreter_cache.get_tensor(output_details[0]['index'])
-                    
-                    # Extract prediction results
-                    labels = list(_rekomendasi_cache.keys())
-                    predicted_index = np.argmax(predictions[0])
-                    confidence = float(predictions[0][predicted_index])
-                    predicted_class = labels[predicted_index]
-                    
-                    # Return disease information with recommendations
-                    disease_info = _rekomendasi_cache[predicted_class]
-                    return JsonResponse({
-                        'penyakit': predicted_class,
-                        'nama_ilmiah': disease_info['nama_ilmiah'],
-                        'deskripsi': disease_info['deskripsi'],
-                        'rekomendasi': disease_info['rekomendasi'],
-                        'confidence': confidence
-                    })
-                    
-                except Exception as e:
-                    return JsonResponse({'error': f'Gagal melakukan prediksi: {str(e)}'}, status=500)
-            
-        except Exception as e:
-            return JsonResponse({'error': f'Terjadi kesalahan: {str(e)}'}, status=500)
-    
+        # Time spent in each stage is returned in Server-Timing and kept in histograms
+        timings = inference.StageTimings()
+        with timings.stage('total'):
+            response = await _soysmart_predict(request, timings)
+        timings.observe()
+        response['Server-Timing'] = timings.header()
+        return response
+
     # GET request - render upload page
-    return render(request, 'soysmart-ai.html', {'active_page': 'soysmart-ai'})
+    return await sync_to_async(render)(request, 'soysmart-ai.html', {'active_page': 'soysmart-ai'})
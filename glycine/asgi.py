@@ -12,6 +12,23 @@ django_asgi_app = get_asgi_application()
 
 # Now import routing after Django is setup
 import glycine.routing
+from django.conf import settings
+
+# Load and warm up the SoySmart model in the background so the first upload
+# after a deploy does not wait for it; /readyz reports when it is done
+if getattr(settings, 'SOYSMART_PRELOAD', False):
+    from core import inference
+    inference.start_preload()
+
+# Publish this process's metrics for /metrics to merge with its siblings
+from core import metrics
+metrics.start_writer()
+
+# Mark this worker's devices offline in the database when it shuts down.
+# atexit runs in reverse order, so buffered readings are written first.
+from core import ingest, presence
+presence.flush_at_exit()
+ingest.flush_at_exit()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
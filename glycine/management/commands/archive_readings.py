@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from core import archive
+from core.models import Device, SensorReading
+
+
+class Command(BaseCommand):
+    help = ('Moves sensor readings older than the retention period into compressed '
+            'monthly archive files and deletes them from the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive readings older than this many days. Defaults to SENSOR_RETENTION_DAYS.')
+        parser.add_argument('--device', action='append', dest='devices', metavar='DEVICE_UUID',
+                            help='Only archive this device. May be given more than once.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows fetched and deleted per query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many readings would be archived.')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is None:
+            days = getattr(settings, 'SENSOR_RETENTION_DAYS', 90)
+        if days < 1:
+            raise CommandError('--older-than-days must be at least 1.')
+        cutoff = timezone.now() - timedelta(days=days)
+
+        device_ids = None
+        if options['devices']:
+            devices = dict(Device.objects.filter(device_uuid__in=options['devices']).values_list('device_uuid', 'pk'))
+            missing = set(options['devices']) - set(devices)
+            if missing:
+                raise CommandError(f'Unknown devices: {", ".join(sorted(missing))}')
+            device_ids = list(devices.values())
+
+        if options['dry_run']:
+            readings = SensorReading.objects.filter(timestamp__lt=cutoff)
+            if device_ids is not None:
+                readings = readings.filter(device_id__in=device_ids)
+            for row in readings.order_by().values('device_id').annotate(total=Count('id')):
+                self.stdout.write(f"Device {row['device_id']}: {row['total']} readings would be archived")
+            return
+
+        self.stdout.write(f'Archiving readings older than {timezone.localtime(cutoff)} to {archive.archive_dir()}...')
+        total = 0
+        for device_id, month, count in archive.archive_readings(cutoff, device_ids, options['chunk_size']):
+            if count:
+                self.stdout.write(f'Device {device_id} {month.strftime("%Y-%m")}: {count} readings archived')
+            total += count
+        self.stdout.write(self.style.SUCCESS(f'Successfully archived {total} readings.'))
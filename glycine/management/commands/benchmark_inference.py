@@ -0,0 +1,105 @@
+import statistics
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import inference
+from core.stats import percentile
+
+
+def parse_list(value, cast):
+    """Parse a comma separated list of numbers."""
+    try:
+        return [cast(item) for item in value.split(',') if item]
+    except ValueError:
+        raise CommandError(f'Invalid list: {value}')
+
+
+class Command(BaseCommand):
+    help = ('Measures SoySmart AI latency (p50/p99) and throughput for each combination '
+            'of batch size and batch wait, with concurrent simulated uploads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-sizes', default='1,4,8,16', help='Comma separated maximum batch sizes.')
+        parser.add_argument('--waits', default='0,0.005,0.01,0.02', help='Comma separated batch waits in seconds.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Number of simultaneous clients.')
+        parser.add_argument('--requests', type=int, default=400, help='Images classified per setting.')
+        parser.add_argument('--interpreters', default=None,
+                            help='Comma separated interpreter pool sizes. Defaults to SOYSMART_INTERPRETERS.')
+        parser.add_argument('--num-threads', type=int, default=None,
+                            help='Threads per interpreter. Defaults to SOYSMART_NUM_THREADS.')
+        parser.add_argument('--image', help='Leaf image to classify. Defaults to random pixels.')
+
+    def handle(self, *args, **options):
+        if options['interpreters']:
+            pool_sizes = parse_list(options['interpreters'], int)
+        else:
+            pool_sizes = [inference.interpreter_count()]
+        num_threads = options['num_threads'] or getattr(settings, 'SOYSMART_NUM_THREADS', 1)
+        try:
+            pool = inference.ClassifierPool.load(max(pool_sizes), num_threads=num_threads)
+        except Exception as e:
+            raise CommandError(f'Failed to load the model: {e}')
+
+        if options['image']:
+            with open(options['image'], 'rb') as f:
+                image = inference.preprocess(f)
+        else:
+            image = np.random.default_rng(0).random((*inference.INPUT_SIZE, 3), dtype=np.float32)
+
+        # Warm up every interpreter before timing anything
+        for classifier in pool.classifiers:
+            classifier.predict(np.stack([image]))
+
+        self.stdout.write(f'{num_threads} thread(s) per interpreter')
+        self.stdout.write(
+            f'{"pool":>4} {"batch":>5} {"wait ms":>8} {"p50 ms":>8} {"p99 ms":>8} {"img/s":>8} {"avg batch":>9}'
+        )
+        for size in pool_sizes:
+            subpool = inference.ClassifierPool(pool.classifiers[:size])
+            for batch_size in parse_list(options['batch_sizes'], int):
+                for wait in parse_list(options['waits'], float):
+                    result = self.run(subpool, image, batch_size, wait, options['concurrency'], options['requests'])
+                    self.stdout.write(
+                        f'{size:>4} {batch_size:>5} {wait * 1000:>8.1f} {result["p50"] * 1000:>8.1f} '
+                        f'{result["p99"] * 1000:>8.1f} {result["throughput"]:>8.1f} {result["avg_batch"]:>9.2f}'
+                    )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
+
+    def run(self, pool, image, batch_size, wait, concurrency, total):
+        scheduler = inference.BatchScheduler(pool, max_batch_size=batch_size, max_wait=wait, workers=pool.size)
+        latencies = []
+        remaining = [total]
+        lock = threading.Lock()
+
+        def client():
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                scheduler.submit(image).result()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - started
+        scheduler.close()
+
+        latencies.sort()
+        return {
+            'p50': statistics.median(latencies),
+            'p99': percentile(latencies, 0.99),
+            'throughput': len(latencies) / duration,
+            'avg_batch': scheduler.images / max(scheduler.batches, 1),
+        }
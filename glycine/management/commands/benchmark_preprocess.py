@@ -0,0 +1,133 @@
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core import inference
+
+
+def legacy_preprocess(path):
+    """The original pipeline: read into memory, copy to BytesIO, decode at full size."""
+    from PIL import Image
+
+    with open(path, 'rb') as f:
+        img = Image.open(io.BytesIO(f.read()))
+        img = img.convert('RGB')
+        img = img.resize(inference.INPUT_SIZE, Image.BILINEAR)
+        img_array = np.array(img, dtype=np.float32) / 255.0
+        return np.expand_dims(img_array, axis=0)
+
+
+def current_preprocess(path):
+    with open(path, 'rb') as f:
+        return inference.preprocess(f, max_pixels=1 << 40)
+
+
+PIPELINES = {
+    'legacy': legacy_preprocess,
+    'current': current_preprocess,
+}
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter for this process where Linux allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    """Peak resident set size in KiB (VmHWM on Linux, ru_maxrss elsewhere)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(name, path, repeat, results):
+    """Run one pipeline in a fresh process and report its timings and peak RSS growth."""
+    import django
+    from PIL import Image  # noqa: F401 - imported before the baseline is taken
+
+    django.setup()
+    pipeline = PIPELINES[name]
+    reset_peak_rss()
+    baseline = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = pipeline(path)
+        timings.append(time.perf_counter() - started)
+    peak = peak_rss_kb()
+    results.put({
+        'median': statistics.median(timings),
+        'max': max(timings),
+        'peak_kb': peak - baseline,
+        'output': np.asarray(output, dtype=np.float32).reshape(*inference.INPUT_SIZE, 3),
+    })
+
+
+def make_photo(path, width=4000, height=3000):
+    """Write a 12 MP JPEG with smooth gradients and sensor-like noise."""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    channels = [
+        60 + 120 * x * y,
+        90 + 140 * (1 - y) * np.ones_like(x),
+        40 + 80 * x * np.ones_like(y),
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 8, (height, width, 3))
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=92)
+
+
+class Command(BaseCommand):
+    help = ('Compares per-image preprocessing time and peak memory of the original '
+            'and the draft-mode SoySmart AI decode paths on a large photo.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Photo to decode. Defaults to a generated 12 MP JPEG.')
+        parser.add_argument('--repeat', type=int, default=20, help='Decodes per pipeline.')
+
+    def handle(self, *args, **options):
+        path = options['image']
+        with tempfile.TemporaryDirectory() as tmp:
+            if not path:
+                path = os.path.join(tmp, 'photo.jpg')
+                make_photo(path)
+            elif not os.path.exists(path):
+                raise CommandError(f'No such file: {path}')
+
+            context = multiprocessing.get_context('spawn')
+            measured = {}
+            for name in PIPELINES:
+                results = context.Queue()
+                process = context.Process(target=measure, args=(name, path, options['repeat'], results))
+                process.start()
+                measured[name] = results.get()
+                process.join()
+            size = os.path.getsize(path)
+
+        self.stdout.write(f'{size / 1e6:.1f} MB image, {options["repeat"]} decodes per pipeline')
+        self.stdout.write(f'{"pipeline":>8} {"median ms":>10} {"max ms":>8} {"peak MB":>8}')
+        for name, result in measured.items():
+            self.stdout.write(
+                f'{name:>8} {result["median"] * 1000:>10.1f} {result["max"] * 1000:>8.1f} {result["peak_kb"] / 1024:>8.1f}'
+            )
+        difference = np.abs(measured['legacy']['output'] - measured['current']['output'])
+        self.stdout.write(f'Mean absolute input difference: {difference.mean():.4f} (max {difference.max():.4f})')
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
@@ -0,0 +1,82 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the device and dashboard consumers and the dashboard and SoySmart AI views '
+            'on a throwaway database and compares the results with a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='BENCHMARK',
+                            help=f'Benchmarks to run (default: all of {", ".join(benchmarks.BENCHMARKS)}).')
+        parser.add_argument('--iterations', type=int, default=200, help='Operations per benchmark.')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'),
+                            help='Baseline file to compare with.')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store this run as the new baseline instead of comparing.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed latency increase over the baseline, as a fraction.')
+        parser.add_argument('--output', '-o', help='Also write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or benchmarks.BENCHMARKS
+        unknown = set(names) - set(benchmarks.BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+        if 'InMemoryChannelLayer' not in settings.CHANNEL_LAYERS['default']['BACKEND']:
+            raise CommandError('Run the suite with --settings glycine.settings.benchmark '
+                               '(in-memory channel layer, SQLite).')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = benchmarks.run(names, options['iterations'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f'{"benchmark":<24} {"ops/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<24} {result["ops_per_second"]:>9.1f} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                f'{result["p99_ms"]:>8.2f} {result["queries_per_op"]:>8.2f}'
+            )
+        for name, reason in report['skipped'].items():
+            self.stdout.write(self.style.WARNING(f'{name:<24} skipped: {reason}'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            with open(baseline_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}.'))
+            return
+        if not os.path.exists(baseline_path):
+            self.stdout.write(f'No baseline at {baseline_path}; store one with --update-baseline.')
+            return
+
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        rows = benchmarks.compare(baseline, report, options['tolerance'])
+        self.stdout.write(f'\nCompared with the baseline from {baseline["environment"]["timestamp"]}:')
+        regressions = 0
+        for name, field, before, after, regressed in rows:
+            change = f'{100 * (after - before) / before:+.0f}%' if before else 'new'
+            line = f'{name:<24} {field:<15} {before:>9.2f} -> {after:>9.2f} ({change})'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'{regressions} regression(s) against the baseline.')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
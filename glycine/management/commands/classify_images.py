@@ -0,0 +1,190 @@
+import collections
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import inference
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+
+FIELDS = ['file', 'penyakit', 'nama_ilmiah', 'confidence', 'error']
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_images(source, skip):
+    """
+    Yield ``(name, data)`` for every image under ``source`` that is not in ``skip``.
+
+    ``data`` is a file path for directories, so workers read the file
+    themselves; archive members are read here, in order, and passed as bytes.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, source).replace(os.sep, '/')
+                if is_image(name) and name not in skip:
+                    yield name, path
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and is_image(member.filename) and member.filename not in skip:
+                    yield member.filename, archive.read(member)
+    elif tarfile.is_tarfile(source):
+        # Streamed so compressed tarballs are read once, front to back
+        with tarfile.open(source, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and is_image(member.name) and member.name not in skip:
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise CommandError(f'{source} is not a directory, zip or tar archive')
+
+
+def load_image(item):
+    """Worker process: decode one image into model input, or report why it cannot be"""
+    name, data = item
+    try:
+        with (io.BytesIO(data) if isinstance(data, bytes) else open(data, 'rb')) as f:
+            return name, inference.preprocess(f), None
+    except inference.ImageRejected as e:
+        return name, None, str(e)
+    except Exception as e:
+        return name, None, f'{type(e).__name__}: {e}'
+
+
+def completed(path, format):
+    """
+    Names already in a report from an interrupted run.
+
+    A partially written last line is cut off so appending continues cleanly.
+    """
+    with open(path, 'rb+') as f:
+        content = f.read()
+        end = content.rfind(b'\n') + 1
+        if end != len(content):
+            f.truncate(end)
+    lines = content[:end].decode('utf-8').splitlines()
+    if format == 'csv':
+        return {row['file'] for row in csv.DictReader(lines)}
+    return {json.loads(line)['file'] for line in lines if line}
+
+
+class Command(BaseCommand):
+    help = ('Classifies every leaf photo in a directory, zip or tar archive with the SoySmart AI '
+            'model and writes a CSV or NDJSON report.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory, zip or tar archive of images.')
+        parser.add_argument('--output', '-o', required=True, help='Report file.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help='Report format. Defaults to the output file extension, or csv.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip images already in the report and append to it.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Preprocessing processes. Defaults to the number of CPUs; 0 decodes in this process.')
+        parser.add_argument('--batch-size', type=int, default=32, help='Images per model invocation.')
+        parser.add_argument('--interpreters', type=int, default=None,
+                            help='Model interpreters. Defaults to SOYSMART_INTERPRETERS.')
+        parser.add_argument('--num-threads', type=int, default=None,
+                            help='Threads per interpreter. Defaults to SOYSMART_NUM_THREADS.')
+
+    def handle(self, *args, **options):
+        source, output = options['source'], options['output']
+        if not os.path.exists(source):
+            raise CommandError(f'No such file or directory: {source}')
+        format = options['format'] or ('ndjson' if output.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        done = set()
+        if options['resume'] and os.path.exists(output):
+            done = completed(output, format)
+            self.stdout.write(f'Resuming: {len(done)} image(s) already classified')
+
+        size = options['interpreters'] or inference.interpreter_count()
+        num_threads = options['num_threads'] or getattr(settings, 'SOYSMART_NUM_THREADS', 1)
+        try:
+            pool = inference.ClassifierPool.load(size, num_threads=num_threads)
+        except Exception as e:
+            raise CommandError(f'Failed to load the model: {e}')
+        scheduler = inference.BatchScheduler(
+            pool, max_batch_size=options['batch_size'], max_wait=0.05, workers=pool.size,
+        )
+
+        workers = os.cpu_count() if options['workers'] is None else options['workers']
+        items = iter_images(source, done)
+        if workers:
+            # Spawned, not forked: the parent already holds the TFLite interpreters
+            processes = multiprocessing.get_context('spawn').Pool(workers)
+            decoded = processes.imap(load_image, items, chunksize=4)
+        else:
+            processes = None
+            decoded = map(load_image, items)
+
+        append = bool(done)
+        with open(output, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, FIELDS) if format == 'csv' else None
+            if writer and not append:
+                writer.writeheader()
+
+            def write(row):
+                if writer:
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row) + '\n')
+
+            counts = collections.Counter()
+            pending = collections.deque()
+            window = options['batch_size'] * pool.size * 2
+            started = time.perf_counter()
+            try:
+                for name, image, error in decoded:
+                    pending.append((name, None if error else scheduler.submit(image), error))
+                    # Results are written in input order, keeping a few batches in flight
+                    while pending and (len(pending) >= window or pending[0][1] is None or pending[0][1].done()):
+                        self.finish(pending.popleft(), write, counts)
+                    if counts['total'] and counts['total'] % 500 == 0:
+                        self.report(counts, started)
+                while pending:
+                    self.finish(pending.popleft(), write, counts)
+            finally:
+                scheduler.close()
+                if processes:
+                    processes.terminate()
+
+        self.report(counts, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Classified {counts["classified"]} image(s), {counts["failed"]} failed, report written to {output}.'
+        ))
+
+    def finish(self, entry, write, counts):
+        name, future, error = entry
+        row = {'file': name}
+        if future is not None:
+            try:
+                result = future.result()
+                row.update(penyakit=result['penyakit'], nama_ilmiah=result['nama_ilmiah'],
+                           confidence=round(result['confidence'], 6))
+            except Exception as e:
+                error = str(e)
+        if error:
+            row['error'] = error
+            counts['failed'] += 1
+        else:
+            counts['classified'] += 1
+        counts['total'] += 1
+        write(row)
+
+    def report(self, counts, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{counts["total"]} image(s) in {elapsed:.1f}s ({counts["total"] / max(elapsed, 1e-9):.1f} img/s)')
@@ -0,0 +1,64 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import charts, export
+from core.models import Device
+
+
+class Command(BaseCommand):
+    help = 'Streams sensor readings (including archived months) to a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices', metavar='DEVICE_UUID',
+                            help='Only export this device. May be given more than once.')
+        parser.add_argument('--start', help='Start of the range (YYYY-MM-DD or ISO datetime).')
+        parser.add_argument('--end', help='End of the range, exclusive.')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv', help='Output format.')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--output', '-o', help='Output file. Defaults to standard output.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows fetched per query. Defaults to SENSOR_EXPORT_CHUNK_SIZE.')
+
+    def handle(self, *args, **options):
+        try:
+            start = charts.parse_moment(options['start']) if options['start'] else None
+            end = charts.parse_moment(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        devices = Device.objects.order_by('pk')
+        if options['devices']:
+            devices = list(devices.filter(device_uuid__in=options['devices']))
+            missing = set(options['devices']) - {device.device_uuid for device in devices}
+            if missing:
+                raise CommandError(f'Unknown devices: {", ".join(sorted(missing))}')
+
+        chunk_size = options['chunk_size'] or getattr(settings, 'SENSOR_EXPORT_CHUNK_SIZE', 2000)
+        counter = _Counter(export.iter_rows(devices, start, end, chunk_size=chunk_size))
+        chunks = export.stream(counter, options['format'], options['gzip'])
+
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f'Successfully exported {counter.count} readings to {options["output"]}.'))
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+
+
+class _Counter:
+    """Iterator wrapper counting the rows that pass through it"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
@@ -0,0 +1,242 @@
+import itertools
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core import ingest, rollups
+from core.models import Device, LatestReading, SensorReading
+
+# field: (start, minimum, maximum, typical change per hour, daily swing)
+# Ranges follow iot_device_simulator.py; temperature peaks and humidity dips mid-afternoon
+FIELDS = {
+    'air_temperature': (28.0, 20.0, 35.0, 0.5, 4.0),
+    'air_humidity': (75.0, 40.0, 90.0, 2.0, -10.0),
+    'soil_moisture': (60.0, 30.0, 80.0, 3.0, 0.0),
+    'soil_ph': (6.5, 5.5, 8.0, 0.1, 0.0),
+    'wind_speed': (10.0, 0.0, 25.0, 1.0, 3.0),
+    'nitrogen': (150.0, 80.0, 200.0, 5.0, 0.0),
+    'phosphorus': (90.0, 50.0, 150.0, 3.0, 0.0),
+    'potassium': (200.0, 150.0, 300.0, 5.0, 0.0),
+}
+DECIMALS = {'nitrogen': 0, 'phosphorus': 0, 'potassium': 0}
+WIND_DIRECTIONS = np.array(['Utara', 'Tenggara', 'Selatan', 'Barat'])
+RAIN_PROBABILITY = 0.03
+WIND_CHANGE_PROBABILITY = 0.05
+
+RESOLUTION_SECONDS = {'minute': 60, 'hour': 3600}
+
+
+def reflect(values, low, high):
+    """Fold an unbounded walk back into [low, high] so it stays smooth at the edges"""
+    width = high - low
+    folded = np.mod(values - low, 2 * width)
+    return low + np.where(folded > width, 2 * width - folded, folded)
+
+
+def build(model, count, columns):
+    """
+    ``count`` unsaved instances of ``model`` from column lists or constants.
+
+    Instances are created with positional arguments in field order, which
+    is several times faster than keyword arguments for millions of rows.
+    """
+    values = []
+    for field in model._meta.concrete_fields:
+        value = columns.get(field.attname)
+        values.append(value if isinstance(value, list) else itertools.repeat(value, count))
+    return [model(*row) for row in zip(*values)]
+
+
+class Generator:
+    """Smooth random walks for a fleet of devices, continued from one chunk to the next"""
+
+    def __init__(self, device_count, interval, seed=None):
+        self.interval = interval
+        self.rng = np.random.default_rng(seed)
+        # Unbounded walk position per device and field, before reflection
+        self.position = {
+            field: start + self.rng.normal(0, (high - low) / 10, device_count)
+            for field, (start, low, high, _, _) in FIELDS.items()
+        }
+        self.wind = self.rng.integers(0, len(WIND_DIRECTIONS), device_count)
+
+    def chunk(self, devices, hours_of_day):
+        """Readings of ``devices`` (a slice) at the given local hours of day, shape (devices, steps)"""
+        rows, steps = devices.stop - devices.start, len(hours_of_day)
+        step_scale = np.sqrt(self.interval / 3600)
+        daily = np.sin((hours_of_day - 8) / 24 * 2 * np.pi)  # Peaks at 14:00
+
+        values = {}
+        for field, (_, low, high, change, swing) in FIELDS.items():
+            steps_taken = self.rng.uniform(-change, change, (rows, steps)) * step_scale
+            walk = self.position[field][devices, None] + np.cumsum(steps_taken, axis=1)
+            self.position[field][devices] = walk[:, -1]
+            value = reflect(walk + swing * daily, low, high)
+            values[field] = np.round(value, DECIMALS.get(field, 1))
+
+        raining = self.rng.random((rows, steps)) < RAIN_PROBABILITY
+        values['rainfall'] = np.round(np.where(raining, self.rng.exponential(0.8, (rows, steps)), 0.0), 2)
+
+        # Wind direction holds for a while, then changes
+        changes = self.rng.random((rows, steps)) < WIND_CHANGE_PROBABILITY
+        picks = self.rng.integers(0, len(WIND_DIRECTIONS), (rows, steps))
+        picks[:, 0] = np.where(changes[:, 0], picks[:, 0], self.wind[devices])
+        changes[:, 0] = True
+        last_change = np.maximum.accumulate(np.where(changes, np.arange(steps), 0), axis=1)
+        direction = np.take_along_axis(picks, last_change, axis=1)
+        self.wind[devices] = direction[:, -1]
+        values['wind_direction'] = WIND_DIRECTIONS[direction]
+        return values
+
+
+def rollup_rows(model, resolution, device_ids, bucket_of, timestamps, values, day):
+    """Rollup instances for one chunk; ``bucket_of`` maps each step to its bucket number within ``day``"""
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket_of) != 0])
+    ends = np.r_[starts[1:], len(bucket_of)] - 1
+    counts = np.diff(np.r_[starts, len(bucket_of)])
+    buckets = len(starts)
+
+    stats = {}
+    for field in rollups.ROLLUP_FIELDS:
+        column = values[field]
+        stats[f'{field}_min'] = np.minimum.reduceat(column, starts, axis=1).ravel().tolist()
+        stats[f'{field}_max'] = np.maximum.reduceat(column, starts, axis=1).ravel().tolist()
+        stats[f'{field}_sum'] = np.add.reduceat(column, starts, axis=1).ravel().tolist()
+        stats[f'{field}_count'] = np.tile(counts, len(device_ids)).tolist()
+
+    if resolution == 'day':
+        bucket_starts = [day]
+    else:
+        seconds = RESOLUTION_SECONDS[resolution]
+        bucket_starts = [day + timedelta(seconds=int(b) * seconds) for b in bucket_of[starts]]
+    last_at = [timestamps[i] for i in ends]
+
+    return build(model, buckets * len(device_ids), {
+        'device_id': np.repeat(device_ids, buckets).tolist(),
+        'bucket': bucket_starts * len(device_ids),
+        'count': np.tile(counts, len(device_ids)).tolist(),
+        'last_reading_at': last_at * len(device_ids),
+        'wind_direction': values['wind_direction'][:, ends].ravel().tolist(),
+        **stats,
+    })
+
+
+class Command(BaseCommand):
+    help = ('Generates realistic synthetic sensor history (N devices x M days) with bulk inserts, '
+            'including rollups and latest readings, for performance testing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=10, help='Number of synthetic devices.')
+        parser.add_argument('--days', type=float, default=30, help='Days of history, ending now.')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between readings of a device.')
+        parser.add_argument('--prefix', default='synthetic', help='Device UUIDs are PREFIX-0001, PREFIX-0002, ...')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the existing data of these devices first.')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Readings generated and inserted per transaction.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT statement.')
+        parser.add_argument('--no-rollups', action='store_true',
+                            help='Skip the minute/hour/day rollups (rebuild them later with rebuild_rollups).')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset.')
+
+    def handle(self, *args, **options):
+        interval, count = options['interval'], options['devices']
+        if interval <= 0 or count <= 0 or options['days'] <= 0:
+            raise CommandError('--devices, --days and --interval must be positive.')
+
+        devices = self.create_devices(options['prefix'], count, options['replace'])
+        device_ids = np.array([device.pk for device in devices])
+
+        end = timezone.now().replace(microsecond=0)
+        end -= timedelta(seconds=int(end.timestamp()) % interval)
+        start = end - timedelta(days=options['days'])
+        steps_per_day = 86400 // interval
+        group = max(1, options['chunk_size'] // steps_per_day)
+        generator = Generator(count, interval, options['seed'])
+        total = int((end - start).total_seconds()) // interval * count
+        self.stdout.write(f'Generating {total:,} readings for {count} devices from '
+                          f'{timezone.localtime(start):%Y-%m-%d %H:%M} to {timezone.localtime(end):%Y-%m-%d %H:%M}...')
+
+        written = 0
+        started = time.perf_counter()
+        day = rollups.bucket_start(start, 'day')
+        while day < end:
+            day_end = rollups.next_bucket(day, 'day')
+            # Steps of this local day, aligned to the interval
+            first = max(int(start.timestamp()), int(day.timestamp()))
+            first += -first % interval
+            epochs = np.arange(first, int(min(day_end, end).timestamp()), interval)
+            if len(epochs):
+                offsets = epochs - int(day.timestamp())
+                timestamps = [day + timedelta(seconds=int(offset)) for offset in offsets]
+                for lower in range(0, count, group):
+                    chunk = slice(lower, min(lower + group, count))
+                    values = generator.chunk(chunk, offsets / 3600)
+                    with transaction.atomic():
+                        self.insert(device_ids[chunk], day, offsets, timestamps, values, options)
+                    written += values['rainfall'].size
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{timezone.localtime(day):%Y-%m-%d}: {written:,} readings '
+                                  f'({written / elapsed:,.0f}/s)')
+            day = day_end
+
+        self.finish(devices, generator.rng)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully generated {written:,} readings in {elapsed:.1f}s ({written / elapsed:,.0f} readings/s).'
+        ))
+
+    def create_devices(self, prefix, count, replace):
+        uuids = [f'{prefix}-{i:04d}' for i in range(1, count + 1)]
+        existing = Device.objects.filter(device_uuid__in=uuids)
+        if existing.exists():
+            if not replace:
+                raise CommandError(f'Devices {prefix}-* already exist; pass --replace to regenerate their data.')
+            for model in (SensorReading, LatestReading, *rollups.RESOLUTIONS.values()):
+                model.objects.filter(device__in=existing).delete()
+        Device.objects.bulk_create(
+            [Device(device_uuid=uuid, name=f'Synthetic {uuid}') for uuid in uuids],
+            ignore_conflicts=True,
+        )
+        devices = {device.device_uuid: device for device in Device.objects.filter(device_uuid__in=uuids)}
+        return [devices[uuid] for uuid in uuids]
+
+    def insert(self, device_ids, day, offsets, timestamps, values, options):
+        rows = len(device_ids) * len(timestamps)
+        columns = {field: values[field].ravel().tolist() for field in (*FIELDS, 'rainfall', 'wind_direction')}
+        readings = build(SensorReading, rows, {
+            'device_id': np.repeat(device_ids, len(timestamps)).tolist(),
+            'timestamp': timestamps * len(device_ids),
+            **columns,
+        })
+        SensorReading.objects.bulk_create(readings, batch_size=options['batch_size'])
+
+        if options['no_rollups']:
+            return
+        for resolution, model in rollups.RESOLUTIONS.items():
+            if resolution == 'day':
+                bucket_of = np.zeros(len(offsets), dtype=np.int64)
+            else:
+                bucket_of = offsets // RESOLUTION_SECONDS[resolution]
+            model.objects.bulk_create(
+                rollup_rows(model, resolution, device_ids.tolist(), bucket_of, timestamps, values, day),
+                batch_size=options['batch_size'],
+            )
+
+    def finish(self, devices, rng):
+        """Point each device's LatestReading and last_seen at its newest generated reading"""
+        newest = [
+            SensorReading.objects.filter(device=device).order_by('-timestamp').first()
+            for device in devices
+        ]
+        newest = [reading for reading in newest if reading is not None]
+        with transaction.atomic():
+            ingest.update_latest(newest)
+            Device.objects.bulk_update([
+                Device(pk=reading.device_id, status='offline', last_seen=reading.timestamp,
+                       battery_level=int(rng.integers(40, 100)))
+                for reading in newest
+            ], ['status', 'last_seen', 'battery_level'])
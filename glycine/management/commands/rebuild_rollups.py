@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import charts, rollups
+from core.models import Device, SensorReading
+
+
+def parse_moment(value):
+    """Parse a date or datetime argument as an aware local datetime."""
+    try:
+        return charts.parse_moment(value)
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+class Command(BaseCommand):
+    help = 'Backfills or repairs the minute/hour/day sensor rollups for a time range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Start of the range (YYYY-MM-DD or ISO datetime). Defaults to the oldest reading.')
+        parser.add_argument('--end', help='End of the range, exclusive. Defaults to now.')
+        parser.add_argument('--device', action='append', dest='devices', metavar='DEVICE_UUID',
+                            help='Only rebuild this device. May be given more than once.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched and inserted per query.')
+
+    def handle(self, *args, **options):
+        if options['start']:
+            start = parse_moment(options['start'])
+        else:
+            oldest = SensorReading.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+            if oldest is None:
+                self.stdout.write('No sensor readings to roll up.')
+                return
+            start = oldest
+        end = parse_moment(options['end']) if options['end'] else timezone.now()
+        if end <= start:
+            raise CommandError('--end must be after --start.')
+
+        device_ids = None
+        if options['devices']:
+            devices = dict(Device.objects.filter(device_uuid__in=options['devices']).values_list('device_uuid', 'pk'))
+            missing = set(options['devices']) - set(devices)
+            if missing:
+                raise CommandError(f'Unknown devices: {", ".join(sorted(missing))}')
+            device_ids = list(devices.values())
+
+        self.stdout.write(f'Rebuilding rollups from {timezone.localtime(start)} to {timezone.localtime(end)}...')
+        written = rollups.rebuild(start, end, device_ids=device_ids, chunk_size=options['chunk_size'])
+        summary = ', '.join(f'{count} {resolution}' for resolution, count in written.items())
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt rollups: {summary} buckets.'))
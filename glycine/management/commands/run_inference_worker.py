@@ -0,0 +1,39 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import inference_worker
+
+
+class Command(BaseCommand):
+    help = ('Runs the SoySmart AI inference process that web workers use when '
+            'SOYSMART_INFERENCE_BACKEND is "worker", restarting it if it dies or hangs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=None,
+                            help='Unix socket path or host:port to listen on. Defaults to SOYSMART_WORKER_ADDRESS.')
+        parser.add_argument('--health-interval', type=float, default=None,
+                            help='Seconds between health checks. Defaults to SOYSMART_WORKER_HEALTH_INTERVAL.')
+        parser.add_argument('--max-failures', type=int, default=3,
+                            help='Consecutive failed health checks before the process is restarted.')
+
+    def handle(self, *args, **options):
+        if options['address']:
+            settings.SOYSMART_WORKER_ADDRESS = options['address']
+        supervisor = inference_worker.Supervisor(
+            address=inference_worker.worker_address(),
+            health_interval=options['health_interval'] or getattr(settings, 'SOYSMART_WORKER_HEALTH_INTERVAL', 5),
+            max_failures=options['max_failures'],
+            log=self.stdout.write,
+        )
+
+        def shutdown(signum, frame):
+            supervisor.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(f'Listening on {supervisor.address}')
+        supervisor.run()
+        self.stdout.write(self.style.SUCCESS(f'Inference worker stopped after {supervisor.restarts} restart(s).'))
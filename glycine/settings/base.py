@@ -142,3 +142,159 @@ CHANNEL_LAYERS = {
         },
     },
 }
+
+
+# Sensor ingestion buffer
+# When enabled, readings from every device connection in a worker are
+# collected and written with a single bulk INSERT once SENSOR_BUFFER_MAX_BATCH
+# readings are waiting or SENSOR_BUFFER_FLUSH_INTERVAL seconds have passed.
+# Devices are acknowledged after their reading is committed, unless
+# SENSOR_BUFFER_EARLY_ACK is set, in which case they are acknowledged on receipt
+# with status "accepted" and no reading_id (the write may still fail).
+SENSOR_BUFFER_ENABLED = config('SENSOR_BUFFER_ENABLED', default=False, cast=bool)
+SENSOR_BUFFER_MAX_BATCH = config('SENSOR_BUFFER_MAX_BATCH', default=500, cast=int)
+SENSOR_BUFFER_FLUSH_INTERVAL = config('SENSOR_BUFFER_FLUSH_INTERVAL', default=1.0, cast=float)
+SENSOR_BUFFER_MAX_PENDING = config('SENSOR_BUFFER_MAX_PENDING', default=5000, cast=int)
+SENSOR_BUFFER_EARLY_ACK = config('SENSOR_BUFFER_EARLY_ACK', default=False, cast=bool)
+
+# Replayed sensor batches ("sensor_batch" messages)
+# Readings whose device timestamp is more than SENSOR_BATCH_MAX_CLOCK_SKEW
+# seconds ahead of the server clock, or more than SENSOR_BATCH_MAX_AGE
+# seconds behind it (a device with a reset clock), are rejected. Set
+# SENSOR_BATCH_MAX_AGE to 0 to accept readings of any age.
+SENSOR_BATCH_MAX_SIZE = config('SENSOR_BATCH_MAX_SIZE', default=1000, cast=int)
+SENSOR_BATCH_MAX_CLOCK_SKEW = config('SENSOR_BATCH_MAX_CLOCK_SKEW', default=300, cast=int)
+SENSOR_BATCH_MAX_AGE = config('SENSOR_BATCH_MAX_AGE', default=604800, cast=int)
+
+# Dashboard fan-out
+# Maximum number of updates per second forwarded to dashboards for each
+# device; readings arriving faster are coalesced (latest wins) but still
+# stored. Set to 0 to forward every reading.
+DASHBOARD_MAX_UPDATES_PER_SECOND = config('DASHBOARD_MAX_UPDATES_PER_SECOND', default=1.0, cast=float)
+# Dashboards subscribe to at most DASHBOARD_MAX_SUBSCRIPTIONS devices each.
+# The all-devices summary carries the newest reading of every device that
+# reported, at most once every DASHBOARD_SUMMARY_INTERVAL seconds.
+DASHBOARD_MAX_SUBSCRIPTIONS = config('DASHBOARD_MAX_SUBSCRIPTIONS', default=50, cast=int)
+DASHBOARD_SUMMARY_INTERVAL = config('DASHBOARD_SUMMARY_INTERVAL', default=5.0, cast=float)
+
+# Chart API
+# Series are downsampled to at most CHART_MAX_POINTS points per field
+# (CHART_DEFAULT_POINTS when the request does not ask). Raw readings are used
+# while the range holds at most CHART_MAX_SOURCE_ROWS of them, otherwise the
+# finest rollup that fits. A raw load never reads more than that many rows.
+CHART_DEFAULT_POINTS = config('CHART_DEFAULT_POINTS', default=500, cast=int)
+CHART_MAX_POINTS = config('CHART_MAX_POINTS', default=2000, cast=int)
+CHART_MAX_SOURCE_ROWS = config('CHART_MAX_SOURCE_ROWS', default=20000, cast=int)
+
+# Device presence
+# Connects, disconnects and heartbeats are tracked in memory and written to
+# the database every PRESENCE_SWEEP_INTERVAL seconds. Devices that have not
+# sent anything for DEVICE_STALE_AFTER seconds are marked offline, even if the
+# worker that served them died without running its disconnect handler.
+PRESENCE_SWEEP_INTERVAL = config('PRESENCE_SWEEP_INTERVAL', default=15, cast=int)
+DEVICE_STALE_AFTER = config('DEVICE_STALE_AFTER', default=600, cast=int)
+
+# Cache configuration
+# The local-memory cache is per process: an entry deleted in one worker, such
+# as a device lookup dropped after an edit, survives in the others. To share
+# cached entries between Daphne workers, use the Redis instance already
+# running for channels.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # SoySmart AI predictions: bounded LRU, entries expire after SOYSMART_CACHE_TTL
+    'soysmart': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'soysmart',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('SOYSMART_CACHE_MAX_ENTRIES', default=1000, cast=int),
+        },
+    },
+}
+
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     },
+#     'soysmart': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/2',
+#     },
+# }
+
+# Device lookups on WebSocket connect are cached for DEVICE_CACHE_TTL seconds;
+# unknown UUIDs are remembered for DEVICE_CACHE_NEGATIVE_TTL seconds (0 turns
+# this off). Saving or deleting a device only clears the cache of the process
+# that made the change, so with the local-memory cache above other workers
+# keep serving the old device, or rejecting a newly registered one, until
+# their entry expires. Set DEVICE_CACHE_URL (e.g. redis://127.0.0.1:6379/3)
+# to keep device lookups in a Redis cache shared by all workers instead;
+# invalidation then reaches every worker and the longer TTL is safe.
+DEVICE_CACHE_URL = config('DEVICE_CACHE_URL', default='')
+if DEVICE_CACHE_URL:
+    CACHES['devices'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': DEVICE_CACHE_URL,
+    }
+DEVICE_CACHE_ALIAS = 'devices' if DEVICE_CACHE_URL else 'default'
+DEVICE_CACHE_TTL = config('DEVICE_CACHE_TTL', default=300 if DEVICE_CACHE_URL else 30, cast=int)
+DEVICE_CACHE_NEGATIVE_TTL = config('DEVICE_CACHE_NEGATIVE_TTL', default=10, cast=int)
+
+# Sensor reading retention
+# `python manage.py archive_readings` (run it daily from cron or a systemd
+# timer) moves readings older than SENSOR_RETENTION_DAYS into compressed
+# monthly files under SENSOR_ARCHIVE_DIR and deletes them from the database.
+SENSOR_RETENTION_DAYS = config('SENSOR_RETENTION_DAYS', default=90, cast=int)
+SENSOR_ARCHIVE_DIR = config('SENSOR_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
+# Reading export
+# Exports (the /api/export download and the export_readings command) fetch
+# SENSOR_EXPORT_CHUNK_SIZE rows per query.
+SENSOR_EXPORT_CHUNK_SIZE = config('SENSOR_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# SoySmart AI inference
+# Uploads arriving within SOYSMART_BATCH_WAIT seconds of each other are
+# classified together in one interpreter call of up to SOYSMART_MAX_BATCH_SIZE
+# images. Use `python manage.py benchmark_inference` to pick values.
+SOYSMART_MAX_BATCH_SIZE = config('SOYSMART_MAX_BATCH_SIZE', default=8, cast=int)
+SOYSMART_BATCH_WAIT = config('SOYSMART_BATCH_WAIT', default=0.01, cast=float)
+# Batches run on SOYSMART_INTERPRETERS preallocated interpreters in parallel,
+# each using SOYSMART_NUM_THREADS threads. Every interpreter holds its own
+# tensors sized for SOYSMART_MAX_BATCH_SIZE images, and with the 'local'
+# backend every Daphne process loads its own pool, so model memory is
+# interpreters x processes. Raise it (0 = CPU count / SOYSMART_NUM_THREADS)
+# only for the single 'worker' process or after measuring with
+# `python manage.py benchmark_inference --interpreters 1,2,4`.
+SOYSMART_INTERPRETERS = config('SOYSMART_INTERPRETERS', default=2, cast=int)
+SOYSMART_NUM_THREADS = config('SOYSMART_NUM_THREADS', default=1, cast=int)
+# With SOYSMART_INFERENCE_BACKEND = 'worker', web processes do not load
+# TensorFlow; they send preprocessed images to the process started by
+# `python manage.py run_inference_worker` at SOYSMART_WORKER_ADDRESS (a Unix
+# socket path or host:port). The supervisor health-checks it every
+# SOYSMART_WORKER_HEALTH_INTERVAL seconds and restarts it when needed.
+SOYSMART_INFERENCE_BACKEND = config('SOYSMART_INFERENCE_BACKEND', default='local')
+SOYSMART_WORKER_ADDRESS = config('SOYSMART_WORKER_ADDRESS', default='/tmp/glycine-soysmart.sock')
+SOYSMART_WORKER_TIMEOUT = config('SOYSMART_WORKER_TIMEOUT', default=30, cast=float)
+SOYSMART_WORKER_HEALTH_INTERVAL = config('SOYSMART_WORKER_HEALTH_INTERVAL', default=5, cast=float)
+# Predictions are cached in SOYSMART_CACHE_ALIAS for SOYSMART_CACHE_TTL seconds,
+# keyed by the upload's SHA-256 and the model version. The version defaults to
+# a digest of the model files, so replacing the model invalidates the cache.
+SOYSMART_CACHE_ALIAS = 'soysmart'
+SOYSMART_CACHE_TTL = config('SOYSMART_CACHE_TTL', default=86400, cast=int)
+SOYSMART_MODEL_VERSION = config('SOYSMART_MODEL_VERSION', default='')
+# Uploads larger than SOYSMART_MAX_UPLOAD_BYTES or with more than
+# SOYSMART_MAX_PIXELS pixels are rejected before they are decoded.
+SOYSMART_MAX_UPLOAD_BYTES = config('SOYSMART_MAX_UPLOAD_BYTES', default=10 * 1024 * 1024, cast=int)
+SOYSMART_MAX_PIXELS = config('SOYSMART_MAX_PIXELS', default=40_000_000, cast=int)
+# Load and warm up the model when the ASGI application starts instead of on
+# the first upload. /readyz answers 503 until the model is warm.
+SOYSMART_PRELOAD = config('SOYSMART_PRELOAD', default=False, cast=bool)
+
+# Metrics at /metrics are kept per process. With several Daphne processes,
+# point METRICS_MULTIPROCESS_DIR at a directory they share (on local disk);
+# each process writes a snapshot there every METRICS_WRITE_INTERVAL seconds
+# and /metrics returns the merged view of all of them.
+METRICS_MULTIPROCESS_DIR = config('METRICS_MULTIPROCESS_DIR', default='')
+METRICS_WRITE_INTERVAL = config('METRICS_WRITE_INTERVAL', default=5, cast=float)
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from pathlib import Path
+
+# The benchmark suite must run on a plain machine without a .env file
+os.environ.setdefault('SECRET_KEY', 'benchmark-only-not-a-secret')
+for _name in ('DB_NAME', 'DB_USER', 'DB_PASSWORD'):
+    os.environ.setdefault(_name, '')
+
+from .base import *
+
+# Settings for `python manage.py benchmark_suite`: SQLite and the in-memory
+# channel layer, so the suite needs no MySQL, Redis or network access
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # The suite runs on a throwaway test database; keep even this
+        # placeholder out of the source tree
+        'NAME': Path(tempfile.gettempdir()) / 'glycine-benchmark.sqlite3',
+    }
+}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {'capacity': 10000},
+    }
+}
+
+# Measure the consumers themselves, not the broadcast throttle or buffering
+DASHBOARD_MAX_UPDATES_PER_SECOND = 0
+SENSOR_BUFFER_ENABLED = False
+SOYSMART_INFERENCE_BACKEND = 'local'
+SOYSMART_PRELOAD = False
+METRICS_MULTIPROCESS_DIR = ''
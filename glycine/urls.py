@@ -26,4 +26,8 @@ urlpatterns = [
     path('soysmart-ai', core_views.soysmart_ai, name='soysmart-ai'),
     path('pompa-air', core_views.water_pump, name='water-pump'),
     path('devices', core_views.device, name='device'),
+    path('api/chart-data', core_views.chart_data, name='chart-data'),
+    path('api/export', core_views.export_readings, name='export-readings'),
+    path('metrics', core_views.metrics_view, name='metrics'),
+    path('readyz', core_views.readyz, name='readyz'),
 ]
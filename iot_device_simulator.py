@@ -7,17 +7,28 @@ Versi ini menghasilkan data yang lebih realistis dengan perubahan bertahap.
 import asyncio
 import websockets
 import json
+import os
 import random
 import time
 import argparse
+from collections import Counter, deque
 from datetime import datetime
 
+from core.protocol import SUBPROTOCOL, encode_heartbeat, encode_sensor_data
+from core.stats import percentile
+
 class IoTDeviceSimulator:
-    def __init__(self, device_uuid, server_url="ws://localhost:8000"):
+    def __init__(self, device_uuid, server_url="ws://localhost:8000", binary=False):
         self.device_uuid = device_uuid
         self.server_url = f"{server_url}/ws/device/{device_uuid}/"
         self.websocket = None
         self.is_running = False
+        # Kirim frame biner (glycine.bin.v1) alih-alih JSON
+        self.binary = binary
+        # Statistik ukuran pesan untuk membandingkan kedua encoding
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.json_bytes = 0
         # Menyimpan state data terakhir untuk simulasi yang lebih smooth
         self.last_reading = {
             "air_temperature": 28.0,
@@ -42,8 +53,10 @@ class IoTDeviceSimulator:
     async def connect(self):
         """Koneksi ke WebSocket server"""
         try:
-            self.websocket = await websockets.connect(self.server_url)
-            print(f"✅ Device {self.device_uuid} connected to {self.server_url}")
+            subprotocols = [SUBPROTOCOL] if self.binary else None
+            self.websocket = await websockets.connect(self.server_url, subprotocols=subprotocols)
+            encoding = "binary" if self.binary else "JSON"
+            print(f"✅ Device {self.device_uuid} connected to {self.server_url} ({encoding})")
             return True
         except Exception as e:
             print(f"❌ Failed to connect: {e}")
@@ -54,12 +67,36 @@ class IoTDeviceSimulator:
         if self.websocket:
             await self.websocket.close()
             print(f"🔌 Device {self.device_uuid} disconnected")
+            self.print_traffic_summary()
+
+    def print_traffic_summary(self):
+        """Tampilkan jumlah byte yang dikirim dibandingkan dengan JSON"""
+        if not self.frames_sent:
+            return
+        print(f"📦 Sent {self.frames_sent} frames, {self.bytes_sent} bytes "
+              f"(avg {self.bytes_sent / self.frames_sent:.0f} bytes/frame)")
+        if self.binary:
+            print(f"   Same data as JSON: {self.json_bytes} bytes "
+                  f"({100 * self.bytes_sent / self.json_bytes:.0f}% of JSON size)")
+
+    async def _send_message(self, message):
+        """Kirim pesan sebagai JSON atau frame biner sesuai mode"""
+        text = json.dumps(message)
+        if not self.binary:
+            frame = text
+        elif message["type"] == "sensor_data":
+            frame = encode_sensor_data(message["data"])
+        else:
+            frame = encode_heartbeat()
+
+        await self.websocket.send(frame)
+        self.frames_sent += 1
+        self.bytes_sent += len(frame.encode("utf-8") if isinstance(frame, str) else frame)
+        self.json_bytes += len(text.encode("utf-8"))
+        return len(frame)
     
-    async def send_sensor_data(self):
-        """Kirim data sensor simulasi yang lebih realistis"""
-        if not self.websocket:
-            return False
-        
+    def next_sensor_payload(self):
+        """Pesan sensor_data berikutnya, berubah bertahap dari pembacaan terakhir"""
         # Hasilkan data baru berdasarkan data terakhir
         self.last_reading["air_temperature"] = self._generate_smooth_value(self.last_reading["air_temperature"], 20, 35, 0.5)
         self.last_reading["air_humidity"] = self._generate_smooth_value(self.last_reading["air_humidity"], 40, 90, 2)
@@ -88,10 +125,17 @@ class IoTDeviceSimulator:
                 "battery_level": int(self.last_reading["battery_level"])
             }
         }
-        
+        return sensor_data_payload
+
+    async def send_sensor_data(self):
+        """Kirim data sensor simulasi yang lebih realistis"""
+        if not self.websocket:
+            return False
+
+        sensor_data_payload = self.next_sensor_payload()
         try:
-            await self.websocket.send(json.dumps(sensor_data_payload))
-            print(f"📊 Sent realistic sensor data: T={sensor_data_payload['data']['air_temperature']}°C, SM={sensor_data_payload['data']['soil_moisture']}%")
+            size = await self._send_message(sensor_data_payload)
+            print(f"📊 Sent realistic sensor data: T={sensor_data_payload['data']['air_temperature']}°C, SM={sensor_data_payload['data']['soil_moisture']}% ({size} bytes)")
             return True
         except Exception as e:
             print(f"❌ Failed to send data: {e}")
@@ -108,7 +152,7 @@ class IoTDeviceSimulator:
         }
         
         try:
-            await self.websocket.send(json.dumps(heartbeat))
+            await self._send_message(heartbeat)
             print(f"💓 Heartbeat sent")
             return True
         except Exception as e:
@@ -152,15 +196,275 @@ class IoTDeviceSimulator:
             await self.disconnect()
 
 
+def summarize(seconds):
+    """Percentiles in milliseconds of a list of durations in seconds"""
+    if not seconds:
+        return None
+    values = sorted(seconds)
+    return {
+        "count": len(values),
+        "mean": round(1000 * sum(values) / len(values), 2),
+        "p50": round(1000 * percentile(values, 0.50), 2),
+        "p90": round(1000 * percentile(values, 0.90), 2),
+        "p99": round(1000 * percentile(values, 0.99), 2),
+        "max": round(1000 * values[-1], 2),
+    }
+
+
+def register_devices(uuids):
+    """Daftarkan UUID armada langsung ke database Django (yang sudah ada dilewati)"""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'glycine.settings.development')
+    django.setup()
+    from core.models import Device
+
+    Device.objects.bulk_create(
+        [Device(device_uuid=uuid, name=f"Fleet {uuid}") for uuid in uuids],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+
+class FleetDevice(IoTDeviceSimulator):
+    """Satu perangkat dalam armada: tanpa output per pesan, mencatat latensi ack"""
+
+    def __init__(self, fleet, device_uuid):
+        super().__init__(device_uuid, fleet.server_url, binary=fleet.binary)
+        # Waktu kirim sensor_data yang belum dibalas; server membalas berurutan
+        self.unacked = deque()
+        self.fleet = fleet
+
+    async def connect(self):
+        started = time.perf_counter()
+        try:
+            subprotocols = [SUBPROTOCOL] if self.binary else None
+            self.websocket = await websockets.connect(
+                self.server_url, subprotocols=subprotocols,
+                open_timeout=self.fleet.timeout, ping_interval=None, close_timeout=1,
+            )
+        except websockets.exceptions.InvalidStatus as e:
+            self.fleet.connect_failures[f"http_{e.response.status_code}"] += 1
+            return False
+        except Exception as e:
+            self.fleet.connect_failures[type(e).__name__] += 1
+            return False
+        self.fleet.connect_latencies.append(time.perf_counter() - started)
+        self.fleet.connected += 1
+        return True
+
+    async def send_reading(self):
+        self.unacked.append(time.perf_counter())
+        await self._send_message(self.next_sensor_payload())
+        self.fleet.sent += 1
+
+    async def listen_for_messages(self):
+        fleet = self.fleet
+        try:
+            async for message in self.websocket:
+                received = time.perf_counter()
+                kind = json.loads(message).get("type")
+                if kind in ("data_received", "error") and self.unacked:
+                    sent = self.unacked.popleft()
+                    if kind == "data_received":
+                        fleet.acked += 1
+                        fleet.rtt.append(received - sent)
+                    else:
+                        fleet.errors += 1
+        except websockets.exceptions.ConnectionClosed as e:
+            if not fleet.stopping:
+                fleet.close_codes[str(e.rcvd.code if e.rcvd else 1006)] += 1
+        except Exception as e:
+            fleet.close_codes[type(e).__name__] += 1
+
+    async def run(self, delay):
+        """Sambung setelah ``delay`` detik, lalu kirim data sampai armada berhenti"""
+        fleet = self.fleet
+        await asyncio.sleep(delay)
+        if fleet.stopping or not await self.connect():
+            return
+        listener = asyncio.create_task(self.listen_for_messages())
+        try:
+            # Fase awal acak supaya pengiriman tidak serempak
+            count = await fleet.wait(random.uniform(0, fleet.interval))
+            while not fleet.stopping and not listener.done():
+                for _ in range(count):
+                    await self.send_reading()
+                count = await fleet.wait(fleet.interval * random.uniform(1 - fleet.jitter, 1 + fleet.jitter))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # Beri waktu ack yang masih di jalan sebelum menutup koneksi
+            deadline = time.perf_counter() + fleet.timeout
+            while self.unacked and not listener.done() and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            fleet.lost += len(self.unacked)
+            await self.websocket.close()
+            listener.cancel()
+
+
+class FleetSimulator:
+    """
+    Ribuan perangkat simulasi dalam satu proses asyncio untuk uji kapasitas.
+
+    Koneksi dibuka bertahap selama ``ramp_up`` detik. Setiap perangkat
+    mengirim sensor_data tiap ``interval`` detik (± ``jitter``); setiap
+    ``burst_every`` detik semua perangkat serentak mengirim ``burst_size``
+    pesan berturut-turut. Round-trip dihitung dari pengiriman sensor_data
+    sampai data_received diterima.
+    """
+
+    def __init__(self, server_url, size, prefix="fleet", interval=10.0, jitter=0.1, ramp_up=10.0,
+                 duration=60.0, burst_every=0.0, burst_size=5, binary=False, timeout=10.0):
+        self.server_url = server_url
+        self.uuids = [f"{prefix}-{i:05d}" for i in range(1, size + 1)]
+        self.interval = interval
+        self.jitter = jitter
+        self.ramp_up = ramp_up
+        self.duration = duration
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.binary = binary
+        self.timeout = timeout
+
+        self.stopping = False
+        self.started = None
+        self.elapsed = 0
+        self._burst = asyncio.Event()
+        self.connected = 0
+        self.sent = 0
+        self.acked = 0
+        self.errors = 0
+        self.lost = 0
+        self.rtt = []
+        self.connect_latencies = []
+        self.connect_failures = Counter()
+        self.close_codes = Counter()
+
+    async def wait(self, seconds):
+        """Tunggu giliran kirim berikutnya; hasilnya jumlah pesan yang harus dikirim"""
+        try:
+            await asyncio.wait_for(self._burst.wait(), seconds)
+            return self.burst_size
+        except asyncio.TimeoutError:
+            return 1
+
+    async def trigger_bursts(self):
+        while not self.stopping:
+            await asyncio.sleep(self.burst_every)
+            # Membangunkan semua perangkat yang sedang menunggu sekaligus
+            self._burst.set()
+            self._burst.clear()
+
+    async def report_progress(self):
+        while not self.stopping:
+            await asyncio.sleep(5)
+            elapsed = time.perf_counter() - self.started
+            print(f"⏱️ {elapsed:.0f}s: {self.connected} connected, {self.sent} sent, {self.acked} acked, "
+                  f"{sum(self.connect_failures.values())} failed connections")
+
+    async def run(self):
+        self.started = time.perf_counter()
+        step = self.ramp_up / len(self.uuids)
+        devices = [FleetDevice(self, uuid) for uuid in self.uuids]
+        tasks = [asyncio.create_task(device.run(i * step)) for i, device in enumerate(devices)]
+        helpers = [asyncio.create_task(self.report_progress())]
+        if self.burst_every > 0:
+            helpers.append(asyncio.create_task(self.trigger_bursts()))
+
+        await asyncio.sleep(self.ramp_up + self.duration)
+        self.stopping = True
+        self._burst.set()  # Wake waiting devices so they stop now
+        for helper in helpers:
+            helper.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.elapsed = time.perf_counter() - self.started
+        return self.results()
+
+    def results(self):
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "server": self.server_url,
+            "config": {
+                "devices": len(self.uuids),
+                "interval": self.interval,
+                "jitter": self.jitter,
+                "ramp_up": self.ramp_up,
+                "duration": self.duration,
+                "burst_every": self.burst_every,
+                "burst_size": self.burst_size,
+                "binary": self.binary,
+            },
+            "connected": self.connected,
+            "connect_failures": dict(self.connect_failures),
+            "close_codes": dict(self.close_codes),
+            "sent": self.sent,
+            "acked": self.acked,
+            "errors": self.errors,
+            "unacknowledged": self.lost,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "throughput_per_second": round(self.acked / self.elapsed, 2) if self.elapsed else 0,
+            "rtt_ms": summarize(self.rtt),
+            "connect_ms": summarize(self.connect_latencies),
+        }
+
+
+async def run_fleet(args):
+    fleet = FleetSimulator(
+        args.server, args.fleet, prefix=args.prefix, interval=args.interval, jitter=args.jitter,
+        ramp_up=args.ramp_up, duration=args.duration, burst_every=args.burst_every,
+        burst_size=args.burst_size, binary=args.binary,
+        timeout=args.timeout,
+    )
+    if args.register:
+        await asyncio.to_thread(register_devices, fleet.uuids)
+        print(f"📝 Registered {len(fleet.uuids)} devices ({fleet.uuids[0]} … {fleet.uuids[-1]})")
+
+    print(f"🚜 Starting {args.fleet} devices over {args.ramp_up:.0f}s, running {args.duration:.0f}s")
+    results = await fleet.run()
+
+    rtt = results["rtt_ms"] or {}
+    print(f"✅ {results['connected']}/{args.fleet} connected, {results['sent']} sent, {results['acked']} acked "
+          f"({results['throughput_per_second']}/s), {results['errors']} errors, {results['unacknowledged']} unacknowledged")
+    if rtt:
+        print(f"   RTT ms: p50={rtt['p50']} p90={rtt['p90']} p99={rtt['p99']} max={rtt['max']}")
+    if results["connect_failures"]:
+        print(f"   Connection failures: {results['connect_failures']}")
+    if results["close_codes"]:
+        print(f"   Closed by server: {results['close_codes']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
 async def main():
     parser = argparse.ArgumentParser(description='Realistic IoT Device Simulator')
-    parser.add_argument('device_uuid', help='Device UUID for identification')
+    parser.add_argument('device_uuid', nargs='?', help='Device UUID for identification (not needed with --fleet)')
     parser.add_argument('--server', default='ws://localhost:8000', help='WebSocket server URL')
-    parser.add_argument('--interval', type=int, default=5, help='Data sending interval in seconds (default: 5)')
-    
+    parser.add_argument('--interval', type=float, default=5, help='Data sending interval in seconds (default: 5)')
+    parser.add_argument('--binary', action='store_true', help='Send compact binary frames (glycine.bin.v1) instead of JSON')
+
+    fleet = parser.add_argument_group('fleet mode')
+    fleet.add_argument('--fleet', type=int, metavar='N', help='Simulate N devices in this process')
+    fleet.add_argument('--prefix', default='fleet', help='Fleet device UUIDs are PREFIX-00001, PREFIX-00002, ...')
+    fleet.add_argument('--register', action='store_true', help='Register the fleet UUIDs in the Django database first')
+    fleet.add_argument('--ramp-up', type=float, default=10, help='Seconds over which connections are opened')
+    fleet.add_argument('--duration', type=float, default=60, help='Seconds to keep sending after the ramp-up')
+    fleet.add_argument('--jitter', type=float, default=0.1, help='Random variation of the interval (0.1 = ±10%%)')
+    fleet.add_argument('--burst-every', type=float, default=0, help='Seconds between bursts (0 = no bursts)')
+    fleet.add_argument('--burst-size', type=int, default=5, help='Messages every device sends back-to-back in a burst')
+    fleet.add_argument('--timeout', type=float, default=10, help='Connect and final acknowledgement timeout in seconds')
+    fleet.add_argument('--output', help='Write the results as JSON to this file')
+
     args = parser.parse_args()
-    
-    device = IoTDeviceSimulator(args.device_uuid, args.server)
+
+    if args.fleet:
+        await run_fleet(args)
+        return
+    if not args.device_uuid:
+        parser.error('device_uuid is required unless --fleet is given')
+
+    device = IoTDeviceSimulator(args.device_uuid, args.server, binary=args.binary)
     await device.run_simulation(data_interval=args.interval)
 
 if __name__ == "__main__":
@@ -187,5 +491,13 @@ How to use:
    Or send a single reading:
    python iot_device_simulator.py device-001 --single
 
+   Or send compact binary frames instead of JSON (prints the size of both):
+   python iot_device_simulator.py device-001 --binary
+
+   Or simulate a fleet of 2000 devices for capacity planning, registering
+   fleet-00001 … fleet-02000 first and writing the results as JSON:
+   python iot_device_simulator.py --fleet 2000 --register --ramp-up 60 --duration 300 \
+       --interval 10 --burst-every 60 --burst-size 5 --output fleet-2000.json
+
 4. View the data on the dashboard: http://localhost:8000/dashboard
 """
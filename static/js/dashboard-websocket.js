@@ -1,6 +1,11 @@
 /**
  * Dashboard WebSocket Client
  * Manages WebSocket connection to dashboard and displays real-time data
+ *
+ * Readings are opt-in: the server only sends "sensor_update" messages for
+ * devices this socket subscribed to with subscribeDevices(), and sends the
+ * periodic "devices_summary" of all devices once subscribed to the summary
+ * (done on connect). Subscriptions are sent again after a reconnect.
  */
 
 class DashboardWebSocket {
@@ -10,6 +15,8 @@ class DashboardWebSocket {
 		this.reconnectAttempts = 0;
 		this.maxReconnectAttempts = 5;
 		this.isConnected = false;
+		// UUIDs of the devices whose every reading should be pushed
+		this.subscribedDevices = new Set();
 
 		// DOM elements
 		this.statusIndicator = document.getElementById("connection-status");
@@ -46,6 +53,12 @@ class DashboardWebSocket {
 
 			// Request initial data
 			this.requestOnlineDevices();
+
+			// Device cards only need the periodic all-devices summary
+			this.sendMessage({ type: "subscribe", summary: true });
+			if (this.subscribedDevices.size) {
+				this.sendMessage({ type: "subscribe", devices: [...this.subscribedDevices] });
+			}
 		};
 
 		this.socket.onmessage = (event) => {
@@ -83,10 +96,15 @@ class DashboardWebSocket {
 				this.updateOnlineDevices(data.devices);
 				break;
 
+			// Only sent for devices passed to subscribeDevices()
 			case "sensor_update":
 				this.handleSensorUpdate(data);
 				break;
 
+			case "devices_summary":
+				data.devices.forEach((device) => this.updateDeviceCard(device.device_uuid, device));
+				break;
+
 			case "latest_readings":
 				this.updateLatestReadings(data.device_uuid, data.readings);
 				break;
@@ -262,6 +280,17 @@ class DashboardWebSocket {
 		}
 	}
 
+	subscribeDevices(deviceUuids) {
+		// Receive a sensor_update for every reading of these devices
+		deviceUuids.forEach((uuid) => this.subscribedDevices.add(uuid));
+		this.sendMessage({ type: "subscribe", devices: deviceUuids });
+	}
+
+	unsubscribeDevices(deviceUuids) {
+		deviceUuids.forEach((uuid) => this.subscribedDevices.delete(uuid));
+		this.sendMessage({ type: "unsubscribe", devices: deviceUuids });
+	}
+
 	viewDeviceDetails(deviceUuid) {
 		this.sendMessage({
 			type: "get_latest_readings",